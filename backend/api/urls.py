@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from documents.views import DocumentViewSet
+from documents.views import DocumentViewSet, UploadSessionViewSet
 from knowledge_graph import views as kg_views
 from . import views
 
@@ -8,6 +8,7 @@ from . import views
 router = DefaultRouter()
 # 注册文档相关路由
 router.register(r'documents', DocumentViewSet)
+router.register(r'uploads', UploadSessionViewSet, basename='upload')
 # 注册知识图谱实体与关系 CRUD 路由
 router.register(r'entities', kg_views.EntityViewSet)
 router.register(r'relationships', kg_views.RelationshipViewSet)
@@ -21,6 +22,7 @@ urlpatterns = [
     path('entity-subgraph/<int:entity_id>/', kg_views.entity_subgraph, name='entity-subgraph'),
     path('kg/teacher/<str:teacher_name>/', kg_views.knowledge_graph_teacher, name='knowledge_graph_teacher'),
     path('kg/search/', kg_views.knowledge_graph_search, name='knowledge_graph_search'),
+    path('kg/sync-status/', kg_views.neo4j_sync_status, name='neo4j_sync_status'),
     
     # AI 助手功能路由
     path('ai/ask/', views.ask_ai_assistant, name='ask_ai_assistant'),
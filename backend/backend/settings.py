@@ -11,6 +11,53 @@ if env_path.exists():
 # 从环境变量获取 DeepSeek API 密钥
 DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY')
 
+# 文档处理时同时进行的 LLM 请求数上限
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', 4))
+# 文档调度器：同时处理的文档数、所有文档共享的 LLM 在途请求上限、SQLite 并发写事务上限
+DOCUMENT_MAX_CONCURRENT_JOBS = int(os.getenv('DOCUMENT_MAX_CONCURRENT_JOBS', 3))
+LLM_MAX_INFLIGHT = int(os.getenv('LLM_MAX_INFLIGHT', 4))
+SQLITE_MAX_WRITERS = int(os.getenv('SQLITE_MAX_WRITERS', 1))
+# 调度任务的超时时间（秒），需覆盖一整批文档的处理时长
+DOCUMENT_SCHEDULER_TIMEOUT = int(os.getenv('DOCUMENT_SCHEDULER_TIMEOUT', 6 * 3600))
+# 单个文档的默认处理预算：最长处理时间（秒）与 LLM 调用次数，0 表示不限；可在文档上单独覆盖
+DOCUMENT_MAX_SECONDS = int(os.getenv('DOCUMENT_MAX_SECONDS', 2 * 3600))
+DOCUMENT_MAX_LLM_CALLS = int(os.getenv('DOCUMENT_MAX_LLM_CALLS', 0))
+# 多位导师合并为一次提取请求时，每批文本的字符数上限与行数上限（行数为 1 时不合并）
+LLM_BATCH_CHARS = int(os.getenv('LLM_BATCH_CHARS', 3000))
+LLM_BATCH_MAX_ROWS = int(os.getenv('LLM_BATCH_MAX_ROWS', 8))
+# 长简介分段提取：超过该字符数的简介按句子切分为多段并行提取，相邻两段重叠的字符数
+LLM_CHUNK_CHARS = int(os.getenv('LLM_CHUNK_CHARS', 1500))
+LLM_CHUNK_OVERLAP = int(os.getenv('LLM_CHUNK_OVERLAP', 200))
+# 职称、院系、毕业院校先用规则与机构词典预提取，只把剩余类型交给 LLM（0 关闭）
+LLM_RULE_PREEXTRACT = os.getenv('LLM_RULE_PREEXTRACT', '1') == '1'
+# 文本中没有线索词的非结构化类型（研究方向、课程名称等）直接判为空、不询问 LLM（1 开启）；会损失召回，默认关闭
+LLM_RULE_SKIP_UNCUED = os.getenv('LLM_RULE_SKIP_UNCUED', '0') == '1'
+# PDF 文本解析的并行子进程数（按页段分发）
+PDF_READ_WORKERS = int(os.getenv('PDF_READ_WORKERS', min(4, os.cpu_count() or 1)))
+# Neo4j 同步：后台线程每次从 outbox 取出并在一个 Neo4j 事务中应用的变更条数（UNWIND 批量语句）
+NEO4J_SYNC_BATCH_SIZE = int(os.getenv('NEO4J_SYNC_BATCH_SIZE', 1000))
+# Neo4j 同步失败后的重试间隔上限（秒），间隔从 1 秒起逐次翻倍
+NEO4J_SYNC_RETRY_MAX_SECONDS = int(os.getenv('NEO4J_SYNC_RETRY_MAX_SECONDS', 60))
+# 单条变更因非连接类错误（例如违反唯一约束）应用失败达到该次数后移入死信，不再阻塞之后的变更
+NEO4J_SYNC_MAX_ATTEMPTS = int(os.getenv('NEO4J_SYNC_MAX_ATTEMPTS', 5))
+# 首次连接 Neo4j 时自动创建缺失的索引与唯一约束（见 knowledge_graph/neo4j_schema.py）
+NEO4J_ENSURE_SCHEMA = os.getenv('NEO4J_ENSURE_SCHEMA', '1') == '1'
+# Neo4j 连接池：最大连接数、获取连接的等待秒数、连接最长存活秒数、建立连接的超时秒数
+NEO4J_MAX_CONNECTION_POOL_SIZE = int(os.getenv('NEO4J_MAX_CONNECTION_POOL_SIZE', 100))
+NEO4J_CONNECTION_ACQUISITION_TIMEOUT = float(os.getenv('NEO4J_CONNECTION_ACQUISITION_TIMEOUT', 60))
+NEO4J_MAX_CONNECTION_LIFETIME = float(os.getenv('NEO4J_MAX_CONNECTION_LIFETIME', 3600))
+NEO4J_CONNECTION_TIMEOUT = float(os.getenv('NEO4J_CONNECTION_TIMEOUT', 30))
+# Neo4j 托管事务遇到暂时性错误时自动重试的总秒数
+NEO4J_MAX_TRANSACTION_RETRY_TIME = float(os.getenv('NEO4J_MAX_TRANSACTION_RETRY_TIME', 30))
+# 读取 Neo4j 查询结果时每次从服务端拉取的记录数
+NEO4J_FETCH_SIZE = int(os.getenv('NEO4J_FETCH_SIZE', 1000))
+# Ollama 服务地址
+OLLAMA_HOST = os.getenv('OLLAMA_HOST', 'http://localhost:11434')
+# 单次 Ollama 请求的超时秒数，超时按提取失败处理（请求卡住时不会一直占用 LLM 并发槽位）
+LLM_REQUEST_TIMEOUT = int(os.getenv('LLM_REQUEST_TIMEOUT', 300))
+# LLM 提取结果缓存的条数上限（按最近使用时间淘汰）
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', 50000))
+
 # 安全设置
 SECRET_KEY = os.getenv('DJANGO_SECRET_KEY', 'django-insecure-your-random-secret-key-here-make-it-long')
 DEBUG = True
@@ -112,6 +159,14 @@ if FRONTEND_DIR.exists():
 # 媒体文件
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# 上传文件一律流式写入临时文件并同时计算内容哈希（用于重复上传检测）
+FILE_UPLOAD_HANDLERS = ['documents.uploads.HashingFileUploadHandler']
+# 重复上传（与已处理文档内容相同）时默认是否直接复用已存储的文件，不再保存新副本；可在上传时用 share_file 覆盖
+DOCUMENT_UPLOAD_SHARE_FILES = os.getenv('DOCUMENT_UPLOAD_SHARE_FILES', '0') == '1'
+# 分块上传：默认分块大小、文件大小上限（分块直接写入存储，不占用进程内存），未完成的上传会话保留时长（小时）
+DOCUMENT_UPLOAD_CHUNK_SIZE = int(os.getenv('DOCUMENT_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+DOCUMENT_MAX_CHUNKED_UPLOAD_SIZE = int(os.getenv('DOCUMENT_MAX_CHUNKED_UPLOAD_SIZE', 2 * 1024 * 1024 * 1024))
+DOCUMENT_UPLOAD_SESSION_HOURS = int(os.getenv('DOCUMENT_UPLOAD_SESSION_HOURS', 24))
 
 # 国际化设置
 LANGUAGE_CODE = 'zh-hans'
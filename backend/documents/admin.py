@@ -1,45 +1,134 @@
 from django.contrib import admin
-from django.utils import timezone
 from django.contrib import messages
 from django.http import StreamingHttpResponse
-from .models import Document
+from django.utils.html import format_html, format_html_join
+from .models import Document, ExtractionCache
 
 @admin.register(Document)
 class DocumentAdmin(admin.ModelAdmin):
-    list_display = ['title', 'file_type', 'uploader', 'upload_time', 'status']
+    list_display = ['title', 'file_type', 'uploader', 'upload_time', 'status', 'priority']
+    list_editable = ['priority']
     list_filter = ['file_type', 'status', 'upload_time']
     search_fields = ['title', 'content']
-    actions = ['process_selected_documents']
+    actions = ['process_selected_documents', 'reprocess_selected_documents', 'preview_selected_documents', 'apply_selected_previews', 'cancel_selected_documents']
     
     # 状态字段设为只读，不应由管理员手动修改
-    readonly_fields = ['status', 'processed_data', 'processing_start_time', 'processing_end_time']
+    readonly_fields = ['status', 'cancel_requested', 'stage_breakdown', 'processed_data', 'processing_start_time', 'processing_end_time', 'checkpoint_row']
     # 移除 file_size 显示 (如果之前有显示的话，但标准 Admin 中如果没有 fieldsets 就会显示所有非 exclude 的字段)
     
-    def process_selected_documents(self, request, queryset):
-        """处理选中的文档（使用 Django-Q 后台处理）"""
-        from django_q.tasks import async_task
-        from .services import process_document_task
-
-        # 只处理选中的第一个文件
-        if queryset.count() > 1:
-            self.message_user(request, "为了保证系统性能，每次请只选择一个文档进行处理。", messages.WARNING)
+    def stage_breakdown(self, obj):
+        """以表格展示 processed_data 中的分阶段耗时与计数"""
+        metrics = (obj.processed_data or {}).get('metrics')
+        if not metrics:
+            return "-"
+        rows = format_html_join(
+            '',
+            '<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>',
+            (
+                (stage, data['count'], data['total_seconds'], data['p50'], data['p95'], data['max'])
+                for stage, data in sorted(metrics.get('stages', {}).items(), key=lambda kv: -kv[1]['total_seconds'])
+            )
+        )
+        counters = format_html_join(', ', '{}: {}', sorted(metrics.get('counters', {}).items()))
+        return format_html(
+            '<table><tr><th>阶段</th><th>次数</th><th>总耗时(s)</th><th>p50</th><th>p95</th><th>最大</th></tr>{}</table><p>{}</p>',
+            rows, counters
+        )
+
+    stage_breakdown.short_description = "分阶段耗时"
+
+    def process_selected_documents(self, request, queryset, kind='process'):
+        """将选中的文档加入处理队列（按优先级调度，使用 Django-Q 后台处理）"""
+        from .scheduler import enqueue_documents
+        from .services import DocumentProcessor
+
+        # 仅处理支持的文件类型（Excel / PDF / Word .docx）
+        documents = [doc for doc in queryset if DocumentProcessor.supports(doc)]
+        skipped = queryset.count() - len(documents)
+        if skipped:
+            self.message_user(request, f"已忽略 {skipped} 个不支持的文件（仅支持 xlsx / xls / pdf / docx）。", messages.WARNING)
+        if not documents:
             return
 
-        document = queryset.first()
+        queued, task_id = enqueue_documents(documents, kind=kind)
+        if not queued:
+            self.message_user(request, "所选文档已在队列或处理中。", messages.WARNING)
+            return
+
+        self.message_user(
+            request,
+            f"已将 {queued} 个文档加入处理队列，按优先级依次处理 (Task ID: {task_id})。请确保已启动 qcluster。",
+            messages.SUCCESS
+        )
+
+    process_selected_documents.short_description = "处理选中的文档 (加入后台任务队列)"
 
-        # 仅处理Excel文件
-        if document.file_type != 'excel' and not document.file.name.endswith(('.xlsx', '.xls')):
-            self.message_user(request, "仅支持处理 Excel 文件。", messages.ERROR)
+    def reprocess_selected_documents(self, request, queryset):
+        """强制重新处理：不跳过已按相同内容入库过的行，全部重新提取"""
+        self.process_selected_documents(request, queryset, kind='reprocess')
+
+    reprocess_selected_documents.short_description = "强制重新处理选中的文档 (不跳过已入库的行)"
+
+    def preview_selected_documents(self, request, queryset):
+        """预览选中文档将产生的变更（只读取和提取，不写入图谱），结果见“处理数据”中的 diff"""
+        from .scheduler import enqueue_documents
+        from .services import DocumentProcessor
+
+        # 与处理相同经过调度器排队，受同时处理文档数与 LLM / 写入槽位的限制
+        documents = [doc for doc in queryset if DocumentProcessor.supports(doc)]
+        queued, _ = enqueue_documents(documents, kind='preview') if documents else (0, None)
+        if not queued:
+            self.message_user(request, "没有可预览的文档（仅支持未在排队或处理中的 Excel / PDF / Word 文件）。", messages.WARNING)
             return
+        self.message_user(request, f"已将 {queued} 个文档的变更预览加入处理队列，完成后状态为“已预览”。", messages.SUCCESS)
+
+    preview_selected_documents.short_description = "预览选中文档的变更 (dry-run)"
+
+    def apply_selected_previews(self, request, queryset):
+        """应用已预览文档的变更，复用预览时的提取结果，不再调用 LLM"""
+        from .scheduler import enqueue_documents
+
+        documents = list(queryset.filter(status='previewed'))
+        queued, _ = enqueue_documents(documents, kind='apply') if documents else (0, None)
+        if not queued:
+            self.message_user(request, "所选文档中没有“已预览”状态的文档。", messages.WARNING)
+            return
+        self.message_user(request, f"已将 {queued} 个文档的变更应用加入处理队列。", messages.SUCCESS)
+
+    apply_selected_previews.short_description = "应用选中文档的预览变更"
+
+    def cancel_selected_documents(self, request, queryset):
+        """取消选中文档的处理：排队中的直接取消，处理中的在当前行完成后停止，已处理的数据保留"""
+        from .scheduler import cancel_documents
+
+        cancelled, requested = cancel_documents(queryset)
+        if not cancelled and not requested:
+            self.message_user(request, "所选文档均不在排队或处理中。", messages.WARNING)
+            return
+
+        self.message_user(
+            request,
+            f"已取消 {cancelled} 个排队中的文档，已通知 {requested} 个处理中的文档停止。",
+            messages.SUCCESS
+        )
+
+    cancel_selected_documents.short_description = "取消选中文档的处理"
+
+
+@admin.register(ExtractionCache)
+class ExtractionCacheAdmin(admin.ModelAdmin):
+    list_display = ['teacher_name', 'model_name', 'prompt_version', 'created_at', 'last_used_at']
+    list_filter = ['model_name', 'prompt_version']
+    search_fields = ['teacher_name', 'key']
+    readonly_fields = ['key', 'model_name', 'prompt_version', 'teacher_name', 'result', 'created_at', 'last_used_at']
+    actions = ['invalidate_selected_models']
 
-        # 更新状态
-        document.status = 'processing'
-        document.processing_start_time = timezone.now()
-        document.save()
+    def invalidate_selected_models(self, request, queryset):
+        """清除所选条目对应模型的全部缓存"""
+        from services.llm_cache import LLMCache
 
-        # 提交到 Django-Q 任务队列
-        task_id = async_task(process_document_task, document.id)
-        
-        self.message_user(request, f"文档 '{document.title}' 已加入处理队列 (Task ID: {task_id})。请确保已启动 qcluster。", messages.SUCCESS)
+        model_names = set(queryset.values_list('model_name', flat=True))
+        deleted = sum(LLMCache.invalidate(model_name) for model_name in model_names)
+        self.message_user(request, f"已清除模型 {', '.join(sorted(model_names))} 的 {deleted} 条提取缓存。", messages.SUCCESS)
 
-    process_selected_documents.short_description = "处理选中的文档 (后台任务队列)"
\ No newline at end of file
+    invalidate_selected_models.short_description = "清除所选模型的全部提取缓存"
@@ -0,0 +1,100 @@
+import io
+import posixpath
+from openpyxl import load_workbook
+from openpyxl.drawing.spreadsheet_drawing import SpreadsheetDrawing
+from openpyxl.packaging.relationship import get_dependents, get_rels_path
+from openpyxl.xml.constants import IMAGE_NS
+from openpyxl.xml.functions import fromstring
+
+
+# 可直接写出的图片格式，其余格式转换为 PNG（与 openpyxl Image._data 的行为一致）
+RAW_IMAGE_FORMATS = ('.png', '.jpg', '.jpeg', '.gif')
+
+
+def read_archive_image(archive, target):
+    """从 .xlsx 压缩包中读取图片内容，非常见格式转换为 PNG"""
+    data = archive.read(target)
+    if posixpath.splitext(target)[1].lower() in RAW_IMAGE_FORMATS:
+        return data
+
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.open(io.BytesIO(data)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class ExcelWorkbook:
+    """
+    单次打开 .xlsx 工作簿：
+    - 文本行通过 openpyxl 只读模式流式读取
+    - 图片只从同一压缩包解析锚点，建立 {行号: 图片路径} 索引，内容在写入时才按需读取
+    """
+
+    def __init__(self, file_path, image_column=1):
+        self.wb = load_workbook(file_path, read_only=True, data_only=True)
+        self.ws = self.wb.active
+        self._archive = self.wb._archive
+        self.image_anchors = {}
+        try:
+            self.image_anchors = self._index_images(image_column)
+        except Exception as e:
+            print(f"Warning: Could not extract images from excel: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def close(self):
+        self.wb.close()
+
+    def iter_rows(self):
+        """逐行产出单元格值元组（第一行为表头）"""
+        return self.ws.iter_rows(values_only=True)
+
+    def data_row_count(self):
+        """按工作表 dimension 估算的数据行数（不含表头），文件未记录 dimension 时返回 None"""
+        max_row = self.ws.max_row
+        return max(max_row - 1, 0) if max_row else None
+
+    def read_image(self, row_idx):
+        """读取指定行的图片内容，没有图片时返回 None"""
+        target = self.image_anchors.get(row_idx)
+        if not target:
+            return None
+        return read_archive_image(self._archive, target)
+
+    def image_crc(self, row_idx):
+        """指定行图片的 CRC32（取自压缩包目录，不读取图片内容），没有图片时返回 None"""
+        target = self.image_anchors.get(row_idx)
+        if not target:
+            return None
+        return self._archive.getinfo(target).CRC
+
+    def _index_images(self, image_column):
+        """解析活动工作表的 drawing 关系，返回 {行号(从1开始): 图片在压缩包中的路径}"""
+        namelist = set(self._archive.namelist())
+        sheet_rels_path = get_rels_path(self.ws._worksheet_path)
+        if sheet_rels_path not in namelist:
+            return {}
+
+        anchors = {}
+        sheet_rels = get_dependents(self._archive, sheet_rels_path)
+        for drawing_rel in sheet_rels.find(SpreadsheetDrawing._rel_type):
+            drawing_path = drawing_rel.target
+            drawing_rels_path = get_rels_path(drawing_path)
+            if drawing_rels_path not in namelist:
+                continue
+
+            drawing = SpreadsheetDrawing.from_tree(fromstring(self._archive.read(drawing_path)))
+            deps = get_dependents(self._archive, drawing_rels_path)
+            for blip in drawing._blip_rels:
+                start = getattr(blip.anchor, '_from', None)
+                dep = deps.get(blip.embed)
+                if start is None or dep is None or dep.Type != IMAGE_NS:
+                    continue
+                # anchor._from.row / col 是 0-indexed 的，所以行号 = value + 1
+                if start.col + 1 == image_column:
+                    anchors[start.row + 1] = dep.target
+        return anchors
@@ -0,0 +1,51 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from services.entity_classifier import DEFAULT_TYPE_KEYWORDS, EntityTypeClassifier
+
+
+def legacy_infer(tail, relation):
+    """原 _save_triple 中的推断方式：每个三元组 lower() 后对关键词表做线性扫描"""
+    tgt_type = 'event'
+    tail_lower = tail.lower()
+    if any(k in tail_lower for k in DEFAULT_TYPE_KEYWORDS['organization']):
+        tgt_type = 'organization'
+    elif any(k in tail_lower for k in DEFAULT_TYPE_KEYWORDS['location']):
+        tgt_type = 'location'
+    elif relation in ['主讲', '研究']:
+        tgt_type = 'subject'
+    return tgt_type
+
+
+class Command(BaseCommand):
+    help = "对比线性关键词扫描与编译后的分类器对三元组尾实体的推断耗时"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--triples', type=int, default=200000, help="合成三元组数量")
+        parser.add_argument('--distinct', type=int, default=5000, help="不同尾实体字符串的数量")
+
+    def handle(self, *args, **options):
+        random.seed(0)
+        words = ['计算机', '科学', '技术', '人工智能', '地质', '成都', '理工', '国家', '重点', '优秀', '教师', '数据结构']
+        suffixes = ['大学', '学院', '实验室', '中心', '省', '市', '', '', '', '']
+        relations = ['属于', '研究', '主讲', '毕业于', '获得', '负责']
+        tails = [
+            ''.join(random.choices(words, k=random.randint(1, 4))) + random.choice(suffixes)
+            for _ in range(options['distinct'])
+        ]
+        pairs = [(random.choice(tails), random.choice(relations)) for _ in range(options['triples'])]
+
+        started = time.perf_counter()
+        expected = [legacy_infer(tail, relation) for tail, relation in pairs]
+        legacy_seconds = time.perf_counter() - started
+
+        classifier = EntityTypeClassifier(DEFAULT_TYPE_KEYWORDS, {'主讲': 'subject', '研究': 'subject'})
+        started = time.perf_counter()
+        actual = classifier.classify_many(pairs)
+        compiled_seconds = time.perf_counter() - started
+
+        mismatches = sum(1 for a, b in zip(expected, actual) if a != b)
+        count = len(pairs)
+        self.stdout.write(f"线性扫描: {legacy_seconds:.3f}s ({legacy_seconds / count * 1e6:.2f} µs/三元组)")
+        self.stdout.write(f"编译分类器: {compiled_seconds:.3f}s ({compiled_seconds / count * 1e6:.2f} µs/三元组)")
+        self.stdout.write(f"结果不一致: {mismatches}")
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand
+from documents.excel_reader import ExcelWorkbook
+from documents.services import DocumentProcessor
+
+
+class Command(BaseCommand):
+    help = "对比 pandas 整表读取与 openpyxl 流式读取在合成 Excel 上的耗时与峰值内存"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000], help="合成表格的行数")
+        parser.add_argument('--intro-length', type=int, default=800, help="每行介绍文本的字符数")
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for rows in options['rows']:
+                path = os.path.join(tmp_dir, f"synthetic_{rows}.xlsx")
+                self.stdout.write(f"生成 {rows} 行合成表格...")
+                self._write_workbook(path, rows, options['intro_length'])
+                size_mb = os.path.getsize(path) / 1024 / 1024
+
+                for label, reader in [
+                    ("pandas", lambda: DocumentProcessor._read_excel(path)),
+                    ("openpyxl 流式", lambda: self._stream(path)),
+                ]:
+                    seconds, peak_mb, count = self._measure(reader)
+                    self.stdout.write(
+                        f"  [{rows} 行, {size_mb:.1f} MB] {label}: {seconds:.2f}s, "
+                        f"峰值内存 {peak_mb:.1f} MB, 读取 {count} 行"
+                    )
+
+    @staticmethod
+    def _stream(path):
+        with ExcelWorkbook(path) as workbook:
+            yield from DocumentProcessor._iter_excel_rows(workbook)
+
+    @staticmethod
+    def _write_workbook(path, rows, intro_length):
+        """用 write_only 模式生成合成表格，避免生成过程本身占用大量内存"""
+        from openpyxl import Workbook
+
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.append(["导师姓名", "个人介绍"])
+        filler = "研究方向为人工智能与知识图谱，主讲数据结构。" * (intro_length // 20 + 1)
+        for i in range(rows):
+            ws.append([f"教师{i}", f"教师{i}，计算机学院教授。{filler[:intro_length]}"])
+        wb.save(path)
+
+    @staticmethod
+    def _measure(reader):
+        """逐行消费读取结果（不保留），返回 (耗时, 峰值内存MB, 行数)"""
+        tracemalloc.start()
+        started = time.perf_counter()
+        count = 0
+        for _ in reader():
+            count += 1
+        seconds = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return seconds, peak / 1024 / 1024, count
@@ -0,0 +1,100 @@
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from documents.services import DocumentProcessor
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """模拟 Ollama /api/generate：耗时 = 固定开销 + 按 Prompt 长度计的预填充时间"""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        prompt = body.get("prompt", "")
+        server = self.server
+        with server.lock:
+            server.calls += 1
+        time.sleep(server.base_latency + len(prompt) * server.per_char_latency)
+
+        sections = re.findall(r"^【导师：(.+?)】\n(.*?)(?=\n【导师：|\n请输出)", prompt, re.S | re.M)
+        if sections:
+            result = {name: self._extract(name, text) for name, text in sections}
+        else:
+            name = re.search(r"已知导师姓名：(.*)", prompt).group(1).strip()
+            result = self._extract(name, prompt)
+
+        payload = json.dumps({
+            "model": body.get("model"),
+            "created_at": "2024-01-01T00:00:00Z",
+            "response": json.dumps(result, ensure_ascii=False),
+            "done": True,
+        }, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    @staticmethod
+    def _extract(name, text):
+        departments = re.findall(r"(\w+学院)", text)
+        return {"教师姓名": [name], "院系": departments[:1], "职称": ["教授"] if "教授" in text else []}
+
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = "在本地模拟 LLM 服务上对比逐条提取与多人批量提取的调用次数和耗时"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200, help="合成导师数量")
+        parser.add_argument('--intro-length', type=int, default=200, help="每位导师介绍文本的字符数")
+        parser.add_argument('--base-latency', type=float, default=0.05, help="每次调用的固定开销（秒）")
+        parser.add_argument('--per-char-latency', type=float, default=0.00002, help="每个 Prompt 字符的预填充耗时（秒）")
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubOllamaHandler)
+        server.lock = threading.Lock()
+        server.base_latency = options['base_latency']
+        server.per_char_latency = options['per_char_latency']
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        rows = self._synthetic_rows(options['rows'], options['intro_length'])
+        config = DocumentProcessor.CONFIG
+        original = (config['llm_batch_max_rows'], config['use_cache'])
+        config['use_cache'] = False
+        try:
+            with override_settings(OLLAMA_HOST=f"http://127.0.0.1:{server.server_port}"):
+                for label, max_rows in [("逐条提取", 1), ("批量提取", original[0])]:
+                    config['llm_batch_max_rows'] = max_rows
+                    server.calls = 0
+                    stats = {}
+                    started = time.perf_counter()
+                    extracted = sum(1 for _, entities in DocumentProcessor._extract_all(rows, stats) if entities)
+                    seconds = time.perf_counter() - started
+                    self.stdout.write(
+                        f"{label}（每批最多 {max_rows} 人）: LLM 调用 {server.calls} 次, 耗时 {seconds:.2f}s, "
+                        f"成功提取 {extracted}/{len(rows)} 行"
+                    )
+        finally:
+            config['llm_batch_max_rows'], config['use_cache'] = original
+            server.shutdown()
+
+    @staticmethod
+    def _synthetic_rows(count, intro_length):
+        filler = "长期从事教学科研工作，主讲多门本科生与研究生课程。" * (intro_length // 24 + 1)
+        rows = []
+        for i in range(count):
+            name = f"教师{i}"
+            intro = f"{name}，第{i % 9}学院教授。{filler[:intro_length]}"
+            rows.append({
+                "teacher_name": name,
+                "full_text": f"导师姓名：{name}；个人介绍：{intro}",
+                "intro": intro,
+                "excel_row_index": i + 2,
+            })
+        return rows
@@ -0,0 +1,98 @@
+import time
+from itertools import islice
+from django.core.management.base import BaseCommand, CommandError
+from documents.excel_reader import ExcelWorkbook
+from documents.services import DocumentProcessor
+from services.llm_bridge import LLMBridge
+from services.llm_cache import LLMCache
+from services.rule_extractor import RuleExtractor
+
+
+class Command(BaseCommand):
+    help = "在样例 Excel 上评估规则预提取：可省去的 LLM 调用比例，以及规则结果相对 LLM 输出的精确率"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', required=True, help="样例 Excel 文件路径（需包含“姓名”和“介绍”列）")
+        parser.add_argument('--limit', type=int, default=200, help="最多评估的行数")
+        parser.add_argument('--call-llm', action='store_true', help="提取缓存中没有参考结果时实际调用 LLM（否则该行不计入精确率）")
+
+    def handle(self, *args, **options):
+        entity_types = DocumentProcessor.CONFIG['entity_types']
+        rows = [item for item in islice(self._iter_rows(options['file']), options['limit']) if len(item['full_text']) > 10]
+        if not rows:
+            raise CommandError("样例文件中没有可提取的行")
+
+        rules = RuleExtractor.from_db()
+        started = time.perf_counter()
+        results = [rules.extract(item['full_text'], item['teacher_name'], entity_types) for item in rows]
+        rule_seconds = time.perf_counter() - started
+
+        references = self._references(rows, entity_types, options['call_llm'])
+        rule_only = sum(1 for _, remaining in results if not remaining)
+        self.stdout.write(
+            f"评估 {len(rows)} 行（机构词典 {len(rules.organizations)} 条），规则耗时 {rule_seconds / len(rows) * 1e6:.0f} µs/行"
+        )
+        self.stdout.write(
+            f"完全由规则确定、无需 LLM 的行: {rule_only} ({rule_only / len(rows):.1%})，"
+            f"剩余行的请求平均只需提取 {self._mean_remaining(results):.1f}/{len(entity_types)} 个类型"
+        )
+        self.stdout.write(f"有 LLM 参考结果的行: {len(references)}")
+
+        for ent_type in entity_types[1:]:
+            predicted = correct = rows_resolved = missed = 0
+            for index, (resolved, _) in enumerate(results):
+                if ent_type not in resolved:
+                    continue
+                rows_resolved += 1
+                reference = references.get(index)
+                if reference is None:
+                    continue
+                expected = set(_as_list(reference.get(ent_type)))
+                values = resolved[ent_type]
+                predicted += len(values)
+                correct += sum(1 for value in values if value in expected)
+                # 规则判为空（无线索词）但 LLM 提取到了内容
+                missed += not values and bool(expected)
+            precision = f"{correct / predicted:.1%}" if predicted else "-"
+            self.stdout.write(
+                f"  {ent_type}: 规则确定 {rows_resolved}/{len(rows)} 行, 精确率 {precision} ({correct}/{predicted}), "
+                f"判空但 LLM 有结果 {missed} 行"
+            )
+
+    @staticmethod
+    def _iter_rows(file_path):
+        if file_path.endswith('.xls'):
+            yield from DocumentProcessor._read_excel(file_path)
+            return
+        with ExcelWorkbook(file_path) as workbook:
+            yield from DocumentProcessor._iter_excel_rows(workbook)
+
+    @staticmethod
+    def _references(rows, entity_types, call_llm):
+        """
+        LLM 参考结果：优先取提取缓存中询问全部类型的条目（缓存只保存 LLM 的原始结果，不含规则结果），
+        可选地对缺失行实际调用 LLM
+        """
+        keys = [LLMCache.make_key(item['full_text'], item['teacher_name'], entity_types) for item in rows]
+        cached = LLMCache.get_many(keys)
+        references = {}
+        for index, (item, key) in enumerate(zip(rows, keys)):
+            if key in cached:
+                references[index] = cached[key]
+            elif call_llm:
+                try:
+                    references[index] = LLMBridge.extract_entities(item['full_text'], item['teacher_name'], entity_types)
+                except Exception as e:
+                    print(f"Extraction failed for {item['teacher_name']}: {e}")
+        return references
+
+    @staticmethod
+    def _mean_remaining(results):
+        remaining = [len(types) for _, types in results if types]
+        return sum(remaining) / len(remaining) if remaining else 0
+
+
+def _as_list(values):
+    if values is None:
+        return []
+    return values if isinstance(values, list) else [values]
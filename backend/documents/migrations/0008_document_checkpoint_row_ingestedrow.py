@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_extractioncache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='checkpoint_row',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='IngestedRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('excel_row_index', models.PositiveIntegerField()),
+                ('teacher_name', models.CharField(max_length=100)),
+                ('content_hash', models.CharField(db_index=True, max_length=64)),
+                ('ingested_at', models.DateTimeField(auto_now_add=True)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingested_rows', to='documents.document')),
+            ],
+            options={
+                'ordering': ['document', 'excel_row_index'],
+            },
+        ),
+    ]
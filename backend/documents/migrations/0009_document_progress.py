@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0008_document_checkpoint_row_ingestedrow'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='progress',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
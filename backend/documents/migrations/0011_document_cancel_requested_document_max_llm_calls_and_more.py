@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0010_schedulerlease_document_priority_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='cancel_requested',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='max_llm_calls',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='max_seconds',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='status',
+            field=models.CharField(choices=[('pending', '---'), ('queued', '排队中'), ('processing', '处理中'), ('processed', '已处理'), ('error', '处理错误'), ('cancelled', '已取消'), ('budget_exceeded', '超出预算')], default='pending', max_length=20),
+        ),
+    ]
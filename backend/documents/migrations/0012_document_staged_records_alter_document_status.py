@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0011_document_cancel_requested_document_max_llm_calls_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='staged_records',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='status',
+            field=models.CharField(choices=[('pending', '---'), ('queued', '排队中'), ('processing', '处理中'), ('previewed', '已预览'), ('processed', '已处理'), ('error', '处理错误'), ('cancelled', '已取消'), ('budget_exceeded', '超出预算')], default='pending', max_length=20),
+        ),
+    ]
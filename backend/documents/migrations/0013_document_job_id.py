@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0012_document_staged_records_alter_document_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='job_id',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0015_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='job_kind',
+            field=models.CharField(choices=[('process', '处理'), ('reprocess', '强制重新处理')], default='process', editable=False, max_length=10),
+        ),
+    ]
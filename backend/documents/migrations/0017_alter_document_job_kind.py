@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0016_document_job_kind'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='document',
+            name='job_kind',
+            field=models.CharField(choices=[('process', '处理'), ('reprocess', '强制重新处理'), ('preview', '预览变更'), ('apply', '应用预览')], default='process', editable=False, max_length=10),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from users.models import CustomUser
 import os
 import uuid
@@ -18,9 +19,20 @@ class Document(models.Model):
     
     STATUS_CHOICES = [
         ('pending', '---'), # 初始状态为空白
+        ('queued', '排队中'),
         ('processing', '处理中'),
+        ('previewed', '已预览'),
         ('processed', '已处理'),
         ('error', '处理错误'),
+        ('cancelled', '已取消'),
+        ('budget_exceeded', '超出预算'),
+    ]
+
+    JOB_KINDS = [
+        ('process', '处理'),
+        ('reprocess', '强制重新处理'), # 不跳过已入库的行，全部重新提取
+        ('preview', '预览变更'), # dry-run，提取结果暂存在 staged_records
+        ('apply', '应用预览'), # 写入 staged_records，不调用 LLM
     ]
     
     title = models.CharField(max_length=200)
@@ -30,12 +42,91 @@ class Document(models.Model):
     uploader = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     upload_time = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    priority = models.IntegerField(default=0) # 排队处理时的优先级，数值越大越先处理
     processed_data = models.JSONField(null=True, blank=True)
     processing_start_time = models.DateTimeField(null=True, blank=True)
     processing_end_time = models.DateTimeField(null=True, blank=True)
+    checkpoint_row = models.PositiveIntegerField(default=0) # 最后一批已入库的 Excel 行号（断点）
+    progress = models.JSONField(null=True, blank=True) # 处理中的实时进度（阶段、行数、速率、预计剩余时间）
+    cancel_requested = models.BooleanField(default=False) # 处理中收到取消请求，处理循环在行与行之间检查
+    max_seconds = models.PositiveIntegerField(null=True, blank=True) # 本文档处理时长预算（秒），为空时使用全局设置，0 表示不限
+    max_llm_calls = models.PositiveIntegerField(null=True, blank=True) # 本文档 LLM 调用次数预算，为空时使用全局设置，0 表示不限
+    staged_records = models.JSONField(null=True, blank=True, editable=False) # 预览（dry-run）时暂存的提取结果，应用预览时直接写入
+    job_id = models.CharField(max_length=32, blank=True, editable=False) # 最近一次加入处理队列时分配的任务号，重复提交时返回同一任务号
+    job_kind = models.CharField(max_length=10, choices=JOB_KINDS, default='process', editable=False) # 最近一次加入处理队列时的任务类型，调度器据此执行
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True, editable=False) # 文件内容的 sha256，上传时流式计算
+    duplicate_of = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='duplicates', editable=False) # 内容相同、已处理过的文档，本文档直接关联其结果
     
     def __str__(self):
         return self.title
     
     class Meta:
-        ordering = ['-upload_time']
\ No newline at end of file
+        ordering = ['-upload_time']
+
+class UploadSession(models.Model):
+    """分块上传会话：各分块直接写入最终存储位置的对应偏移，全部到齐并校验大小与哈希后生成文档"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    uploader = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    title = models.CharField(max_length=200)
+    file_type = models.CharField(max_length=10, choices=Document.DOCUMENT_TYPES)
+    file_name = models.CharField(max_length=255) # 文件在存储中的最终路径（相对媒体目录）
+    total_size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True) # 客户端提供的完整文件哈希，完成时校验
+    share_file = models.BooleanField(default=False)
+    document = models.ForeignKey(Document, null=True, blank=True, on_delete=models.SET_NULL) # 完成后生成的文档
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.total_size // self.chunk_size))
+
+    def __str__(self):
+        return f"{self.title} ({self.id})"
+
+class UploadChunk(models.Model):
+    """已写入的分块，重复上传同一分块时覆盖写入，记录不重复"""
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('session', 'index')
+
+class SchedulerLease(models.Model):
+    """调度器租约：保证同一时间只有一个调度器实例在分派文档任务，持有者需定期续期"""
+    name = models.CharField(max_length=50, unique=True)
+    owner = models.CharField(max_length=100)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} ({self.owner})"
+
+class IngestedRow(models.Model):
+    """已入库的表格行，按内容哈希记录，用于断点续跑和重复上传时跳过未变更的导师"""
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='ingested_rows')
+    excel_row_index = models.PositiveIntegerField()
+    teacher_name = models.CharField(max_length=100)
+    content_hash = models.CharField(max_length=64, db_index=True)
+    ingested_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.document} #{self.excel_row_index} {self.teacher_name}"
+
+    class Meta:
+        ordering = ['document', 'excel_row_index']
+
+class ExtractionCache(models.Model):
+    """LLM 实体提取结果缓存，按 (Prompt版本, 模型, 文本, 导师姓名, 实体类型) 的哈希寻址"""
+    key = models.CharField(max_length=64, unique=True)
+    model_name = models.CharField(max_length=100, db_index=True)
+    prompt_version = models.CharField(max_length=20)
+    teacher_name = models.CharField(max_length=100, blank=True)
+    result = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.teacher_name} ({self.model_name})"
+
+    class Meta:
+        ordering = ['-last_used_at']
@@ -0,0 +1,145 @@
+import glob
+import json
+import mmap
+import os
+import uuid
+import zipfile
+from .excel_reader import read_archive_image
+from .uploads import file_sha256
+
+# 工作簿解析结果的旁路缓存
+# 首次解析 .xlsx 时把规范化后的行（姓名、介绍、提取文本、行号）逐行写入上传文件旁的 JSON Lines 文件，
+# 最后一行为尾部信息（行数、图片索引等）。文件名包含上传文件的内容哈希，文件内容变化后自然失效；
+# 之后的处理、预览与应用预览通过内存映射逐行读取，不再解析工作簿 XML。
+
+SUFFIX = '.rows.jsonl'
+# 行的规范化逻辑（列名匹配、文本清洗）变化时递增，使旧缓存失效
+VERSION = 1
+
+
+def remove_row_caches(file_path):
+    """删除上传文件旁的所有行缓存（包括写入中断留下的临时文件）"""
+    for path in glob.glob(f"{glob.escape(file_path)}.*{SUFFIX}*"):
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"Error deleting row cache {path}: {e}")
+
+
+class RowCache:
+    """
+    单个上传文件的行缓存：open() 命中时返回 CachedWorkbook，
+    未命中时用 write_through() 包装工作簿的行迭代器，边产出边写入，完整读完后才生效
+    """
+
+    def __init__(self, file_path, max_text_length, content_hash=None):
+        self.file_path = file_path
+        # 提取文本按 max_text_length 截断，设置变化时缓存不可复用
+        self.max_text_length = max_text_length
+        # 上传时已记录内容哈希的文档直接使用，不再读取整个文件
+        self.content_hash = content_hash or file_sha256(file_path)
+        self.path = f"{file_path}.{self.content_hash[:16]}{SUFFIX}"
+
+    def open(self):
+        """读取缓存的尾部信息，缓存不存在、已损坏或版本不符时返回 None"""
+        if not os.path.isfile(self.path):
+            return None
+        try:
+            workbook = CachedWorkbook(self.file_path, self.path)
+        except (OSError, ValueError) as e:
+            print(f"Row cache unreadable, rebuilding: {e}")
+            return None
+        trailer = workbook.trailer
+        if (trailer.get('version') != VERSION or trailer.get('content_hash') != self.content_hash
+                or trailer.get('max_text_length') != self.max_text_length):
+            workbook.close()
+            return None
+        return workbook
+
+    def write_through(self, items, workbook):
+        """
+        原样产出 items，同时写入临时文件；items 被完整迭代后写入尾部信息并原子替换为正式缓存，
+        同时删除该文件旧内容对应的缓存。提前停止（取消、超出预算、出错）时丢弃临时文件
+        """
+        temp_path = f"{self.path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+        rows_total = 0
+        completed = False
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                for item in items:
+                    f.write(json.dumps(item, ensure_ascii=False))
+                    f.write('\n')
+                    rows_total += 1
+                    yield item
+                images = {row: [target, workbook.image_crc(row)] for row, target in workbook.image_anchors.items()}
+                f.write(json.dumps({
+                    "version": VERSION,
+                    "content_hash": self.content_hash,
+                    "max_text_length": self.max_text_length,
+                    "rows_total": rows_total,
+                    "images": images,
+                }, ensure_ascii=False))
+            os.replace(temp_path, self.path)
+            for path in glob.glob(f"{glob.escape(self.file_path)}.*{SUFFIX}"):
+                if path != self.path:
+                    os.remove(path)
+            completed = True
+        finally:
+            if not completed and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+class CachedWorkbook:
+    """
+    以内存映射方式读取行缓存，提供与 ExcelWorkbook 相同的图片接口（image_anchors / image_crc / read_image），
+    图片内容仍从原 .xlsx 压缩包按需读取，只在第一次读取图片时打开压缩包
+    """
+
+    def __init__(self, file_path, cache_path):
+        self.file_path = file_path
+        with open(cache_path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            # 尾部信息是最后一行，其前面的字节都是数据行
+            self._rows_end = self._mm.rfind(b'\n') + 1
+            self.trailer = json.loads(self._mm[self._rows_end:])
+            images = self.trailer.get('images', {})
+        except ValueError:
+            self._mm.close()
+            raise
+        self.image_anchors = {int(row): target for row, (target, _) in images.items()}
+        self._image_crcs = {int(row): crc for row, (_, crc) in images.items()}
+        self._archive = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def close(self):
+        self._mm.close()
+        if self._archive:
+            self._archive.close()
+
+    def iter_items(self):
+        """按行号顺序逐行产出缓存的条目"""
+        position = 0
+        while position < self._rows_end:
+            end = self._mm.find(b'\n', position, self._rows_end)
+            yield json.loads(self._mm[position:end])
+            position = end + 1
+
+    def data_row_count(self):
+        return self.trailer['rows_total']
+
+    def image_crc(self, row_idx):
+        return self._image_crcs.get(row_idx)
+
+    def read_image(self, row_idx):
+        target = self.image_anchors.get(row_idx)
+        if not target:
+            return None
+        if self._archive is None:
+            self._archive = zipfile.ZipFile(self.file_path)
+        return read_archive_image(self._archive, target)
@@ -0,0 +1,191 @@
+import os
+import socket
+import uuid
+from functools import partial
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, connection
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Document, SchedulerLease
+
+# 文档处理调度器
+# 管理员一次可选择多个文档加入队列，调度器按优先级取出并在线程中并发处理；
+# 同一进程内的文档共享 LLM 在途请求与 SQLite 写入的槽位（见 services/resource_limits.py）
+
+LEASE_NAME = 'document-scheduler'
+# 租约有效期（秒），调度循环每次等待不超过 POLL_INTERVAL，并在每轮续期
+LEASE_SECONDS = 60
+POLL_INTERVAL = 5
+
+
+def enqueue_documents(documents, priority=None, kind='process'):
+    """
+    将文档标记为排队中并确保调度器在运行，返回 (加入队列的数量, Django-Q 任务ID)
+    已在排队或处理中的文档不会重复加入（处理任务已中断的除外，见 _orphaned）；
+    本次加入的文档记录同一个任务号（job_id）与任务类型（kind，见 Document.JOB_KINDS），并清零上一次处理的断点
+    """
+    from django_q.tasks import async_task
+
+    ids = [doc.id for doc in documents]
+    queryset = Document.objects.filter(id__in=ids).filter(
+        ~Q(status__in=['queued', 'processing']) | Q(status='processing', id__in=_orphaned(ids))
+    )
+    updates = {
+        'status': 'queued', 'cancel_requested': False,
+        'processing_start_time': None, 'processing_end_time': None, 'progress': None,
+        'job_id': uuid.uuid4().hex, 'job_kind': kind, 'checkpoint_row': 0,
+    }
+    if priority is not None:
+        updates['priority'] = priority
+    queued = queryset.update(**updates)
+
+    task_id = None
+    if queued:
+        # 调度任务会持续到队列清空，超时时间需覆盖整批文档的处理时长
+        task_id = async_task(run_document_scheduler, timeout=getattr(settings, 'DOCUMENT_SCHEDULER_TIMEOUT', 6 * 3600))
+    return queued, task_id
+
+
+def cancel_documents(documents):
+    """
+    取消文档处理，返回 (直接取消的排队文档数, 已请求停止的处理中文档数)
+    排队中的文档直接标记为已取消；处理中的文档设置取消标记，由处理循环在下一行之前停止；
+    处理任务已中断的文档没有处理循环响应取消标记，也直接标记为已取消
+    """
+    ids = [doc.id for doc in documents]
+    cancelled = Document.objects.filter(id__in=ids).filter(
+        Q(status='queued') | Q(status='processing', id__in=_orphaned(ids))
+    ).update(status='cancelled', cancel_requested=False, processing_end_time=timezone.now())
+    requested = Document.objects.filter(id__in=ids, status='processing').update(cancel_requested=True)
+    return cancelled, requested
+
+
+def run_document_scheduler():
+    """
+    后台任务入口：按 (优先级, 上传时间) 依次认领排队中的文档并发处理，
+    队列清空且没有运行中的任务时退出。已有调度器持有租约时直接返回，由其负责新加入的文档。
+    取得租约时先恢复上一个调度器中断（进程被杀死、任务超时）后遗留在处理中的文档。
+    """
+    from .services import apply_staged_task, process_document_task
+
+    # 任务类型 -> 执行函数
+    tasks = {
+        'process': process_document_task,
+        'reprocess': partial(process_document_task, force=True),
+        'preview': partial(process_document_task, dry_run=True),
+        'apply': apply_staged_task,
+    }
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    while True:
+        if not _acquire_lease(owner):
+            print("Document scheduler already running, exit.")
+            return
+        try:
+            _recover_orphans()
+            _dispatch(owner, tasks)
+        finally:
+            SchedulerLease.objects.filter(name=LEASE_NAME, owner=owner).delete()
+
+        # 释放租约后再检查一次，避免漏掉在退出前刚加入、但因租约被占用而退出的调度任务所对应的文档
+        if not Document.objects.filter(status='queued').exists():
+            return
+
+
+def _dispatch(owner, tasks):
+    """调度循环：补满空闲槽位，等待任意任务完成，直到队列清空且没有运行中的任务"""
+    max_jobs = max(1, getattr(settings, 'DOCUMENT_MAX_CONCURRENT_JOBS', 3))
+    with ThreadPoolExecutor(max_workers=max_jobs) as executor:
+        running = set()
+        while True:
+            _renew_lease(owner)
+            while len(running) < max_jobs:
+                claimed = _claim_next()
+                if claimed is None:
+                    break
+                document_id, kind = claimed
+                print(f"Scheduler dispatch document {document_id} ({kind})")
+                running.add(executor.submit(_run_job, tasks[kind], document_id))
+
+            if not running:
+                return
+            _, running = wait(running, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+
+
+def _orphaned(ids):
+    """
+    ids 中处理任务已中断的文档：状态为处理中，但调度器租约不存在或已过期（没有调度器在运行），
+    且进度超过 LEASE_SECONDS 未更新。这类文档既不会完成也不会响应取消，允许重新加入队列或直接取消
+    """
+    now = timezone.now()
+    if SchedulerLease.objects.filter(name=LEASE_NAME, expires_at__gte=now).exists():
+        return []
+    stale_before = now - timedelta(seconds=LEASE_SECONDS)
+    orphaned = []
+    rows = Document.objects.filter(id__in=ids, status='processing').values_list('id', 'progress', 'processing_start_time')
+    for document_id, progress, started in rows:
+        updated = parse_datetime((progress or {}).get('updated_at') or '') or started
+        if updated is None or updated < stale_before:
+            orphaned.append(document_id)
+    return orphaned
+
+
+def _recover_orphans():
+    """
+    调度器刚取得租约时调用：租约同一时间只有一个持有者，此时仍为处理中的文档都属于已中断的调度器。
+    已请求取消的直接取消，其余重新排队（保留任务类型，处理时按内容哈希跳过已入库的行）
+    """
+    now = timezone.now()
+    Document.objects.filter(status='processing', cancel_requested=True).update(
+        status='cancelled', cancel_requested=False, processing_end_time=now
+    )
+    recovered = Document.objects.filter(status='processing').update(
+        status='queued', processing_start_time=None, progress=None
+    )
+    if recovered:
+        print(f"Scheduler requeued {recovered} interrupted documents")
+
+
+def _run_job(task, document_id):
+    """在线程中执行单个文档任务，结束后关闭本线程的数据库连接"""
+    try:
+        task(document_id)
+    finally:
+        connection.close()
+
+
+def _claim_next():
+    """原子地认领优先级最高的一个排队文档（排队中 -> 处理中），返回 (文档ID, 任务类型)，没有时返回 None"""
+    candidates = (
+        Document.objects.filter(status='queued')
+        .order_by('-priority', 'upload_time')
+        .values_list('id', 'job_kind')[:10]
+    )
+    for document_id, kind in candidates:
+        claimed = Document.objects.filter(id=document_id, status='queued').update(
+            status='processing', processing_start_time=timezone.now()
+        )
+        if claimed:
+            return document_id, kind
+    return None
+
+
+def _acquire_lease(owner, name=LEASE_NAME, seconds=LEASE_SECONDS):
+    """获取调度器租约：不存在或已过期时取得，成功返回 True（Neo4j 同步线程也用它保证只有一个实例）"""
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=seconds)
+    if SchedulerLease.objects.filter(name=name, expires_at__lt=now).update(owner=owner, expires_at=expires_at):
+        return True
+    try:
+        SchedulerLease.objects.create(name=name, owner=owner, expires_at=expires_at)
+        return True
+    except IntegrityError:
+        return False
+
+
+def _renew_lease(owner, name=LEASE_NAME, seconds=LEASE_SECONDS):
+    SchedulerLease.objects.filter(name=name, owner=owner).update(
+        expires_at=timezone.now() + timedelta(seconds=seconds)
+    )
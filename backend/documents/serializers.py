@@ -1,12 +1,20 @@
+from django.conf import settings
 from rest_framework import serializers
-from documents.models import Document
+from documents.models import Document, UploadSession
+
+# 允许上传的文件类型
+ALLOWED_EXTENSIONS = ['pdf', 'doc', 'docx', 'xlsx', 'xls']
 
 # 文档相关的序列化器
 class DocumentUploadSerializer(serializers.ModelSerializer):
     """文档上传专用的序列化器"""
+    # 与已处理文档内容相同时是否直接复用其已存储的文件（默认取 DOCUMENT_UPLOAD_SHARE_FILES）
+    share_file = serializers.BooleanField(write_only=True, required=False)
+
     class Meta:
         model = Document
-        fields = ['id', 'title', 'file', 'file_type']
+        fields = ['id', 'title', 'file', 'file_type', 'share_file', 'status', 'content_hash', 'duplicate_of']
+        read_only_fields = ['status']
     
     def validate_file(self, value):
         """验证上传的文件"""
@@ -16,13 +24,51 @@ class DocumentUploadSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("文件大小不能超过50MB")
         
         # 检查文件类型
-        allowed_types = ['pdf', 'doc', 'docx', 'xlsx', 'xls']
         ext = value.name.split('.')[-1].lower()
-        if ext not in allowed_types:
+        if ext not in ALLOWED_EXTENSIONS:
             raise serializers.ValidationError(f"不支持的文件类型: {ext}")
         
         return value
 
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """分块上传会话：创建时声明文件名、总大小（及可选的 sha256），查询时返回已收到的分块，用于断点续传"""
+    filename = serializers.CharField(write_only=True)
+    chunk_size = serializers.IntegerField(required=False, min_value=64 * 1024)
+    chunk_count = serializers.IntegerField(read_only=True)
+    received = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'title', 'file_type', 'filename', 'total_size', 'chunk_size', 'sha256', 'share_file',
+                  'chunk_count', 'received', 'document', 'created_at']
+        read_only_fields = ['document', 'created_at']
+
+    def get_received(self, obj):
+        return sorted(obj.chunks.values_list('index', flat=True))
+
+    def validate_filename(self, value):
+        ext = value.split('.')[-1].lower()
+        if ext not in ALLOWED_EXTENSIONS:
+            raise serializers.ValidationError(f"不支持的文件类型: {ext}")
+        return value
+
+    def validate_total_size(self, value):
+        max_size = getattr(settings, 'DOCUMENT_MAX_CHUNKED_UPLOAD_SIZE', 2 * 1024 ** 3)
+        if value > max_size:
+            raise serializers.ValidationError(f"文件大小不能超过{max_size // 1024 ** 2}MB")
+        return value
+
+    def validate_sha256(self, value):
+        return value.lower()
+
+    def validate(self, attrs):
+        # 单个分块在请求中流式写入，大小上限只为限制单次请求的时长
+        attrs['chunk_size'] = min(
+            attrs.get('chunk_size') or getattr(settings, 'DOCUMENT_UPLOAD_CHUNK_SIZE', 8 * 1024 ** 2),
+            64 * 1024 ** 2,
+        )
+        return attrs
+
 class DocumentDetailSerializer(serializers.ModelSerializer):
     """文档详情序列化器"""
     uploader_name = serializers.CharField(source='uploader.username', read_only=True)
@@ -31,7 +77,8 @@ class DocumentDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = Document
         fields = ['id', 'title', 'file', 'file_type', 'uploader', 'uploader_name',
-                 'upload_time', 'status', 'processed_data',
+                 'upload_time', 'status', 'job_id', 'processed_data',
+                 'max_seconds', 'max_llm_calls',
                  'processing_start_time', 'processing_end_time', 'processing_duration']
     
     def get_processing_duration(self, obj):
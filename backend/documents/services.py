@@ -1,18 +1,48 @@
+import contextvars
+import hashlib
+import json
 import os
 import pandas as pd
 import re
+import time
 import traceback
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from itertools import islice
 from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
 from django.utils import timezone
 from knowledge_graph.models import Entity, Relationship
+from knowledge_graph.signals import sync_bulk_to_neo4j
+from services.entity_classifier import entity_classifier
 from services.llm_bridge import LLMBridge
-from .models import Document
+from services.llm_cache import LLMCache
+from services.metrics import PipelineMetrics, current_metrics, percentile, timed
+from services.resource_limits import db_writer_slot
+from services.rule_extractor import RuleExtractor
+from .excel_reader import ExcelWorkbook
+from .row_cache import RowCache
+from .text_reader import iter_text_blocks, segment_blocks
+from .models import Document, IngestedRow
 
-def process_document_task(document_id):
+def process_document_task(document_id, dry_run=False, force=False):
     """
     后台任务入口：处理文档（通常运行在独立线程中）
+    dry_run=True 时只预览变更，提取结果暂存在文档上，文档状态为“已预览”
+    force=True 时不跳过已入库的行，全部重新提取（例如更换模型或 Prompt 之外的原因需要重跑）
     """
+    _run_document_task(
+        document_id,
+        lambda document: DocumentProcessor.process(document, resume=not force, dry_run=dry_run),
+        'previewed' if dry_run else 'processed'
+    )
+
+def apply_staged_task(document_id):
+    """后台任务入口：应用文档的预览结果（不再调用 LLM）"""
+    _run_document_task(document_id, DocumentProcessor.apply_staged, 'processed')
+
+def _run_document_task(document_id, run, success_status):
     try:
         # 重新从数据库获取最新状态
         document = Document.objects.get(id=document_id)
@@ -22,11 +52,16 @@ def process_document_task(document_id):
 
     try:
         # 执行核心处理逻辑
-        result = DocumentProcessor.process(document)
+        result = run(document)
         
         # 更新成功状态
-        document.status = 'processed'
+        document.status = success_status
         document.processed_data = result
+    except ProcessingStopped as stop:
+        # 取消或超出预算：已写入的数据保留，记录部分统计
+        print(f"Processing stopped: {stop}")
+        document.status = stop.status
+        document.processed_data = stop.result or {"error": str(stop)}
     except Exception as e:
         # 更新失败状态
         error_msg = f"{str(e)}"
@@ -39,12 +74,132 @@ def process_document_task(document_id):
             "traceback": traceback.format_exc()[-500:] # 只保留最后一部分堆栈
         }
     finally:
+        # 只保存本任务负责的字段，处理期间其他请求修改的字段（如优先级）不被内存中的旧值覆盖；
+        # 进度、断点、暂存结果在处理过程中已单独写入
         document.processing_end_time = timezone.now()
-        document.save()
+        document.cancel_requested = False
+        document.save(update_fields=['status', 'processed_data', 'processing_end_time', 'cancel_requested'])
+
+class ProcessingStopped(Exception):
+    """
+    处理被取消或超出预算时抛出
+    status 为文档的最终状态（cancelled / budget_exceeded），result 为已完成部分的统计
+    """
+
+    def __init__(self, status, reason):
+        super().__init__(reason)
+        self.status = status
+        self.result = None
+
+class JobGuard:
+    """
+    协作式取消与预算检查：处理循环在行与行、阶段与阶段之间调用 check(budget=False)，收到取消请求时抛出 ProcessingStopped；
+    时长与 LLM 调用次数预算只限制需要调用 LLM 的行：提取阶段在提交这类行之前检查（等待 LLM 结果期间也检查时长），
+    缓存命中、未变更跳过和规则即可确定的行不受预算限制，已发出的调用完成并写入后再停止
+    """
+    # 两次查询取消标记之间的最小间隔（秒）
+    CANCEL_POLL_INTERVAL = 1.0
+
+    def __init__(self, document, metrics):
+        self.document = document
+        self.metrics = metrics
+        self.max_seconds = self._budget(document.max_seconds, 'DOCUMENT_MAX_SECONDS')
+        self.max_llm_calls = self._budget(document.max_llm_calls, 'DOCUMENT_MAX_LLM_CALLS')
+        self.started = time.perf_counter()
+        self._last_poll = 0.0
+
+    @staticmethod
+    def _budget(value, setting_name):
+        return value if value is not None else getattr(settings, setting_name, 0)
+
+    def check(self, budget=True):
+        """检查取消请求；budget 为真时同时检查时长预算"""
+        now = time.perf_counter()
+        if now - self._last_poll >= self.CANCEL_POLL_INTERVAL:
+            self._last_poll = now
+            if Document.objects.filter(pk=self.document.pk, cancel_requested=True).exists():
+                raise ProcessingStopped('cancelled', "处理已被取消")
+
+        if budget and self.time_exceeded():
+            raise self.budget_error()
+
+    def time_exceeded(self):
+        return bool(self.max_seconds) and time.perf_counter() - self.started > self.max_seconds
+
+    def llm_calls_left(self, submitted=0):
+        """剩余的 LLM 调用次数，不限时返回 None；submitted 为已提交但可能尚未开始的调用数"""
+        if not self.max_llm_calls:
+            return None
+        return max(self.max_llm_calls - max(self.metrics.count('llm_calls'), submitted), 0)
+
+    def budget_error(self):
+        if self.time_exceeded():
+            return ProcessingStopped('budget_exceeded', f"处理时间超过预算 {self.max_seconds} 秒")
+        return ProcessingStopped('budget_exceeded', f"LLM 调用次数达到预算 {self.max_llm_calls} 次")
+
+class ProgressTracker:
+    """
+    文档处理进度：按固定时间间隔把当前阶段、行数、速率和预计剩余时间写入 Document.progress，
+    供进度接口和 SSE 推送读取（处理通常运行在 qcluster 进程中，因此通过数据库共享）
+    """
+    # 两次写库之间的最小间隔（秒）
+    PUBLISH_INTERVAL = 1.0
+
+    def __init__(self, document, rows_total=None):
+        self.document = document
+        self.rows_total = rows_total
+        self.resume_stats = None
+        self.stage = None
+        self.rows_done = 0
+        self.triples_written = 0
+        self.started = time.perf_counter()
+        self._last_publish = 0.0
+
+    def set_stage(self, stage):
+        self.stage = stage
+        self.publish(force=True)
+
+    def advance(self, rows=1, triples=0):
+        self.rows_done += rows
+        self.triples_written += triples
+        self.publish()
+
+    def snapshot(self):
+        elapsed = time.perf_counter() - self.started
+        skipped = self.resume_stats['skipped_rows'] if self.resume_stats else 0
+        rate = self.rows_done / elapsed if elapsed > 0 else 0
+        eta = None
+        if self.rows_total and rate > 0:
+            eta = round(max(self.rows_total - self.rows_done - skipped, 0) / rate, 1)
+        return {
+            "stage": self.stage,
+            "rows_done": self.rows_done,
+            "rows_skipped": skipped,
+            "rows_total": self.rows_total,
+            "triples_written": self.triples_written,
+            "rows_per_second": round(rate, 3),
+            "elapsed_seconds": round(elapsed, 1),
+            "eta_seconds": eta,
+            "updated_at": timezone.now().isoformat(),
+        }
+
+    def publish(self, force=False):
+        now = time.perf_counter()
+        if not force and now - self._last_publish < self.PUBLISH_INTERVAL:
+            return
+        self._last_publish = now
+        data = self.snapshot()
+        # 只更新进度字段，同时同步内存对象，防止之后 save() 时被旧值覆盖
+        Document.objects.filter(pk=self.document.pk).update(progress=data)
+        self.document.progress = data
 
 class DocumentProcessor:
+    # 可处理的文件类型：Excel 按行读取，PDF / Word 按人物或章节分段（.doc 旧格式不支持）
+    SUPPORTED_EXTENSIONS = ('.xlsx', '.xls', '.pdf', '.docx')
+
     CONFIG = {
-        "max_text_length": 2500,
+        # 单行简介保留的最大长度（安全上限），超过 llm_chunk_chars 的简介分段提取
+        "max_text_length": 20000,
         "entity_types": [
             "教师姓名", "院系", "职称", "研究方向", "课程名称", "毕业院校", "荣誉称号", "工作职责"
         ],
@@ -56,129 +211,1062 @@ class DocumentProcessor:
             "毕业于": "毕业院校",
             "获得": "荣誉称号",
             "负责": "工作职责"
-        }
+        },
+        # 写入模式："bulk" 每批行在内存中归并后单事务批量写入；"row" 逐行逐条写入（旧逻辑）
+        "write_mode": "bulk",
+        # 批量模式下每处理多少行写入一次并保存断点（任务中断后从断点继续）
+        "checkpoint_every": 200,
+        # SQLite 单条语句的参数个数有限，IN 查询与批量写入按此大小分批
+        "db_batch_size": 500,
+        # 同时进行的 LLM 请求数上限（Ollama 端需配合 OLLAMA_NUM_PARALLEL）
+        "llm_concurrency": getattr(settings, 'LLM_CONCURRENCY', 4),
+        # 多位导师合并为一次请求：每批文本总字符数与行数上限（行数设为 1 即关闭批量）
+        "llm_batch_chars": getattr(settings, 'LLM_BATCH_CHARS', 3000),
+        "llm_batch_max_rows": getattr(settings, 'LLM_BATCH_MAX_ROWS', 8),
+        # 长简介按句子边界切分为重叠的分段并行提取，再按类型合并去重
+        "llm_chunk_chars": getattr(settings, 'LLM_CHUNK_CHARS', 1500),
+        "llm_chunk_overlap": getattr(settings, 'LLM_CHUNK_OVERLAP', 200),
+        # PDF 文本解析的子进程数（按页段并行）
+        "pdf_workers": getattr(settings, 'PDF_READ_WORKERS', 1),
+        # 结构化字段（职称、院系、毕业院校）先用规则预提取，只向 LLM 询问剩余类型（开启 LLM_RULE_SKIP_UNCUED 时全部确定的行跳过 LLM）
+        "use_rules": getattr(settings, 'LLM_RULE_PREEXTRACT', True),
+        # 是否使用持久化提取缓存
+        "use_cache": True,
     }
 
     @classmethod
-    def process(cls, document):
-        """主处理逻辑"""
+    def supports(cls, document):
+        """是否能处理该文档（按文件扩展名判断）"""
+        return document.file.name.lower().endswith(cls.SUPPORTED_EXTENSIONS)
+
+    @classmethod
+    def process(cls, document, write_mode=None, resume=True, dry_run=False):
+        """
+        主处理逻辑
+        :param write_mode: 写入模式，默认取 CONFIG['write_mode']
+        :param resume: 是否跳过已按相同内容入库过的行（断点续跑 / 重复上传），False 时全部重新处理
+        :param dry_run: 只读取和提取，计算相对当前图谱的变更（result['diff']），不写入 SQLite / Neo4j；
+                        提取结果暂存在 document.staged_records，之后可用 apply_staged 直接应用
+        """
+        write_mode = write_mode or cls.CONFIG['write_mode']
         file_path = document.file.path
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File not found: {file_path}")
 
-        # 1. 尝试提取 Excel 中的图片
-        images_map = cls._extract_images_from_excel(file_path)
+        # 分阶段计时：本线程的 SQL 通过 execute_wrapper 计数，LLM / Neo4j 调用通过 contextvar 记录到同一实例
+        metrics = PipelineMetrics()
+        guard = JobGuard(document, metrics)
+        try:
+            with metrics.activate(), connection.execute_wrapper(metrics.db_query_wrapper):
+                result = cls._run(document, file_path, write_mode, resume, guard, dry_run)
+        except ProcessingStopped as stop:
+            if stop.result is not None:
+                stop.result['metrics'] = metrics.summary()
+            raise
+        result['metrics'] = metrics.summary()
+        return result
 
-        # 2. 读取 Excel 文本
-        texts = cls._read_excel(file_path)
-        if not texts:
-            raise ValueError("无法从Excel中提取有效文本，请检查列名是否包含'姓名'和'介绍'")
+    @classmethod
+    def _run(cls, document, file_path, write_mode, resume, guard, dry_run=False):
+        """
+        按阶段执行：读取 -> 去重 -> 并发提取 -> 分批写入（预览模式下改为计算变更）
+        每行及每个阶段之间由 guard 检查取消，预算只在需要调用 LLM 的行之前检查（见 JobGuard），停止时已提取的行照常写入并保存断点
+        """
+
+        # 1. 单次打开工作簿：文本逐行流式读取，图片只建立 行号 -> 图片 的索引，写入该行时才读取内容
+        #    首次解析的行写入上传文件旁的行缓存，之后直接读取缓存，不再打开工作簿（见 row_cache.py）
+        #    .xls（openpyxl 不支持）回退到 pandas 读取，不提取图片
+        #    PDF / Word 按页或段落流式读取并按人物、章节分段，总记录数事先未知
+        progress = ProgressTracker(document)
+        progress.set_stage('reading')
+        workbook = None
+        is_text = file_path.lower().endswith(('.pdf', '.docx'))
+        if is_text:
+            texts = _timed_iter(cls._iter_text_records(file_path), 'text_read')
+        elif file_path.lower().endswith('.xls'):
+            with timed('excel_read'):
+                texts = cls._read_excel(file_path)
+            progress.rows_total = len(texts)
+            texts = iter(texts)
+        else:
+            with timed('file_hash'):
+                row_cache = RowCache(file_path, cls.CONFIG['max_text_length'], document.content_hash)
+            workbook = row_cache.open()
+            if workbook:
+                texts = _timed_iter(workbook.iter_items(), 'row_cache_read')
+            else:
+                with timed('excel_read'):
+                    workbook = ExcelWorkbook(file_path)
+                texts = _timed_iter(row_cache.write_through(cls._iter_excel_rows(workbook), workbook), 'excel_read')
+            progress.rows_total = workbook.data_row_count()
 
         processed_count = 0
         triples_count = 0
-        
-        # 3. 逐行处理
-        for item in texts:
-            teacher_name = item['teacher_name']
-            full_text = item['full_text']
-            intro = item.get('intro', '')
-            excel_row = item['excel_row_index']
-
-            # A. 更新/创建 人物实体 (SQLite -> Signal -> Neo4j)
-            update_defaults = {
-                'entity_type': 'person',  
-                'description': intro      
+        write_seconds = 0.0
+        records = []
+        extraction_stats = {}
+        # resumed_from_row 为第一个未被跳过（重新处理）的行号，全部跳过时为 None
+        resume_stats = {"resume": resume, "resumed_from_row": None, "skipped_rows": 0}
+        progress.resume_stats = resume_stats
+        extraction = None
+
+        def build_result(status, message):
+            resume_stats.update({
+                "reprocessed_rows": processed_count,
+                "checkpoint_row": document.checkpoint_row,
+            })
+            return {
+                "status": status,
+                "processed_count": processed_count,
+                "triples_count": triples_count,
+                "write_mode": write_mode,
+                "timings": {
+                    "write_seconds": round(write_seconds, 3),
+                },
+                "extraction": extraction_stats,
+                "resume": resume_stats,
+                "message": message,
             }
-            
-            # 如果这行有对应的图片，保存并更新
-            if excel_row in images_map:
-                try:
-                    photo_url = cls.save_excel_image(images_map[excel_row], teacher_name, excel_row)
-                    if photo_url:
-                        update_defaults['photo_url'] = photo_url
-                except Exception as e:
-                    print(f"Image save failed for {teacher_name}: {e}")
-            
-            Entity.objects.update_or_create(
-                name=teacher_name,
-                defaults=update_defaults
-            )
 
-            # B. 使用 LLM 提取实体和关系
-            # 只有当简介不为空时才进行提取
-            if len(full_text) > 10:
-                entities = LLMBridge.extract_entities(full_text, teacher_name, cls.CONFIG['entity_types'])
-                triples = cls._generate_triples(entities, teacher_name)
+        try:
+            guard.check()
+            progress.set_stage('extracting')
+            # 2. 计算每行内容哈希，跳过已入库且内容未变的行
+            texts = cls._skip_ingested(texts, workbook, resume_stats, resume)
+
+            # 3. 逐行处理（LLM 提取在线程池中并发进行，结果仍按 Excel 行顺序到达）
+            extraction = cls._extract_all(texts, extraction_stats, guard)
+            for item, entities in extraction:
+                teacher_name = item['teacher_name']
+                intro = item.get('intro', '')
+                excel_row = item['excel_row_index']
+
+                # A. 人物实体的字段 (SQLite -> Signal -> Neo4j)
+                update_defaults = {
+                    'entity_type': item.get('entity_type', 'person'),
+                    'description': intro      
+                }
                 
-                # C. 保存生成的三元组
-                for head, relation, tail in triples:
-                    cls._save_triple(head, relation, tail)
-                    triples_count += 1
-            
-            processed_count += 1
+                # 如果这行有对应的图片，保存并更新（预览模式下只计算保存路径，应用时再写入文件）
+                has_image = bool(workbook) and excel_row in workbook.image_anchors
+                if has_image and dry_run:
+                    update_defaults['photo_url'] = cls._photo_path(teacher_name, excel_row)
+                elif has_image:
+                    try:
+                        with timed('image_save'):
+                            photo_url = cls.save_excel_image(workbook.read_image(excel_row), teacher_name, excel_row)
+                        if photo_url:
+                            update_defaults['photo_url'] = photo_url
+                    except Exception as e:
+                        print(f"Image save failed for {teacher_name}: {e}")
+
+                # B. 由 LLM 提取结果生成三元组（简介过短或提取失败时为空）
+                triples = cls._generate_triples(entities, teacher_name) if entities else []
 
+                records.append({
+                    "teacher_name": teacher_name,
+                    "defaults": update_defaults,
+                    "triples": triples,
+                    "excel_row_index": excel_row,
+                    "content_hash": item['content_hash'],
+                    "has_image": has_image,
+                    # LLM 提取失败的行照常写入已得到的数据，但不记为已入库，下次处理时重新提取
+                    "failed": bool(item.get('extraction_error')),
+                    # 实际得到了提取结果（简介过短未提取或提取失败时为假），只有这样的人物才会在应用预览时裁剪旧关系
+                    "extracted": bool(entities) and not item.get('extraction_error'),
+                })
+
+                # C. 逐行模式下立即写入；批量模式下每 checkpoint_every 行写入一次，写入时同步保存断点
+                if not dry_run and (write_mode == 'row' or len(records) >= cls.CONFIG['checkpoint_every']):
+                    write_seconds += cls._flush(document, records, write_mode, progress)
+                    records = []
+
+                triples_count += len(triples)
+                processed_count += 1
+                progress.advance(triples=len(triples))
+                guard.check(budget=False)
+
+            if records and not dry_run:
+                write_seconds += cls._flush(document, records, write_mode, progress)
+        except ProcessingStopped as stop:
+            # 关闭提取生成器：丢弃尚未开始的 LLM 批次，并写入已完成部分的提取统计
+            if extraction:
+                extraction.close()
+            if records and not dry_run:
+                write_seconds += cls._flush(document, records, write_mode, progress)
+            progress.set_stage(stop.status)
+            stop.result = build_result(
+                stop.status,
+                f"{stop}：预览未完成，未写入任何数据。" if dry_run else
+                f"{stop}：已处理 {processed_count} 位导师数据，生成 {triples_count} 条关系，已处理的数据均已保存。"
+            )
+            raise
+        finally:
+            if extraction:
+                extraction.close()
+            if workbook:
+                workbook.close()
+
+        if processed_count == 0 and resume_stats['skipped_rows'] == 0:
+            if is_text:
+                raise ValueError("未能从文档中识别出人物或章节，请检查文档是否包含文本层（扫描件需先进行 OCR）")
+            raise ValueError("无法从Excel中提取有效文本，请检查列名是否包含'姓名'和'介绍'")
+
+        if dry_run:
+            progress.set_stage('diffing')
+            with timed('diff'):
+                diff = cls._diff_records(records)
+            Document.objects.filter(pk=document.pk).update(staged_records=records)
+            document.staged_records = records
+            progress.set_stage('done')
+            counts = diff['counts']
+            result = build_result(
+                "dry_run",
+                f"预览 {processed_count} 位导师数据：新增 {counts['entities_added']} 个实体、"
+                f"{counts['relationships_added']} 条关系，修改 {counts['entities_changed']} 个实体、"
+                f"{counts['relationships_changed']} 条关系，删除 {counts['entities_removed']} 个实体、"
+                f"{counts['relationships_removed']} 条关系。"
+            )
+            result['diff'] = diff
+            return result
+
+        progress.set_stage('done')
+        return build_result(
+            "success",
+            f"成功处理 {processed_count} 位导师数据，生成 {triples_count} 条关系，"
+            f"跳过 {resume_stats['skipped_rows']} 行未变更数据。"
+        )
+
+    @classmethod
+    def apply_staged(cls, document):
+        """
+        应用预览结果：复用 dry_run 时暂存的提取结果（不再调用 LLM），重新计算相对当前图谱的变更，
+        在单个事务内批量写入，并删除表中人物已不再产生的关系与因此孤立的实体
+        """
+        records = document.staged_records
+        if not records:
+            raise ValueError("没有待应用的预览结果，请先执行预览")
+        records = [dict(record, triples=[tuple(triple) for triple in record['triples']]) for record in records]
+
+        metrics = PipelineMetrics()
+        with metrics.activate(), connection.execute_wrapper(metrics.db_query_wrapper):
+            image_rows = [record for record in records if record.get('has_image')]
+            if image_rows:
+                file_path = document.file.path
+                workbook = (
+                    RowCache(file_path, cls.CONFIG['max_text_length'], document.content_hash).open()
+                    or ExcelWorkbook(file_path)
+                )
+                with workbook, timed('image_save'):
+                    for record in image_rows:
+                        cls.save_excel_image(
+                            workbook.read_image(record['excel_row_index']),
+                            record['teacher_name'], record['excel_row_index']
+                        )
+            with timed('diff'):
+                counts = cls._diff_records(records)['counts']
+            write_seconds = cls._flush(document, records, 'bulk', prune=True)
+
+        Document.objects.filter(pk=document.pk).update(staged_records=None)
+        document.staged_records = None
+        triples_count = sum(len(record['triples']) for record in records)
         return {
             "status": "success",
-            "processed_count": processed_count,
+            "processed_count": len(records),
             "triples_count": triples_count,
-            "message": f"成功处理 {processed_count} 位导师数据，生成 {triples_count} 条关系。"
+            "write_mode": "bulk",
+            "timings": {
+                "write_seconds": round(write_seconds, 3),
+            },
+            "applied": counts,
+            "metrics": metrics.summary(),
+            "message": (
+                f"已应用预览结果：{len(records)} 位导师数据，新增 {counts['relationships_added']} 条关系，"
+                f"修改 {counts['relationships_changed']} 条，删除 {counts['relationships_removed']} 条。"
+            )
         }
 
     @classmethod
-    def _extract_images_from_excel(cls, file_path):
-        """提取Excel中的图片映射 {row_index: image_obj}"""
-        images_map = {}
+    def _row_hash(cls, item, workbook):
+        """
+        行内容哈希：姓名、介绍、清洗后文本以及图片的 CRC（直接取自压缩包目录，无需解压），
+        并包含 Prompt 版本与模型名，更换模型或 Prompt 后已入库的行会重新提取
+        """
+        image_crc = None
+        if workbook and item['excel_row_index'] in workbook.image_anchors:
+            image_crc = workbook.image_crc(item['excel_row_index'])
+        payload = json.dumps(
+            [item['teacher_name'], item['intro'], item['full_text'], image_crc,
+             LLMBridge.PROMPT_VERSION, LLMBridge.model_name()],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def _skip_ingested(cls, texts, workbook, stats, resume=True):
+        """
+        为每行计算内容哈希，分批用 IN 查询比对已入库记录，
+        跳过任意文档中已按相同内容入库过的行，只产出新增或变更的行；
+        第一个产出的行号记在 stats['resumed_from_row']
+        """
+        batch_size = cls.CONFIG['db_batch_size']
+        texts = iter(texts)
+        while True:
+            chunk = list(islice(texts, batch_size))
+            if not chunk:
+                return
+
+            for item in chunk:
+                item['content_hash'] = cls._row_hash(item, workbook)
+
+            ingested = set()
+            if resume:
+                ingested = set(
+                    IngestedRow.objects.filter(content_hash__in=[item['content_hash'] for item in chunk])
+                    .values_list('content_hash', flat=True)
+                )
+
+            for item in chunk:
+                if item['content_hash'] in ingested:
+                    stats['skipped_rows'] += 1
+                    continue
+                if stats['resumed_from_row'] is None:
+                    stats['resumed_from_row'] = item['excel_row_index']
+                yield item
+
+    @classmethod
+    def _flush(cls, document, records, write_mode, progress=None, prune=False):
+        """
+        写入一批记录，并在同一事务内保存这些行的内容哈希和断点行号，返回耗时；
+        提取失败的行不保存内容哈希，下次处理时不会被跳过。prune 只用于批量模式，见 _plan_write
+        """
+        started = time.perf_counter()
+        metrics = current_metrics()
+        if progress and write_mode != 'row':
+            progress.set_stage('writing')
+        with db_writer_slot(), transaction.atomic():
+            if write_mode == 'row':
+                for record in records:
+                    cls._write_record(record)
+            else:
+                cls._bulk_write(records, prune)
+
+            IngestedRow.objects.bulk_create([
+                IngestedRow(
+                    document=document,
+                    excel_row_index=record['excel_row_index'],
+                    teacher_name=record['teacher_name'][:100],
+                    content_hash=record['content_hash']
+                )
+                for record in records if not record.get('failed')
+            ], batch_size=cls.CONFIG['db_batch_size'])
+
+            # 只更新断点字段，避免覆盖文档上的其他状态；同时同步到内存对象，防止之后 save() 时被旧值覆盖
+            checkpoint_row = max(record['excel_row_index'] for record in records)
+            Document.objects.filter(pk=document.pk).update(checkpoint_row=checkpoint_row)
+            document.checkpoint_row = checkpoint_row
+        elapsed = time.perf_counter() - started
+        if metrics:
+            # Neo4j 同步只写入 outbox（计入本次耗时），由后台线程在提交后执行
+            metrics.record('db_write', elapsed)
+        if progress and write_mode != 'row':
+            progress.set_stage('extracting')
+        return elapsed
+
+    @classmethod
+    def _extract_all(cls, texts, stats, guard=None):
+        """
+        并发提取实体：按窗口从 texts（可为惰性迭代器）中预读若干行，先查持久化缓存，
+        未命中的行按字符预算打包成多人批量请求，超过 llm_chunk_chars 的长简介切分为多段分别请求，
+        最多 llm_concurrency 个请求同时进行；
+        按原始行顺序逐个产出 (item, entities)，单行失败时 entities 为 None（有规则结果时为规则结果），
+        错误信息记在 item['extraction_error']，不影响其他行。
+        结束（或被提前关闭）后在 stats 中写入吞吐量、单次调用延迟分位数和缓存命中情况。
+        guard 的 LLM 调用次数预算按每行将发出的调用数预留；剩余预算不足（或超出时长预算）时，
+        之前的不需要调用 LLM 的行照常产出，遇到第一个需要调用的行时停止读取，已提交的行产出完毕后抛出 ProcessingStopped。
+        开启 use_rules 时导师行先做规则预提取，LLM 只提取规则未确定的类型，规则结果优先；
+        缓存键按实际询问 LLM 的类型计算，缓存中只保存 LLM 的结果，规则结果在取出后合并。
+        """
+        concurrency = max(1, int(cls.CONFIG['llm_concurrency']))
+        window = max(concurrency * 4, cls.CONFIG['llm_batch_max_rows'] * concurrency)
+        entity_types = cls.CONFIG['entity_types']
+        use_cache = cls.CONFIG['use_cache']
+        # 机构词典取自当前已有的机构实体，每个文档加载一次
+        rules = RuleExtractor.from_db() if cls.CONFIG['use_rules'] else None
+        texts = iter(texts)
+        pending = deque()
+        # LLM 调用预算不足、留待下次预读的行；exhausted 表示 texts 已读完
+        carry = []
+        exhausted = False
+        latencies = []
+        failed_rows = []
+        row_count = 0
+        cache_hits = 0
+        llm_rows = 0
+        chunked_rows = 0
+        rule_only_rows = 0
+        submitted_calls = 0
+        started = time.perf_counter()
+
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        try:
+            def read_ahead():
+                # 缓存查询与写入都在当前线程完成，工作线程只负责调用 LLM
+                nonlocal submitted_calls, exhausted
+                calls_left = None
+                if guard:
+                    calls_left = 0 if guard.time_exceeded() else guard.llm_calls_left(submitted_calls)
+                # 留待下次的第一行总是需要调用 LLM 的行，预算用尽时无需重新查询
+                if calls_left == 0 and carry:
+                    return
+                chunk = carry + list(islice(texts, window - len(carry)))
+                exhausted = len(chunk) < window
+                carry.clear()
+                # 规则预提取在查缓存之前：缓存键取决于规则确定之后仍需 LLM 提取的类型；
+                # 简介为空或全部类型已由规则确定的行没有缓存键
+                jobs = {}
+                keys = []
+                for item in chunk:
+                    if len(item['full_text']) <= 10 or (rules and cls._apply_rules(rules, item, jobs)):
+                        keys.append(None)
+                    else:
+                        keys.append(LLMCache.make_key(
+                            item['full_text'], item['teacher_name'], item.get('llm_types', entity_types)
+                        ))
+                cached = LLMCache.get_many([key for key in keys if key]) if use_cache else {}
+
+                misses = [item for item, key in zip(chunk, keys) if key and key not in cached]
+                chunk_chars = cls.CONFIG['llm_chunk_chars']
+                parts = {id(item): cls._split_text(item) for item in misses if len(item['full_text']) > chunk_chars}
+
+                if calls_left is not None:
+                    # 按每行将发出的调用数限制提交的行数：长简介每段一次；短简介按每行两次估算
+                    # （批量请求本身，以及批量结果缺失时回退的单行请求）。超出剩余预算的行及其后的行留到下次预读，
+                    # 之前不需要调用 LLM 的行不占预算，照常产出
+                    per_row = 2 if cls.CONFIG['llm_batch_max_rows'] > 1 else 1
+                    missing = {id(item) for item in misses}
+                    cost = 0
+                    for index, item in enumerate(chunk):
+                        if id(item) in missing:
+                            cost += len(parts[id(item)]) if id(item) in parts else per_row
+                        if cost > calls_left:
+                            carry.extend(chunk[index:])
+                            chunk, keys = chunk[:index], keys[:index]
+                            kept = {id(item) for item in chunk}
+                            misses = [item for item in misses if id(item) in kept]
+                            break
+
+                # 复制当前上下文，使工作线程中的 LLM 调用计时归入本文档
+                for batch in cls._pack_batches([item for item in misses if id(item) not in parts]):
+                    # 按最多调用次数预留预算（批量请求 + 每行回退一次），该批结果取回后按实际次数归还
+                    reserved = len(batch) + 1 if len(batch) > 1 else 1
+                    submitted_calls += reserved
+                    future = executor.submit(contextvars.copy_context().run, cls._extract_batch, batch)
+                    for pos, item in enumerate(batch):
+                        jobs[id(item)] = ('llm', (future, pos, reserved))
+                # 长简介的各分段分别提交，该行的耗时取决于最慢的一段
+                for item in misses:
+                    if id(item) not in parts:
+                        continue
+                    submitted_calls += len(parts[id(item)])
+                    jobs[id(item)] = ('chunks', [
+                        executor.submit(contextvars.copy_context().run, cls._extract_row, dict(item, full_text=part))
+                        for part in parts[id(item)]
+                    ])
+
+                for item, key in zip(chunk, keys):
+                    if key in cached:
+                        pending.append((item, key, 'cache', cached[key]))
+                    elif id(item) in jobs:
+                        pending.append((item, key) + jobs[id(item)])
+                    else:
+                        pending.append((item, key, 'skip', {}))
+
+            while True:
+                if (carry or not exhausted) and len(pending) <= window:
+                    read_ahead()
+                if not pending:
+                    break
+
+                item, key, source, payload = pending.popleft()
+                row_count += 1
+                if source == 'skip':
+                    yield item, payload
+                    continue
+                if source == 'rules':
+                    rule_only_rows += 1
+                    yield item, item['rule_entities']
+                    continue
+
+                error = None
+                if source == 'cache':
+                    cache_hits += 1
+                    entities = payload
+                elif source == 'chunks':
+                    with timed('llm_wait'):
+                        parts = [cls._wait(future, guard) for future in payload]
+                    latencies.extend(latency for _, latency, _ in parts if latency is not None)
+                    entities, error = cls._merge_entities(parts)
+                    chunked_rows += 1
+                else:
+                    future, pos, reserved = payload
+                    with timed('llm_wait'):
+                        results, call_latencies = cls._wait(future, guard)
+                    if pos == 0:
+                        # 同一批次的各行共享一次调用，耗时只计一次；归还未用到的预留次数
+                        latencies.extend(call_latencies)
+                        submitted_calls -= reserved - len(call_latencies)
+                    entities, error = results[pos]
+                if source != 'cache':
+                    llm_rows += 1
+                    if error:
+                        item['extraction_error'] = error
+                        failed_rows.append({"row": item['excel_row_index'], "teacher_name": item['teacher_name'], "error": error})
+                    elif use_cache:
+                        LLMCache.put(key, item['teacher_name'], cls._requested_types(item, entities))
+                if 'rule_entities' in item:
+                    # LLM 未被询问规则已确定的类型，以规则结果为准；LLM 失败时仍保留规则结果
+                    entities = dict(entities or {}, **item['rule_entities'])
+                yield item, entities
+
+            if carry or (not exhausted and next(texts, None) is not None):
+                raise guard.budget_error()
+        finally:
+            # 正常结束时所有批次均已完成；提前关闭（取消 / 超出预算）时丢弃尚未开始的批次，不等待进行中的调用
+            executor.shutdown(wait=False, cancel_futures=True)
+            if use_cache:
+                LLMCache.evict()
+            elapsed = time.perf_counter() - started
+            stats.update({
+                "concurrency": concurrency,
+                "llm_calls": len(latencies),
+                "rows_per_call": round(llm_rows / len(latencies), 2) if latencies else None,
+                "cache_hits": cache_hits,
+                "cache_misses": llm_rows,
+                "chunked_rows": chunked_rows,
+                "rule_only_rows": rule_only_rows,
+                "failed_count": len(failed_rows),
+                "failed_rows": failed_rows[:20],
+                "elapsed_seconds": round(elapsed, 3),
+                "rows_per_second": round(row_count / elapsed, 3) if elapsed > 0 else None,
+                "latency_seconds": {
+                    "p50": percentile(latencies, 50),
+                    "p90": percentile(latencies, 90),
+                    "p99": percentile(latencies, 99),
+                    "max": round(max(latencies), 3) if latencies else None,
+                },
+            })
+
+    @classmethod
+    def _wait(cls, future, guard=None):
+        """
+        等待工作线程的提取结果，期间每隔 CANCEL_POLL_INTERVAL 秒由 guard 检查取消与时长预算，
+        Ollama 请求卡住时也能及时停止（卡住的请求最多占用槽位 LLM_REQUEST_TIMEOUT 秒）
+        """
+        while True:
+            try:
+                return future.result(timeout=JobGuard.CANCEL_POLL_INTERVAL)
+            except FutureTimeoutError:
+                if guard:
+                    guard.check()
+
+    @classmethod
+    def _apply_rules(cls, rules, item, jobs):
+        """
+        对导师行做规则预提取，结果记在 item['rule_entities']，仍需 LLM 提取的类型记在 item['llm_types']；
+        所有类型都已确定时登记为 'rules' 任务并返回 True（该行不再请求 LLM）。章节记录不适用规则
+        """
+        if item.get('entity_type', 'person') != 'person':
+            return False
+        with timed('rules'):
+            item['rule_entities'], item['llm_types'] = rules.extract(
+                item['full_text'], item['teacher_name'], cls.CONFIG['entity_types']
+            )
+        if item['llm_types']:
+            return False
+        jobs[id(item)] = ('rules', None)
+        return True
+
+    @staticmethod
+    def _requested_types(item, entities):
+        """
+        LLM 结果中该行实际询问的类型（缓存键按这些类型计算）；
+        批量请求按各行剩余类型的并集询问，其余类型不属于该行的请求，不写入缓存
+        """
+        if 'llm_types' not in item or not isinstance(entities, dict):
+            return entities
+        return {ent_type: values for ent_type, values in entities.items() if ent_type in item['llm_types']}
+
+    @classmethod
+    def _llm_types(cls, items):
+        """一次请求需要提取的实体类型：各行剩余类型的并集，按 CONFIG 中的顺序"""
+        wanted = set()
+        for item in items:
+            wanted.update(item.get('llm_types', cls.CONFIG['entity_types']))
+        return [ent_type for ent_type in cls.CONFIG['entity_types'] if ent_type in wanted]
+
+    @classmethod
+    def _pack_batches(cls, items):
+        """
+        按原始顺序把待提取的行打包：每批文本总长不超过 llm_batch_chars、行数不超过 llm_batch_max_rows，
+        同一批内导师姓名不重复（批量结果按姓名拆分）
+        """
+        budget = cls.CONFIG['llm_batch_chars']
+        max_rows = max(1, cls.CONFIG['llm_batch_max_rows'])
+        batch, size, names = [], 0, set()
+        for item in items:
+            length = len(item['full_text'])
+            if batch and (len(batch) >= max_rows or size + length > budget or item['teacher_name'] in names):
+                yield batch
+                batch, size, names = [], 0, set()
+            batch.append(item)
+            size += length
+            names.add(item['teacher_name'])
+        if batch:
+            yield batch
+
+    @classmethod
+    def _split_text(cls, item):
+        """
+        将长简介按句子边界（。；换行）切分为不超过 llm_chunk_chars 的分段，相邻分段重叠约 llm_chunk_overlap 个字符，
+        避免跨句的实体被切断；第一段之后的分段补上导师姓名（或章节标题）作为上下文
+        """
+        limit = cls.CONFIG['llm_chunk_chars']
+        overlap = min(cls.CONFIG['llm_chunk_overlap'], limit // 2)
+        entity_type = item.get('entity_type', 'person')
+        prefix = cls._text_prefix(item['teacher_name'], entity_type)
+        text = item['full_text']
+        if text.startswith(prefix):
+            text = text[len(prefix):]
+
+        sentences = []
+        for sentence in re.findall(r'[^。；\n]+[。；\n]*', text):
+            # 单句超长时按字符硬切
+            sentences.extend(sentence[i:i + limit] for i in range(0, len(sentence), limit))
+
+        chunks = []
+        window, size = [], 0
+        for sentence in sentences:
+            if window and size + len(sentence) > limit:
+                chunks.append("".join(window))
+                # 保留上一段末尾若干句作为下一段的开头
+                kept, kept_size = [], 0
+                for prev in reversed(window):
+                    if kept_size + len(prev) > overlap:
+                        break
+                    kept.insert(0, prev)
+                    kept_size += len(prev)
+                window, size = kept, kept_size
+            window.append(sentence)
+            size += len(sentence)
+        if window:
+            chunks.append("".join(window))
+
+        return [
+            f"{cls._text_prefix(item['teacher_name'], entity_type, continued=index > 0)}{chunk}"
+            for index, chunk in enumerate(chunks)
+        ]
+
+    @staticmethod
+    def _merge_entities(parts):
+        """
+        合并同一行各分段的提取结果 [(entities, 耗时, 错误信息), ...]：按类型拼接并去重（保持首次出现的顺序）。
+        任一分段失败时返回错误信息（该行结果不写入缓存），全部失败时实体为 None
+        """
+        merged = {}
+        errors = []
+        for entities, _, error in parts:
+            if error:
+                errors.append(error)
+                continue
+            for ent_type, values in (entities or {}).items():
+                if not isinstance(values, list):
+                    values = [values]
+                bucket = merged.setdefault(ent_type, [])
+                for value in values:
+                    if value not in bucket:
+                        bucket.append(value)
+
+        if len(errors) == len(parts):
+            return None, errors[0]
+        return merged, "; ".join(errors) or None
+
+    @classmethod
+    def _extract_batch(cls, batch):
+        """
+        在工作线程中提取一批行：多行时先发一次批量请求，结果中缺失或无法解析的行回退为单行请求。
+        返回 ([(entities, 错误信息), ...], [每次 LLM 调用的耗时])
+        """
+        if len(batch) == 1:
+            entities, latency, error = cls._extract_row(batch[0])
+            return [(entities, error)], [latency] if latency is not None else []
+
+        started = time.perf_counter()
         try:
-            from openpyxl import load_workbook
-            wb = load_workbook(file_path)
-            ws = wb.active
-            for img in getattr(ws, '_images', []):
-                # openpyxl row从0开始计数(旧版)或从1开始(新版)，需要根据版本确认
-                # 通常 anchor._from.row 是 0-indexed 的，所以行号 = value + 1
-                row_idx = img.anchor._from.row + 1
-                col_idx = img.anchor._from.col + 1
-                # 假设图片在第1列
-                if col_idx == 1:
-                    images_map[row_idx] = img
+            result = LLMBridge.extract_entities_batch(
+                [(item['teacher_name'], item['full_text']) for item in batch],
+                cls._llm_types(batch)
+            )
         except Exception as e:
-            print(f"Warning: Could not extract images from excel: {e}")
-        return images_map
+            print(f"Batch extraction failed: {e}")
+            result = None
+        latencies = [time.perf_counter() - started]
+
+        results = []
+        for item in batch:
+            entities = (result or {}).get(item['teacher_name'])
+            if isinstance(entities, dict):
+                results.append((entities, None))
+                continue
+            entities, latency, error = cls._extract_row(item)
+            if latency is not None:
+                latencies.append(latency)
+            results.append((entities, error))
+        return results, latencies
 
     @classmethod
-    def save_excel_image(cls, image, teacher_name, row_num):
-        """保存Excel中的图片到媒体目录"""
+    def _extract_row(cls, item):
+        """在工作线程中提取单行实体，返回 (entities, 耗时, 错误信息)"""
+        # 只有当简介不为空时才进行提取
+        if len(item['full_text']) <= 10:
+            return {}, None, None
+
+        started = time.perf_counter()
         try:
-            image_dir = os.path.join(settings.MEDIA_ROOT, 'teacher_photos')
-            os.makedirs(image_dir, exist_ok=True)
-            
-            # 生成安全的文件名
-            if teacher_name and teacher_name.strip():
-                safe_name = re.sub(r'[^\w\s-]', '', teacher_name).strip()
-                filename = f"{safe_name}.png"
-            else:
-                filename = f"teacher_row_{row_num}.png"
-            
-            image_path = os.path.join(image_dir, filename)
+            entities = LLMBridge.extract_entities(item['full_text'], item['teacher_name'], cls._llm_types([item]))
+            return entities, time.perf_counter() - started, None
+        except Exception as e:
+            print(f"Extraction failed for {item['teacher_name']}: {e}")
+            return None, time.perf_counter() - started, str(e)
+
+    @classmethod
+    def _write_record(cls, record):
+        """逐行写入一位导师及其三元组（每条语句单独提交）"""
+        Entity.objects.update_or_create(
+            name=record['teacher_name'],
+            defaults=record['defaults']
+        )
+        for head, relation, tail in record['triples']:
+            cls._save_triple(head, relation, tail)
+
+    @classmethod
+    def _plan_write(cls, records, prune=False):
+        """
+        根据一批行与当前数据计算写入计划（只读，不修改数据库）：按名称在内存中归并人物、尾实体和关系，
+        用少量 IN 查询解析已有数据。计划与逐行执行 _write_record 的结果相同：
+        - 人物字段按行顺序覆盖（同 update_or_create）
+        - 尾实体只在不存在时创建，类型按首次出现推断（同 get_or_create）
+        - 同一对 (源, 目标) 只保留一条关系，类型以最后一次为准（同 update_or_create）
+        prune=True 时还计算需要删除的数据：这些人物已有、但本批不再产生的关系，以及因此不再有任何关系的非人物实体；
+        只裁剪所有行都实际完成提取（record['extracted']）的人物，提取失败或未提取的行没有完整的关系列表
+        """
+        batch_size = cls.CONFIG['db_batch_size']
+
+        persons = {}
+        tails = {}
+        relations = {}
+        for record in records:
+            persons.setdefault(record['teacher_name'], {}).update(record['defaults'])
+            for head, relation, tail in record['triples']:
+                tails.setdefault(tail, relation)
+                relations[(head, tail)] = relation
+        pruned = set(persons) - {record['teacher_name'] for record in records if not record.get('extracted')}
+        # 尾实体类型按首次出现时的关系推断，整批一次分类
+        tails = dict(zip(tails, entity_classifier.classify_many(tails.items())))
+
+        # 1. 解析已有实体（同名多条时取最早创建的一条）
+        entities = {}
+        names = list(set(persons) | set(tails) | {head for head, _ in relations})
+        for chunk in _chunks(names, batch_size):
+            for ent in Entity.objects.filter(name__in=chunk).order_by('id'):
+                entities.setdefault(ent.name, ent)
+
+        created_entities = []
+        updated_entities = []
+        entity_changes = {}
+        for name, defaults in persons.items():
+            ent = entities.get(name)
+            if ent is None:
+                ent = Entity(name=name, **defaults)
+                entities[name] = ent
+                created_entities.append(ent)
+                continue
+            changes = {
+                field: [getattr(ent, field), value]
+                for field, value in defaults.items() if getattr(ent, field) != value
+            }
+            if changes:
+                for field, value in defaults.items():
+                    setattr(ent, field, value)
+                updated_entities.append(ent)
+                entity_changes[name] = changes
+
+        for name, ent_type in tails.items():
+            if name not in entities:
+                ent = Entity(name=name, entity_type=ent_type)
+                entities[name] = ent
+                created_entities.append(ent)
+
+        for head, _ in relations:
+            if head not in entities:
+                ent = Entity(name=head, entity_type='person')
+                entities[head] = ent
+                created_entities.append(ent)
+
+        # 2. 解析已有关系（按源实体 IN 查询，新实体不可能已有关系）
+        existing = {}
+        stale_relations = []
+        source_ids = {entities[head].id for head, _ in relations if entities[head].id}
+        if prune:
+            source_ids |= {entities[name].id for name in pruned if entities[name].id}
+        by_id = {ent.id: ent for ent in entities.values() if ent.id}
+        for chunk in _chunks(list(source_ids), batch_size):
+            rels = (
+                Relationship.objects.filter(source_entity_id__in=chunk)
+                .select_related('source_entity', 'target_entity').order_by('id')
+            )
+            for rel in rels:
+                source = by_id[rel.source_entity_id]
+                key = (source.name, rel.target_entity.name)
+                if key in relations and key not in existing and by_id.get(rel.target_entity_id) is entities[key[1]]:
+                    existing[key] = rel
+                elif prune and source.name in pruned:
+                    stale_relations.append(rel)
+
+        created_relations = [key for key in relations if key not in existing]
+        updated_relations = [
+            (key, rel) for key, rel in existing.items() if rel.relationship_type != relations[key]
+        ]
+
+        return {
+            "entities": entities,
+            "created_entities": created_entities,
+            "updated_entities": updated_entities,
+            "entity_changes": entity_changes,
+            "relations": relations,
+            "created_relations": created_relations,
+            "updated_relations": updated_relations,
+            "stale_relations": stale_relations,
+            "orphan_entities": cls._find_orphans(stale_relations, set(tails)) if prune else [],
+        }
+
+    @classmethod
+    def _find_orphans(cls, stale_relations, kept_names):
+        """删除 stale_relations 后不再有任何关系、且不是人物的目标实体"""
+        batch_size = cls.CONFIG['db_batch_size']
+        candidates = {
+            rel.target_entity_id: rel.target_entity for rel in stale_relations
+            if rel.target_entity.entity_type != 'person' and rel.target_entity.name not in kept_names
+        }
+        stale_ids = [rel.id for rel in stale_relations]
+        linked = set()
+        for chunk in _chunks(list(candidates), batch_size):
+            remaining = Relationship.objects.exclude(id__in=stale_ids).filter(
+                Q(source_entity_id__in=chunk) | Q(target_entity_id__in=chunk)
+            ).values_list('source_entity_id', 'target_entity_id')
+            for source_id, target_id in remaining:
+                linked.update((source_id, target_id))
+        return [ent for ent_id, ent in candidates.items() if ent_id not in linked]
+
+    @classmethod
+    def _bulk_write(cls, records, prune=False):
+        """
+        批量写入一批行：由 _plan_write 计算计划，再在单个事务内 bulk_create / bulk_update，
+        prune=True 时同时删除计划中的过期关系与孤立实体
+        """
+        batch_size = cls.CONFIG['db_batch_size']
+
+        with transaction.atomic():
+            plan = cls._plan_write(records, prune)
+            entities = plan['entities']
+            created_entities = plan['created_entities']
+            updated_entities = plan['updated_entities']
+
+            Entity.objects.bulk_create(created_entities, batch_size=batch_size)
+            if any(ent.pk is None for ent in created_entities):
+                # 数据库不支持 bulk_create 回填主键时，按名称重新取回
+                _refetch_pks(created_entities, batch_size)
+            Entity.objects.bulk_update(
+                updated_entities, ['entity_type', 'description', 'photo_url'], batch_size=batch_size
+            )
+
+            created_relations = [
+                Relationship(
+                    source_entity=entities[head],
+                    target_entity=entities[tail],
+                    relationship_type=plan['relations'][(head, tail)]
+                )
+                for head, tail in plan['created_relations']
+            ]
+            updated_relations = []
+            for key, rel in plan['updated_relations']:
+                rel.relationship_type = plan['relations'][key]
+                updated_relations.append(rel)
+
+            Relationship.objects.bulk_create(created_relations, batch_size=batch_size)
+            Relationship.objects.bulk_update(updated_relations, ['relationship_type'], batch_size=batch_size)
+
+            # 删除逐条发送 post_delete 信号，由信号负责同步删除 Neo4j 中的节点和关系
+            for chunk in _chunks([rel.id for rel in plan['stale_relations']], batch_size):
+                Relationship.objects.filter(id__in=chunk).delete()
+            for chunk in _chunks([ent.id for ent in plan['orphan_entities']], batch_size):
+                Entity.objects.filter(id__in=chunk).delete()
+
+            # bulk_* 不会触发 post_save 信号，需要显式登记 Neo4j 同步（事务提交后执行）
+            sync_bulk_to_neo4j(created_entities, updated_entities, created_relations, updated_relations)
+
+    @classmethod
+    def _diff_records(cls, records):
+        """
+        预览模式：计算这些行相对当前图谱的变更（实体与关系的新增、修改、删除），不写入任何数据。
+        删除只针对表中出现、且已完成提取的人物：其已有但表中不再产生的关系，以及因此孤立的非人物实体。
+        """
+        plan = cls._plan_write(records, prune=True)
+        relations = plan['relations']
+        diff = {
+            "entities": {
+                "added": [{"name": ent.name, "entity_type": ent.entity_type} for ent in plan['created_entities']],
+                "changed": [{"name": name, "changes": changes} for name, changes in plan['entity_changes'].items()],
+                "removed": [{"name": ent.name, "entity_type": ent.entity_type} for ent in plan['orphan_entities']],
+            },
+            "relationships": {
+                "added": [[head, relations[(head, tail)], tail] for head, tail in plan['created_relations']],
+                "changed": [
+                    {"head": head, "tail": tail, "from": rel.relationship_type, "to": relations[(head, tail)]}
+                    for (head, tail), rel in plan['updated_relations']
+                ],
+                "removed": [
+                    [rel.source_entity.name, rel.relationship_type, rel.target_entity.name]
+                    for rel in plan['stale_relations']
+                ],
+            },
+        }
+        diff["counts"] = {
+            f"{kind}_{change}": len(items)
+            for kind in ("entities", "relationships")
+            for change, items in diff[kind].items()
+        }
+        return diff
+
+    @classmethod
+    def save_excel_image(cls, image_data, teacher_name, row_num):
+        """保存Excel中的图片（二进制内容）到媒体目录"""
+        try:
+            photo_path = cls._photo_path(teacher_name, row_num)
+            image_path = os.path.join(settings.MEDIA_ROOT, photo_path)
+            os.makedirs(os.path.dirname(image_path), exist_ok=True)
             
             with open(image_path, 'wb') as f:
-                f.write(image._data())
+                f.write(image_data)
             
-            return f'teacher_photos/{filename}'
+            return photo_path
         except Exception as e:
             print(f"Save image error: {e}")
             return ""
 
+    @classmethod
+    def _photo_path(cls, teacher_name, row_num):
+        """教师照片相对媒体目录的保存路径"""
+        # 生成安全的文件名
+        if teacher_name and teacher_name.strip():
+            safe_name = re.sub(r'[^\w\s-]', '', teacher_name).strip()
+            filename = f"{safe_name}.png"
+        else:
+            filename = f"teacher_row_{row_num}.png"
+        return f'teacher_photos/{filename}'
+
+    @classmethod
+    def _iter_excel_rows(cls, workbook):
+        """流式读取Excel：openpyxl 只读模式逐行产出，峰值内存与行数无关"""
+        rows = workbook.iter_rows()
+        header = next(rows, None)
+        if header is None:
+            return
+
+        columns = ["" if c is None else str(c) for c in header]
+        name_col, intro_col = cls._match_columns(columns)
+        if not name_col or not intro_col:
+            print(f"Excel columns missing required fields. Found: {columns}")
+            return
+        name_idx = columns.index(name_col)
+        intro_idx = columns.index(intro_col)
+
+        for row_idx, row in enumerate(rows, start=2): # Header is row 1
+            name = row[name_idx] if name_idx < len(row) else None
+            intro = row[intro_idx] if intro_idx < len(row) else None
+            item = cls._build_item(
+                "" if name is None else str(name),
+                "" if intro is None else str(intro),
+                row_idx
+            )
+            if item:
+                yield item
+
+    @classmethod
+    def _match_columns(cls, columns):
+        """模糊匹配列名，返回 (姓名列, 介绍列)"""
+        name_col = next((c for c in columns if any(k in c for k in ["姓名", "导师姓名"])), None)
+        intro_col = next((c for c in columns if any(k in c for k in ["个人介绍", "详细介绍", "简介", "基本情况", "详细内容", "介绍"])), None)
+        return name_col, intro_col
+
+    @classmethod
+    def _iter_text_records(cls, file_path):
+        """PDF / Word：流式读取文本块并按人物或章节分段，每段作为一条待处理记录（行号为段的序号）"""
+        blocks = iter_text_blocks(file_path, pdf_workers=cls.CONFIG['pdf_workers'])
+        for index, segment in enumerate(segment_blocks(blocks), start=1):
+            if segment['kind'] == 'person':
+                entity_type = 'person'
+            elif segment['text']:
+                # 章节标题作为头实体，类型按标题关键词推断（如“xx学院”为机构）
+                entity_type = entity_classifier.classify(segment['title'])
+            else:
+                continue
+            # 整段提取，不按 max_text_length 截断：长段由 _split_text 分段提取
+            item = cls._build_item(segment['title'], segment['text'], index, entity_type, truncate=False)
+            if item:
+                item['source_page'] = segment['page']
+                yield item
+
+    @classmethod
+    def _build_item(cls, name, intro, row_index, entity_type='person', truncate=True):
+        """由单行的姓名与介绍构造待处理条目，姓名为空时返回 None；truncate 时提取文本截断为 max_text_length"""
+        name = name.strip().replace(" ", "")
+        intro = intro.strip()
+
+        if not name or name == "nan":
+            return None
+
+        full_text = f"{cls._text_prefix(name, entity_type)}{intro[:cls.CONFIG['max_text_length']] if truncate else intro}"
+        # 简单清洗
+        full_text = re.sub(r"\d{4}年|\d月生|男|女|邮箱：.*?[，。]", "", full_text)
+
+        item = {
+            "teacher_name": name,
+            "full_text": full_text,
+            "intro": intro,
+            "excel_row_index": row_index
+        }
+        if entity_type != 'person':
+            item['entity_type'] = entity_type
+        return item
+
+    @staticmethod
+    def _text_prefix(name, entity_type='person', continued=False):
+        """提取文本的开头：人物为姓名与介绍，章节为标题与正文"""
+        if entity_type == 'person':
+            return f"导师姓名：{name}；个人介绍{'（续）' if continued else ''}："
+        return f"标题：{name}；内容{'（续）' if continued else ''}："
+
     @classmethod
     def _read_excel(cls, file_path):
-        """读取Excel文件内容"""
+        """读取Excel文件内容（pandas 整表读取，用于 .xls 及基准对比）"""
         try:
             # 优先使用 pandas 读取数据
             df = pd.read_excel(file_path)
             
             # 模糊匹配列名
             columns = [str(c) for c in df.columns]
-            name_col = next((c for c in columns if any(k in c for k in ["姓名", "导师姓名"])), None)
-            intro_col = next((c for c in columns if any(k in c for k in ["个人介绍", "详细介绍", "简介", "基本情况", "详细内容", "介绍"])), None)
+            name_col, intro_col = cls._match_columns(columns)
             
             if not name_col or not intro_col:
                 print(f"Excel columns missing required fields. Found: {columns}")
@@ -187,22 +1275,9 @@ class DocumentProcessor:
             results = []
             df = df.fillna("")
             for idx, row in df.iterrows():
-                name = str(row[name_col]).strip().replace(" ", "")
-                intro = str(row[intro_col]).strip()
-                
-                if not name or name == "nan":
-                    continue
-                    
-                full_text = f"导师姓名：{name}；个人介绍：{intro[:cls.CONFIG['max_text_length']]}"
-                # 简单清洗
-                full_text = re.sub(r"\d{4}年|\d月生|男|女|邮箱：.*?[，。]", "", full_text)
-                
-                results.append({
-                    "teacher_name": name,
-                    "full_text": full_text,
-                    "intro": intro,
-                    "excel_row_index": idx + 2 # Header is row 1
-                })
+                item = cls._build_item(str(row[name_col]), str(row[intro_col]), idx + 2) # Header is row 1
+                if item:
+                    results.append(item)
             return results
         except Exception as e:
             print(f"Read Excel error: {e}")
@@ -231,20 +1306,9 @@ class DocumentProcessor:
                 defaults={'entity_type': 'person'}
             )
             
-            # Simple Entity Type Inference
-            tgt_type = 'event' # Default fallback
-            tail_lower = tail.lower()
-            
-            if any(k in tail_lower for k in ['大学', '学院', '系', '所', '中心', '实验室', '委员会', '学会']):
-                tgt_type = 'organization'
-            elif any(k in tail_lower for k in ['省', '市', '区', '路', '街', 'building', '室']):
-                tgt_type = 'location'
-            elif relation in ['主讲', '研究']:
-               tgt_type = 'subject'
-
             tgt, _ = Entity.objects.get_or_create(
                 name=tail, 
-                defaults={'entity_type': tgt_type}
+                defaults={'entity_type': entity_classifier.classify(tail, relation)}
             )
             
             # 修改逻辑：只要源和目标相同，就更新关系类型，而不是新建
@@ -256,3 +1320,30 @@ class DocumentProcessor:
             )
         except Exception as e:
             print(f"Save triple error: {e}")
+
+
+def _chunks(items, size):
+    """按固定大小切分列表"""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _timed_iter(iterable, stage):
+    """逐个取值时计时，用于统计惰性读取的耗时"""
+    iterator = iter(iterable)
+    while True:
+        with timed(stage):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def _refetch_pks(entities, batch_size):
+    """为未回填主键的实体按名称补齐 id"""
+    missing = {ent.name: ent for ent in entities if ent.pk is None}
+    names = list(missing)
+    for chunk in _chunks(names, batch_size):
+        for pk, name in Entity.objects.filter(name__in=chunk).order_by('id').values_list('id', 'name'):
+            missing[name].pk = pk
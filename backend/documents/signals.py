@@ -1,14 +1,28 @@
 import os
-from django.db.models.signals import post_delete
+from django.db.models.signals import post_delete, pre_save
 from django.dispatch import receiver
 from .models import Document
+from .row_cache import remove_row_caches
+from .uploads import uploaded_file_sha256
+
+@receiver(pre_save, sender=Document)
+def set_content_hash(sender, instance, **kwargs):
+    """
+    保存新上传（或替换）的文件时记录其内容哈希（API 与管理后台上传都会经过这里）
+    """
+    if instance.file and not instance.file._committed:
+        instance.content_hash = uploaded_file_sha256(instance.file.file)
 
 @receiver(post_delete, sender=Document)
 def auto_delete_file_on_delete(sender, instance, **kwargs):
     """
-    当删除 Document 记录时，自动从硬盘删除对应的文件
+    当删除 Document 记录时，自动从硬盘删除对应的文件及其行缓存
+    重复上传时可能与其他文档共用同一个文件，仍有文档引用时保留文件
     """
     if instance.file:
+        if Document.objects.filter(file=instance.file.name).exists():
+            return
+        remove_row_caches(instance.file.path)
         if os.path.isfile(instance.file.path):
             try:
                 os.remove(instance.file.path)
@@ -1,3 +1,366 @@
-from django.test import TestCase
+import multiprocessing
+import tempfile
+from unittest import mock
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from knowledge_graph.models import Entity, Relationship
+from users.models import CustomUser
+from services.llm_cache import LLMCache
+from services.rule_extractor import RuleExtractor
+from .models import Document, ExtractionCache, IngestedRow, UploadSession
+from .uploads import file_sha256
+from .scheduler import enqueue_documents, run_document_scheduler
+from services.metrics import PipelineMetrics
+from .services import DocumentProcessor, JobGuard, ProcessingStopped, _run_document_task
+from .text_reader import segment_blocks
 
-# Create your tests here.
+
+def _record(name, description, triples, row, extracted=True, failed=False):
+    return {
+        "teacher_name": name,
+        "defaults": {'entity_type': 'person', 'description': description},
+        "triples": triples,
+        "excel_row_index": row,
+        "content_hash": f"hash-{row}",
+        "has_image": False,
+        "failed": failed,
+        "extracted": extracted,
+    }
+
+
+def _pdf_bytes(pages):
+    """构造只含文本层的 PDF：每页为若干行文字，使用 Adobe 预置的 CJK 字体与 UCS-2 编码，无需嵌入字体"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type0 /BaseFont /STSong-Light /Encoding /UniGB-UCS2-H /DescendantFonts [4 0 R] >>",
+        b"<< /Type /Font /Subtype /CIDFontType0 /BaseFont /STSong-Light"
+        b" /CIDSystemInfo << /Registry (Adobe) /Ordering (GB1) /Supplement 2 >> >>",
+    ]
+    kids = []
+    for lines in pages:
+        content = ("BT /F1 10 Tf 40 800 Td 14 TL " + " ".join(
+            f"<{line.encode('utf-16-be').hex()}> Tj T*" for line in lines
+        ) + " ET").encode('ascii')
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842]"
+            b" /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects)
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+
+    data = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(data)
+
+
+class WritePathTests(TestCase):
+    """批量写入（_bulk_write）与逐行写入（_write_record）的结果一致，以及预览 / 应用共用的 _plan_write"""
+
+    def setUp(self):
+        user = CustomUser.objects.create_user(username='tester', password='x')
+        self.document = Document.objects.create(title='t', file='documents/t.xlsx', file_type='excel', uploader=user)
+        zhang = Entity.objects.create(name='张三', entity_type='person', description='旧简介')
+        college = Entity.objects.create(name='计算机学院', entity_type='organization')
+        award = Entity.objects.create(name='青年教师奖', entity_type='event')
+        # 已有关系：类型会被表中的“属于”覆盖
+        Relationship.objects.create(source_entity=zhang, target_entity=college, relationship_type='研究')
+        # 表中不再产生的关系，只在 prune 时删除
+        Relationship.objects.create(source_entity=zhang, target_entity=award, relationship_type='获得')
+
+        self.records = [
+            _record('张三', '新简介', [('张三', '属于', '计算机学院'), ('张三', '研究', '人工智能')], 2),
+            _record('李四', '李四简介', [('李四', '属于', '计算机学院'), ('李四', '毕业于', '清华大学')], 3),
+            # 同一人物的后一行：简介按行顺序覆盖，同一对 (源, 目标) 的关系类型以最后一次为准
+            _record('张三', '更新的简介', [('张三', '主讲', '人工智能')], 4),
+        ]
+
+    def _graph(self):
+        entities = set(Entity.objects.values_list('name', 'entity_type', 'description'))
+        relations = sorted(
+            Relationship.objects.values_list('source_entity__name', 'relationship_type', 'target_entity__name')
+        )
+        return entities, relations
+
+    def _graph_after(self, write_mode):
+        """在保存点内写入并读取结果，结束后回滚，两种模式从相同的初始数据开始"""
+        with transaction.atomic():
+            DocumentProcessor._flush(self.document, self.records, write_mode)
+            graph = self._graph()
+            transaction.set_rollback(True)
+        return graph
+
+    def test_bulk_and_row_writes_produce_same_graph(self):
+        bulk = self._graph_after('bulk')
+        row = self._graph_after('row')
+        self.assertEqual(bulk, row)
+
+        entities, relations = bulk
+        self.assertIn(('张三', 'person', '更新的简介'), entities)
+        self.assertIn(('清华大学', 'organization', ''), entities)
+        self.assertEqual(relations, [
+            ('张三', '主讲', '人工智能'),
+            ('张三', '属于', '计算机学院'),
+            ('张三', '获得', '青年教师奖'),
+            ('李四', '属于', '计算机学院'),
+            ('李四', '毕业于', '清华大学'),
+        ])
+
+    def test_plan_write_is_read_only(self):
+        before = self._graph()
+        plan = DocumentProcessor._plan_write(self.records, prune=True)
+        self.assertEqual(self._graph(), before)
+
+        self.assertEqual(
+            sorted(ent.name for ent in plan['created_entities']), ['人工智能', '李四', '清华大学']
+        )
+        self.assertEqual(plan['entity_changes'], {'张三': {'description': ['旧简介', '更新的简介']}})
+        self.assertEqual([key for key, _ in plan['updated_relations']], [('张三', '计算机学院')])
+        self.assertEqual(
+            [(rel.source_entity.name, rel.target_entity.name) for rel in plan['stale_relations']],
+            [('张三', '青年教师奖')]
+        )
+        self.assertEqual([ent.name for ent in plan['orphan_entities']], ['青年教师奖'])
+
+    def test_bulk_write_prune_matches_diff(self):
+        counts = DocumentProcessor._diff_records(self.records)['counts']
+        self.assertEqual(counts['relationships_removed'], 1)
+        self.assertEqual(counts['entities_removed'], 1)
+
+        DocumentProcessor._bulk_write(self.records, prune=True)
+        _, relations = self._graph()
+        self.assertNotIn(('张三', '获得', '青年教师奖'), relations)
+        self.assertFalse(Entity.objects.filter(name='青年教师奖').exists())
+
+    def test_prune_skips_persons_not_extracted(self):
+        # 张三的某一行提取失败：不知道其完整的关系列表，不删除其已有关系
+        records = self.records[:2] + [_record('张三', '更新的简介', [], 4, extracted=False, failed=True)]
+        plan = DocumentProcessor._plan_write(records, prune=True)
+        self.assertEqual(plan['stale_relations'], [])
+        self.assertEqual(plan['orphan_entities'], [])
+
+    def test_failed_rows_are_not_marked_ingested(self):
+        records = self.records[:2] + [_record('王五', '王五简介', [], 5, extracted=False, failed=True)]
+        DocumentProcessor._flush(self.document, records, 'bulk')
+        self.assertEqual(
+            sorted(IngestedRow.objects.filter(document=self.document).values_list('content_hash', flat=True)),
+            ['hash-2', 'hash-3']
+        )
+        self.assertTrue(Entity.objects.filter(name='王五').exists())
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.checkpoint_row, 5)
+
+
+class DocumentTaskTests(TestCase):
+    """后台任务结束时只保存自己负责的字段"""
+
+    def test_concurrent_edits_are_kept(self):
+        user = CustomUser.objects.create_user(username='tester', password='x')
+        document = Document.objects.create(title='t', file='documents/t.xlsx', file_type='excel', uploader=user)
+
+        def run(doc):
+            # 处理期间其他请求修改了优先级
+            Document.objects.filter(pk=doc.pk).update(priority=9)
+            return {"processed_count": 0}
+
+        _run_document_task(document.id, run, 'processed')
+        document.refresh_from_db()
+        self.assertEqual((document.status, document.priority), ('processed', 9))
+        self.assertEqual(document.processed_data, {"processed_count": 0})
+
+
+class ExtractionCacheTests(TestCase):
+    """提取缓存只保存 LLM 对所询问类型的结果，规则预提取的结果在读取缓存后合并"""
+
+    TEXT = "导师姓名：张三；个人介绍：张三，计算机学院教授，主要从事机器学习方向的研究。"
+
+    def _extract(self, llm_result):
+        item = {"teacher_name": '张三', "full_text": self.TEXT, "intro": self.TEXT, "excel_row_index": 2}
+        with mock.patch.dict(DocumentProcessor.CONFIG, llm_batch_max_rows=1), \
+                mock.patch('services.llm_bridge.LLMBridge.extract_entities', return_value=llm_result) as extract:
+            [(item, entities)] = DocumentProcessor._extract_all([item], {})
+        return item, entities, extract
+
+    def test_cache_holds_llm_output_only(self):
+        # LLM 对未询问的类型也给出了结果（例如批量请求中其他行的类型），不应写入缓存
+        item, entities, extract = self._extract({"研究方向": ["机器学习"], "职称": ["副教授"]})
+        requested = extract.call_args.args[2]
+        self.assertNotIn("职称", requested)
+        self.assertEqual(entities["职称"], ["教授"])
+        self.assertEqual(entities["研究方向"], ["机器学习"])
+
+        [cached] = ExtractionCache.objects.values_list('key', 'result')
+        self.assertEqual(cached, (LLMCache.make_key(self.TEXT, '张三', requested), {"研究方向": ["机器学习"]}))
+
+        # 再次处理命中缓存，不调用 LLM，规则结果重新合并
+        _, again, extract = self._extract(None)
+        extract.assert_not_called()
+        self.assertEqual(again, entities)
+
+
+class RuleExtractorTitleTests(TestCase):
+    """规则只取导师本人的职称，其他人的职称不计入（留给 LLM）"""
+
+    def setUp(self):
+        self.rules = RuleExtractor()
+
+    def _titles(self, text):
+        resolved, remaining = self.rules.extract(text, '李四', ["职称"])
+        return resolved.get("职称"), remaining
+
+    def test_own_titles(self):
+        self.assertEqual(self._titles("李四，男，计算机学院教授、博士生导师。"), (["教授", "博士生导师"], []))
+        self.assertEqual(self._titles("李四现任清华大学计算机系副研究员。"), (["副研究员"], []))
+        self.assertEqual(self._titles("李四，2001年晋升为教授。"), (["教授"], []))
+
+    def test_other_persons_titles_are_ignored(self):
+        self.assertEqual(self._titles("李四，男，师从张三教授，从事机器学习研究。"), (None, ["职称"]))
+        self.assertEqual(self._titles("李四在王五教授指导下完成博士学位。"), (None, ["职称"]))
+        self.assertEqual(self._titles("李四曾与赵六研究员合作。"), (None, ["职称"]))
+        # 同一句中既有导师的职称又有他人的职称时，只取本人分句中的
+        self.assertEqual(self._titles("李四，师从张三教授，现为计算机学院副教授。"), (["副教授"], []))
+
+
+@mock.patch.dict(DocumentProcessor.CONFIG, llm_concurrency=1, llm_batch_max_rows=1, use_rules=False)
+class ExtractionBudgetTests(TestCase):
+    """预算只限制需要调用 LLM 的行：命中缓存的行在预算用尽后照常产出，遇到需要调用的行时停止"""
+
+    def setUp(self):
+        user = CustomUser.objects.create_user(username='tester', password='x')
+        self.document = Document.objects.create(title='t', file='documents/t.xlsx', file_type='excel', uploader=user)
+        self.items = [
+            {"teacher_name": f"导师{i}", "full_text": f"导师姓名：导师{i}；个人介绍：从事第{i}类课题的研究。", "excel_row_index": i}
+            for i in range(1, 11)
+        ]
+        # 第 1 行与第 10 行需要调用 LLM，其余行命中缓存
+        for item in self.items[1:-1]:
+            self._cache(item)
+
+    @staticmethod
+    def _cache(item):
+        key = LLMCache.make_key(item['full_text'], item['teacher_name'], DocumentProcessor.CONFIG['entity_types'])
+        LLMCache.put(key, item['teacher_name'], {"研究方向": ["课题"]})
+
+    def _extract(self, guard):
+        rows = []
+        with mock.patch('services.llm_bridge.LLMBridge.extract_entities', return_value={"研究方向": ["新课题"]}):
+            with self.assertRaises(ProcessingStopped) as stopped:
+                for item, _ in DocumentProcessor._extract_all(self.items, {}, guard):
+                    rows.append(item['excel_row_index'])
+                    guard.check(budget=False)
+        self.assertEqual(stopped.exception.status, 'budget_exceeded')
+        return rows
+
+    def test_llm_call_budget(self):
+        self.document.max_llm_calls = 1
+        self.assertEqual(self._extract(JobGuard(self.document, PipelineMetrics())), list(range(1, 10)))
+
+    def test_time_budget(self):
+        self._cache(self.items[0])
+        self.document.max_seconds = 1
+        guard = JobGuard(self.document, PipelineMetrics())
+        guard.started -= 10
+        self.assertEqual(self._extract(guard), list(range(1, 10)))
+
+
+class SegmentBlocksTests(TestCase):
+    """PDF / Word 文本按人物分段"""
+
+    def test_long_person_record_is_not_split(self):
+        # 同名的多条记录写入时简介互相覆盖，长段落保持为一条记录，由提取阶段分段
+        lines = [f"张三主持了第{i}项科研项目。" for i in range(2000)]
+        blocks = [("张三，男，1950年生。", False, 1)] + [(line, False, 2) for line in lines] + [("李四，女，1960年生。", False, 3)]
+        segments = list(segment_blocks(blocks))
+        self.assertEqual([segment['title'] for segment in segments], ['张三', '李四'])
+        self.assertTrue(segments[0]['text'].endswith(lines[-1]))
+
+        item = DocumentProcessor._build_item('张三', segments[0]['text'], 1, truncate=False)
+        self.assertGreater(len(item['full_text']), DocumentProcessor.CONFIG['max_text_length'])
+        self.assertTrue(DocumentProcessor._split_text(item)[-1].endswith(lines[-1]))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class UploadCompleteTests(TestCase):
+    """分块上传完成时只生成一个文档"""
+
+    CONTENT = b"chunked upload content"
+
+    def setUp(self):
+        user = CustomUser.objects.create_user(username='tester', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        response = self.client.post('/api/uploads/', {
+            'title': '上传', 'file_type': 'excel', 'filename': 'a.xlsx', 'total_size': len(self.CONTENT),
+        }, format='json')
+        self.session_id = response.data['id']
+        self.client.put(f'/api/uploads/{self.session_id}/chunks/0/', self.CONTENT, content_type='application/octet-stream')
+
+    def _complete(self):
+        return self.client.post(f'/api/uploads/{self.session_id}/complete/')
+
+    def test_repeated_complete_returns_same_document(self):
+        first = self._complete()
+        second = self._complete()
+        self.assertEqual((first.status_code, second.status_code), (201, 200))
+        self.assertEqual(first.data['id'], second.data['id'])
+        self.assertEqual(Document.objects.count(), 1)
+
+    def test_concurrent_complete_returns_existing_document(self):
+        # 校验文件期间另一个请求已完成上传：锁定会话后发现已有文档，直接返回
+        session = UploadSession.objects.get(pk=self.session_id)
+        existing = Document.objects.create(
+            title=session.title, file=session.file_name, file_type=session.file_type, uploader=session.uploader
+        )
+
+        def hash_while_completed(path):
+            UploadSession.objects.filter(pk=self.session_id).update(document=existing)
+            return file_sha256(path)
+
+        with mock.patch('documents.views.file_sha256', side_effect=hash_while_completed):
+            response = self._complete()
+        self.assertEqual((response.status_code, response.data['id']), (200, existing.id))
+        self.assertEqual(Document.objects.count(), 1)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class SchedulerPdfTests(TransactionTestCase):
+    """调度器在 django-q 的守护 worker 中处理多页 PDF（守护进程不能创建解析子进程）"""
+
+    NAMES = ['张甲', '李乙', '王丙', '赵丁', '钱戊', '孙己', '周庚', '吴辛', '郑壬', '冯癸', '陈子', '褚丑']
+
+    def test_long_pdf_in_daemon_worker(self):
+        user = CustomUser.objects.create_user(username='tester', password='x')
+        pages = [
+            [f"{name}，男，1950年生，计算机学院教授。", f"{name}长期从事人工智能方向的研究与教学工作。"]
+            for name in self.NAMES
+        ]
+        document = Document(title='校史', file_type='pdf', uploader=user)
+        document.file.save('history.pdf', ContentFile(_pdf_bytes(pages)))
+
+        process = multiprocessing.current_process()
+        daemon = process.daemon
+        process._config['daemon'] = True
+        try:
+            with mock.patch('django_q.tasks.async_task'), \
+                    mock.patch.dict(DocumentProcessor.CONFIG, pdf_workers=4, llm_batch_max_rows=1), \
+                    mock.patch('services.llm_bridge.LLMBridge.extract_entities', return_value={}):
+                enqueue_documents([document])
+                run_document_scheduler()
+        finally:
+            process._config['daemon'] = daemon
+
+        document.refresh_from_db()
+        self.assertEqual(document.status, 'processed', document.processed_data)
+        self.assertEqual(
+            set(Entity.objects.filter(entity_type='person').values_list('name', flat=True)), set(self.NAMES)
+        )
@@ -0,0 +1,147 @@
+import multiprocessing
+import os
+import re
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree.ElementTree import iterparse
+
+# PDF / Word 文本的流式读取与分段
+# 按页（PDF）或按段落（DOCX）惰性产出文本块，再切分为按人物或按章节的记录，交给与 Excel 相同的提取流水线。
+# PDF 文本解析是纯 Python 的 CPU 密集操作，按页段分发到子进程并行；本模块不依赖 Django，便于子进程导入。
+
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+# “张三，男，1950年生……” / “姓名：张三” 形式的人物开头
+PERSON_START = re.compile(r'^([一-龥]{2,4}(?:·[一-龥]{2,6})?)\s*[，,]\s*(?:男|女|汉族|\d{4}\s*年)')
+NAME_LABEL = re.compile(r'^(?:导师|教师)?姓\s*名\s*[:：]\s*([一-龥·]{2,8})')
+# “第三章 院系沿革” / “二、历任院长” 形式的章节标题（仅用于没有样式信息的 PDF）
+SECTION_HEADING = re.compile(r'^(?:第[一二三四五六七八九十百零\d]+[章节篇部]|[一二三四五六七八九十]+、)\s*\S.{0,30}$')
+SENTENCE_END = ('。', '；', '！', '？', '：', ';', '!', '?', ':')
+
+
+def iter_pdf_pages(file_path, workers=None, pages_per_task=8):
+    """
+    按页码顺序产出 (页码, 文本)，页码从 1 开始。
+    workers > 1 时按 pages_per_task 页一组分发到子进程解析，最多 workers * 2 组同时在途，
+    主进程只保留尚未产出的若干组文本，内存与总页数无关；
+    当前进程为守护进程（如 django-q 的 worker）时不能再创建子进程，在本进程内逐组解析
+    """
+    from pypdf import PdfReader
+
+    # 只读取交叉引用表和页树，不解析页面内容
+    page_count = len(PdfReader(file_path).pages)
+    workers = max(1, workers or 1)
+    if workers == 1 or page_count <= pages_per_task or multiprocessing.current_process().daemon:
+        for start in range(0, page_count, pages_per_task):
+            yield from _extract_pdf_range(file_path, start, min(start + pages_per_task, page_count))
+        return
+
+    # spawn 启动的子进程不继承父进程的线程和数据库连接
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        ranges = iter(range(0, page_count, pages_per_task))
+        pending = deque()
+
+        def submit_next():
+            start = next(ranges, None)
+            if start is not None:
+                pending.append(pool.submit(_extract_pdf_range, file_path, start, min(start + pages_per_task, page_count)))
+
+        for _ in range(workers * 2):
+            submit_next()
+        while pending:
+            pages = pending.popleft().result()
+            submit_next()
+            yield from pages
+
+
+def _extract_pdf_range(file_path, start, end):
+    """在子进程中解析 [start, end) 页的文本（扫描件没有文本层时为空字符串）"""
+    from pypdf import PdfReader
+
+    reader = PdfReader(file_path)
+    pages = []
+    for index in range(start, end):
+        try:
+            text = reader.pages[index].extract_text() or ""
+        except Exception as e:
+            print(f"PDF page {index + 1} extract error: {e}")
+            text = ""
+        pages.append((index + 1, text))
+    return pages
+
+
+def iter_docx_paragraphs(file_path):
+    """
+    流式解析 word/document.xml，按文档顺序产出 (段落文本, 是否标题)。
+    标题按段落样式（Heading* / 标题* / Title）判断；解析完的元素立即清除，不在内存中保留整个文档树
+    """
+    with zipfile.ZipFile(file_path) as archive, archive.open('word/document.xml') as xml:
+        for _, element in iterparse(xml, events=('end',)):
+            if element.tag != f'{WORD_NS}p':
+                continue
+            text = "".join(node.text or "" for node in element.iter(f'{WORD_NS}t')).strip()
+            style = element.find(f'{WORD_NS}pPr/{WORD_NS}pStyle')
+            style_name = style.get(f'{WORD_NS}val', '') if style is not None else ''
+            element.clear()
+            if text:
+                yield text, style_name.lower().startswith(('heading', 'title', '标题'))
+
+
+def iter_text_blocks(file_path, pdf_workers=None):
+    """
+    按文件类型产出统一的文本块 (文本, 是否标题, 页码)；
+    PDF 没有样式信息，按行产出，由 segment_blocks 根据行首模式判断标题
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == '.pdf':
+        for page, text in iter_pdf_pages(file_path, workers=pdf_workers):
+            for line in text.splitlines():
+                line = line.strip()
+                if line:
+                    yield line, bool(SECTION_HEADING.match(line)), page
+    elif ext == '.docx':
+        for text, is_heading in iter_docx_paragraphs(file_path):
+            yield text, is_heading, None
+    else:
+        raise ValueError(f"不支持的文本文件类型: {ext}")
+
+
+def segment_blocks(blocks):
+    """
+    将文本块切分为记录，按文档顺序产出 {"title", "kind", "text", "page"}：
+    - kind 为 person：以“姓名，男/女/…”或“姓名：xxx”开头的人物段落，title 为姓名
+    - kind 为 section：标题之后的章节正文，title 为标题
+    第一个人物或标题之前的内容（目录、前言等）不产出；
+    长记录不在此切分（同名的多条记录写入时简介会互相覆盖），由提取阶段按句子分段（见 DocumentProcessor._split_text）
+    """
+    current = None
+    for text, is_heading, page in blocks:
+        match = None if is_heading else (NAME_LABEL.match(text) or PERSON_START.match(text))
+        if is_heading or match:
+            if current:
+                yield _finish(current)
+            if is_heading:
+                current = {"title": text, "kind": "section", "parts": [], "page": page}
+            else:
+                current = {"title": match.group(1), "kind": "person", "parts": [text], "page": page}
+            continue
+
+        if current is None:
+            continue
+        current["parts"].append(text)
+
+    if current:
+        yield _finish(current)
+
+
+def _finish(segment):
+    """拼接记录正文：PDF 中被换行打断的句子直接连接，完整的句子之间保留换行"""
+    text = ""
+    for part in segment["parts"]:
+        if text and not text.endswith(SENTENCE_END):
+            text += part
+        else:
+            text += ("\n" if text else "") + part
+    return {"title": segment["title"], "kind": segment["kind"], "text": text, "page": segment["page"]}
@@ -0,0 +1,44 @@
+import hashlib
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+# 上传文件的内容哈希
+# 上传内容一律流式写入临时文件（不在内存中缓冲），同时逐块计算 sha256，保存文档时无需再读一遍文件。
+
+
+class HashingFileUploadHandler(TemporaryFileUploadHandler):
+    """写入临时文件的同时计算 sha256，结果记在上传文件对象的 sha256 属性上"""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        upload = super().file_complete(file_size)
+        upload.sha256 = self.digest.hexdigest()
+        return upload
+
+
+def file_sha256(file_path, chunk_size=1 << 20):
+    """分块计算文件内容的 sha256，内存占用与文件大小无关"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def uploaded_file_sha256(upload):
+    """上传文件的 sha256：优先取上传时已算好的值，否则（其他上传处理器或手动构造的文件）分块计算"""
+    sha256 = getattr(upload, 'sha256', None)
+    if sha256:
+        return sha256
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    upload.seek(0)
+    upload.sha256 = digest.hexdigest()
+    return upload.sha256
@@ -1,9 +1,59 @@
-from rest_framework import viewsets, permissions, status
+import json
+import os
+import time
+from datetime import timedelta
+from rest_framework import mixins, viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.response import Response
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.http import Http404, StreamingHttpResponse
 from django.utils import timezone
-from .models import Document
-from .serializers import DocumentUploadSerializer, DocumentDetailSerializer, DocumentSerializer
+from django.urls import reverse
+from .models import Document, UploadChunk, UploadSession, document_upload_path
+from .serializers import DocumentUploadSerializer, DocumentDetailSerializer, DocumentSerializer, UploadSessionSerializer
+from .uploads import file_sha256, uploaded_file_sha256
+
+class EventStreamRenderer(BaseRenderer):
+    """声明 text/event-stream，使 EventSource 的 Accept 头能通过内容协商"""
+    media_type = 'text/event-stream'
+    format = 'sse'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+def _duplicate_fields(content_hash, share_file):
+    """
+    与已处理文档内容完全相同时，新文档直接关联其处理结果所需设置的字段（没有时返回空字典）；
+    share_file 为真时还包含原文档的文件名，新文档共用已存储的文件
+    """
+    original = (
+        Document.objects.filter(content_hash=content_hash, status='processed')
+        .order_by('processing_end_time').first()
+    )
+    if original is None:
+        return {}
+    now = timezone.now()
+    fields = {
+        'status': 'processed',
+        'duplicate_of': original,
+        'processing_start_time': now,
+        'processing_end_time': now,
+        'processed_data': {
+            "status": "success",
+            "duplicate_of": original.id,
+            "processed_count": (original.processed_data or {}).get("processed_count"),
+            "triples_count": (original.processed_data or {}).get("triples_count"),
+            "message": f"与已处理的文档《{original.title}》内容相同，已关联其处理结果，未重新处理。",
+        },
+    }
+    if share_file:
+        # 文件名为字符串时视为已存储，不会写入新文件
+        fields['file'] = original.file.name
+    return fields
 
 class DocumentViewSet(viewsets.ModelViewSet):
     queryset = Document.objects.all()
@@ -19,12 +69,21 @@ class DocumentViewSet(viewsets.ModelViewSet):
         return DocumentSerializer  # 默认使用原来的序列化器保持兼容
     
     def perform_create(self, serializer):
-        """创建文档时设置上传者"""
+        """
+        创建文档时设置上传者；与已处理文档内容完全相同的上传直接关联其处理结果，不再重新处理，
+        share_file 为真时不保存新副本，与原文档共用已存储的文件
+        """
+        extra = {}
         # 注意：如果允许匿名上传，request.user 可能是 AnonymousUser，需要做校验
         if self.request.user and self.request.user.is_authenticated:
-            serializer.save(uploader=self.request.user)
-        else:
-            serializer.save()
+            extra['uploader'] = self.request.user
+
+        share_file = serializer.validated_data.pop('share_file', getattr(settings, 'DOCUMENT_UPLOAD_SHARE_FILES', False))
+        content_hash = uploaded_file_sha256(serializer.validated_data['file'])
+        extra.update(_duplicate_fields(content_hash, share_file))
+        if 'file' in extra:
+            extra['content_hash'] = content_hash
+        serializer.save(**extra)
     
     @action(detail=False, methods=['get'])
     def by_type(self, request):
@@ -48,34 +107,211 @@ class DocumentViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post'])
     def process_document(self, request, pk=None):
-        """处理文档：提取实体和关系"""
+        """
+        处理文档：加入后台处理队列（与管理后台的“处理文档”相同）后立即返回 202 和任务号，
+        通过 status_url 查询进度。文档已在排队或处理中时不重复加入，返回当前任务号。
+        请求体 force=true 时强制重新处理：不跳过已按相同内容入库过的行
+        """
+        from .scheduler import enqueue_documents
+        from .services import DocumentProcessor
+
         document = self.get_object()
-        
         # 检查文件类型
-        if document.file_type != 'excel' and not document.file.name.endswith(('.xlsx', '.xls')):
-             return Response({"error": "目前仅支持处理Excel文件"}, status=400)
+        if not DocumentProcessor.supports(document):
+            return Response({"error": "目前仅支持处理 Excel / PDF / Word(.docx) 文件"}, status=400)
 
-        # 更新状态为处理中
-        document.status = 'processing'
-        document.processing_start_time = timezone.now()
-        document.save()
+        force = str(request.data.get('force', '')).lower() in ('1', 'true')
+        queued, _ = enqueue_documents([document], kind='reprocess' if force else 'process')
+        row = Document.objects.filter(pk=document.pk).values('id', 'status', 'job_id').first()
+        return Response({
+            "job_id": row['job_id'],
+            "document_id": row['id'],
+            "status": row['status'],
+            "deduplicated": not queued,
+            "status_url": request.build_absolute_uri(reverse('document-progress', args=[row['id']])),
+        }, status=202)
 
-        try:
-            from .services import DocumentProcessor
-            result = DocumentProcessor.process_excel(document)
-            
-            if result.get("status") == "success":
-                document.status = 'processed'
-                document.processed_data = result
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """取消文档处理：排队中的直接取消，处理中的在当前行完成后停止，已处理的数据保留"""
+        from .scheduler import cancel_documents
+
+        document = self.get_object()
+        cancelled, requested = cancel_documents([document])
+        if not cancelled and not requested:
+            return Response({"error": "文档不在排队或处理中"}, status=409)
+        return Response(self._progress_payload(pk), status=202)
+
+    def _progress_payload(self, pk):
+        """只读取状态与进度字段，避免反序列化体积较大的 processed_data"""
+        row = Document.objects.filter(pk=pk).values('id', 'status', 'job_id', 'cancel_requested', 'progress').first()
+        if row is None:
+            raise Http404
+        return row
+
+    @action(detail=True, methods=['get'])
+    def progress(self, request, pk=None):
+        """获取文档处理进度（阶段、已处理行数、速率、预计剩余时间）"""
+        return Response(self._progress_payload(pk))
+
+    @action(detail=True, methods=['get'], url_path='progress/stream',
+            renderer_classes=[EventStreamRenderer, JSONRenderer])
+    def progress_stream(self, request, pk=None):
+        """以 Server-Sent Events 推送处理进度，文档离开“排队中”“处理中”状态后结束"""
+        payload = self._progress_payload(pk)
+
+        def event_stream():
+            last = None
+            idle = 0
+            current = payload
+            while True:
+                if current != last:
+                    yield f"data: {json.dumps(current, ensure_ascii=False, default=str)}\n\n"
+                    last = current
+                    idle = 0
+                elif idle >= 15:
+                    # 心跳注释，防止代理因长时间无数据断开连接
+                    yield ": keep-alive\n\n"
+                    idle = 0
+
+                if current['status'] not in ('queued', 'processing'):
+                    return
+                time.sleep(1)
+                idle += 1
+                current = Document.objects.filter(pk=pk).values('id', 'status', 'job_id', 'cancel_requested', 'progress').first()
+                if current is None:
+                    return
+
+        response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+class UploadSessionViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin,
+                           viewsets.GenericViewSet):
+    """
+    分块上传（可断点续传）：
+    1. POST uploads/ 创建会话，在最终存储位置预先创建文件
+    2. PUT uploads/{id}/chunks/{n}/ 以请求体上传第 n 个分块（从 0 开始），流式写入文件对应偏移，可重复上传
+    3. GET uploads/{id}/ 查询已收到的分块，中断后只需补传缺失的分块
+    4. POST uploads/{id}/complete/ 校验分块齐全、总大小与 sha256 后生成文档（重复内容按上传去重规则关联）
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    # 分块写入时每次从请求流读取的字节数
+    COPY_BUFFER = 256 * 1024
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(uploader=self.request.user)
+
+    def perform_create(self, serializer):
+        self._purge_expired()
+        file_name = document_upload_path(None, serializer.validated_data.pop('filename'))
+        path = default_storage.path(file_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'wb').close()
+        serializer.save(uploader=self.request.user, file_name=file_name)
+
+    def perform_destroy(self, instance):
+        """放弃上传：删除会话，尚未生成文档时一并删除已写入的文件"""
+        if instance.document_id is None:
+            self._remove_file(instance.file_name)
+        instance.delete()
+
+    @action(detail=True, methods=['put'], url_path=r'chunks/(?P<index>\d+)')
+    def put_chunk(self, request, pk=None, index=None):
+        """写入一个分块：除最后一块外大小必须等于 chunk_size，请求体不在内存中整体缓冲"""
+        session = self.get_object()
+        if session.document_id:
+            return Response({"error": "上传已完成"}, status=409)
+        index = int(index)
+        if index >= session.chunk_count:
+            return Response({"error": f"分块序号超出范围（共 {session.chunk_count} 块）"}, status=400)
+
+        offset = index * session.chunk_size
+        expected = min(session.chunk_size, session.total_size - offset)
+        written = 0
+        stream = request.stream
+        with open(default_storage.path(session.file_name), 'r+b') as f:
+            f.seek(offset)
+            while stream is not None:
+                data = stream.read(min(self.COPY_BUFFER, expected + 1 - written))
+                if not data:
+                    break
+                if written + len(data) > expected:
+                    return Response({"error": f"分块大小超过 {expected} 字节"}, status=400)
+                f.write(data)
+                written += len(data)
+        if written != expected:
+            return Response({"error": f"分块大小应为 {expected} 字节，实际收到 {written} 字节"}, status=400)
+
+        UploadChunk.objects.get_or_create(session=session, index=index)
+        return Response({"index": index, "received": session.chunks.count(), "chunk_count": session.chunk_count})
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        """
+        所有分块到齐后校验文件并生成文档；重复或并发调用返回已生成的文档。
+        校验（读取整个文件计算哈希）在事务之外进行，锁定会话后再确认尚未生成文档，保证只生成一个
+        """
+        session = self.get_object()
+        received = set(session.chunks.values_list('index', flat=True))
+        # 分块记录在生成文档后删除：先读分块再确认会话状态，并发完成的请求也能返回已生成的文档
+        session.refresh_from_db(fields=['document'])
+        if session.document_id:
+            return Response(DocumentDetailSerializer(session.document, context={'request': request}).data)
+
+        missing = [index for index in range(session.chunk_count) if index not in received]
+        if missing:
+            return Response({"error": "分块未上传完整", "missing": missing[:100]}, status=409)
+
+        path = default_storage.path(session.file_name)
+        if os.path.getsize(path) != session.total_size:
+            return Response({"error": "文件大小与声明不一致"}, status=400)
+        content_hash = file_sha256(path)
+        if session.sha256 and session.sha256 != content_hash:
+            # 无法判断是哪个分块损坏，清空分块记录，需要重新上传全部分块
+            session.chunks.all().delete()
+            return Response({"error": "文件哈希校验失败，请重新上传"}, status=400)
+
+        with transaction.atomic():
+            # SQLite 不支持 select_for_update（被忽略），先用一条不改变数据的更新取得写锁，并发的完成请求在此排队
+            UploadSession.objects.filter(pk=session.pk).update(document=F('document'))
+            session = UploadSession.objects.select_for_update().select_related('document').get(pk=session.pk)
+            if session.document_id:
+                return Response(DocumentDetailSerializer(session.document, context={'request': request}).data)
+
+            fields = _duplicate_fields(content_hash, session.share_file)
+            if 'file' in fields:
+                # 共用已存储的文件：提交后再删除本次上传的文件，回滚时保留
+                file_name = session.file_name
+                transaction.on_commit(lambda: self._remove_file(file_name))
             else:
-                document.status = 'error'
-                document.processed_data = result
-                
-        except Exception as e:
-            document.status = 'error'
-            document.processed_data = {"error": str(e)}
-        
-        document.processing_end_time = timezone.now()
-        document.save()
-        
-        return Response(DocumentDetailSerializer(document).data)
+                fields['file'] = session.file_name
+            document = Document.objects.create(
+                title=session.title, file_type=session.file_type, uploader=session.uploader,
+                content_hash=content_hash, **fields
+            )
+            session.document = document
+            session.save(update_fields=['document'])
+            session.chunks.all().delete()
+        return Response(DocumentDetailSerializer(document, context={'request': request}).data, status=201)
+
+    @classmethod
+    def _purge_expired(cls):
+        """清理超过保留时长的上传会话，未完成的会话同时删除已写入的文件"""
+        hours = getattr(settings, 'DOCUMENT_UPLOAD_SESSION_HOURS', 24)
+        expired = UploadSession.objects.filter(created_at__lt=timezone.now() - timedelta(hours=hours))
+        for file_name in expired.filter(document__isnull=True).values_list('file_name', flat=True):
+            cls._remove_file(file_name)
+        expired.delete()
+
+    @staticmethod
+    def _remove_file(file_name):
+        # 文件可能已被其他文档共用（见上传去重），仍有引用时保留
+        if Document.objects.filter(file=file_name).exists():
+            return
+        try:
+            default_storage.delete(file_name)
+        except OSError as e:
+            print(f"Error deleting file: {e}")
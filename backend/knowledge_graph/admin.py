@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Entity, Relationship
+from django.contrib import messages
+from .models import Entity, Relationship, SyncOutbox
 
 @admin.register(Entity)
 class EntityAdmin(admin.ModelAdmin):
@@ -22,4 +23,25 @@ class RelationshipAdmin(admin.ModelAdmin):
     autocomplete_fields = ['source_entity', 'target_entity']
     
     list_select_related = ('source_entity', 'target_entity')
-    list_per_page = 20
\ No newline at end of file
+    list_per_page = 20
+
+
+@admin.register(SyncOutbox)
+class SyncOutboxAdmin(admin.ModelAdmin):
+    """待同步到 Neo4j 的变更（只读），积压或反复失败时用于排查；死信排查后可重新加入队列"""
+    list_display = ['id', 'kind', 'action', 'object_id', 'created_at', 'attempts', 'dead', 'last_error']
+    list_filter = ['dead', 'kind', 'action']
+    readonly_fields = ['kind', 'action', 'object_id', 'payload', 'created_at', 'attempts', 'dead', 'last_error']
+    actions = ['requeue_selected']
+
+    def has_add_permission(self, request):
+        return False
+
+    def requeue_selected(self, request, queryset):
+        """把选中的死信重新加入同步队列末尾"""
+        from .outbox import requeue_dead
+
+        count = requeue_dead(list(queryset.values_list('id', flat=True)))
+        self.message_user(request, f"已将 {count} 条死信重新加入同步队列。", messages.SUCCESS)
+
+    requeue_selected.short_description = "重新同步选中的死信"
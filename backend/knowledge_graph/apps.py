@@ -7,4 +7,6 @@ class KnowledgeGraphConfig(AppConfig):
 
     def ready(self):
         import knowledge_graph.signals
+        # 注册 Neo4j 索引与约束的数据库检查
+        import knowledge_graph.neo4j_schema
 
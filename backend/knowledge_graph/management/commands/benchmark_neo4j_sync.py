@@ -0,0 +1,106 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from knowledge_graph.neo4j_db import Neo4jConnection
+from knowledge_graph.neo4j_schema import drop_schema, ensure_schema, schema_definitions
+from knowledge_graph.outbox import build_statements
+
+# 基准测试使用独立的标签与关系类型，不影响正式数据
+LABEL = 'BenchEntity'
+REL_TYPE = 'BENCH_RELATION'
+
+
+class Command(BaseCommand):
+    help = "在不同规模的合成图上对比有无索引/约束时，一批 outbox 变更同步到 Neo4j 的耗时"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000], help="关系条数")
+        parser.add_argument('--sample', type=int, default=100, help="每批同步更新的实体数与关系数")
+        parser.add_argument('--repeat', type=int, default=3, help="每种情况重复次数，取中位数")
+        parser.add_argument('--load-batch', type=int, default=10000, help="生成合成图时每个事务写入的条数")
+
+    def handle(self, *args, **options):
+        driver = Neo4jConnection.get_driver()
+        if driver is None:
+            raise CommandError("无法连接 Neo4j")
+        definitions = schema_definitions(LABEL, REL_TYPE, prefix='bench_entity')
+
+        try:
+            for size in options['sizes']:
+                nodes = max(1000, size // 5)
+                self._clear(driver)
+                # 生成数据时需要按 django_id 匹配节点，先建索引
+                ensure_schema(driver, definitions)
+                self.stdout.write(f"生成 {nodes} 个节点、{size} 条关系...")
+                self._load(driver, nodes, size, options['load_batch'])
+
+                with_index = self._measure(driver, nodes, size, options['sample'], options['repeat'])
+                drop_schema(driver, definitions)
+                without_index = self._measure(driver, nodes, size, options['sample'], options['repeat'])
+                self.stdout.write(
+                    f"  [{size} 条关系] 同步 {options['sample']} 个实体 + {options['sample']} 条关系: "
+                    f"有索引 {with_index * 1000:.1f} ms, 无索引 {without_index * 1000:.1f} ms "
+                    f"({without_index / with_index:.1f}x)"
+                )
+        finally:
+            self._clear(driver)
+            drop_schema(driver, definitions)
+
+    @staticmethod
+    def _run(driver, query, parameters=None):
+        with driver.session() as session:
+            return session.run(query, parameters).single()
+
+    def _clear(self, driver):
+        """分批删除合成数据，避免单个事务过大"""
+        while self._run(
+            driver, f"MATCH (n:{LABEL}) WITH n LIMIT 10000 DETACH DELETE n RETURN count(*) AS deleted"
+        )['deleted']:
+            pass
+
+    def _load(self, driver, nodes, size, batch):
+        for start in range(0, nodes, batch):
+            self._run(driver, f"""
+                UNWIND range($start, $end - 1) AS i
+                CREATE (:{LABEL} {{django_id: i, name: 'bench-' + toString(i), type: 'person', description: '', photo_url: ''}})
+            """, {"start": start, "end": min(start + batch, nodes)})
+        for start in range(0, size, batch):
+            self._run(driver, f"""
+                UNWIND range($start, $end - 1) AS i
+                MATCH (s:{LABEL} {{django_id: i % $nodes}})
+                MATCH (t:{LABEL} {{django_id: (i * 7 + 1) % $nodes}})
+                CREATE (s)-[:{REL_TYPE} {{django_id: i, type: '研究'}}]->(t)
+            """, {"start": start, "end": min(start + batch, size), "nodes": nodes})
+
+    @staticmethod
+    def _entries(nodes, size, sample):
+        """一批与实际同步相同形态的变更：更新实体属性、更新关系（按 id 删除后按名称重建）"""
+        entries = []
+        for i in random.sample(range(nodes), min(sample, nodes)):
+            entries.append(('entity', 'update', i, {
+                "django_id": i, "name": f"bench-{i}", "type": 'person', "description": "updated", "photo_url": "",
+            }))
+        for i in random.sample(range(size), min(sample, size)):
+            entries.append(('relation', 'update', i, {
+                "django_id": i, "source_name": f"bench-{i % nodes}",
+                "target_name": f"bench-{(i * 7 + 1) % nodes}", "type": '研究',
+            }))
+        return entries
+
+    def _measure(self, driver, nodes, size, sample, repeat):
+        """按同步线程的方式在一个事务中执行整批语句，返回耗时中位数（秒）"""
+        timings = []
+        for _ in range(repeat):
+            statements = [
+                (query.replace(':Entity', f':{LABEL}').replace(':RELATION', f':{REL_TYPE}'), parameters)
+                for query, parameters in build_statements(self._entries(nodes, size, sample), sample * 2)
+            ]
+            started = time.perf_counter()
+            with driver.session() as session:
+                with session.begin_transaction() as tx:
+                    for query, parameters in statements:
+                        tx.run(query, parameters).consume()
+                    tx.commit()
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings)
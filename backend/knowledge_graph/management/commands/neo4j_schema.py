@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from knowledge_graph.neo4j_db import Neo4jConnection
+from knowledge_graph.neo4j_schema import ensure_schema, missing_schema
+
+
+class Command(BaseCommand):
+    help = "创建（可重复执行）或检查 Neo4j 同步与查询所需的索引和唯一约束"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="只检查，缺少索引或约束时以非零状态退出")
+
+    def handle(self, *args, **options):
+        driver = Neo4jConnection.get_driver()
+        if driver is None:
+            raise CommandError("无法连接 Neo4j")
+
+        if options['check']:
+            missing = missing_schema(driver)
+            if missing:
+                raise CommandError(f"缺少索引或约束: {', '.join(missing)}")
+            self.stdout.write(self.style.SUCCESS("Neo4j 索引与约束齐全"))
+            return
+
+        failed = False
+        for name, status in ensure_schema(driver).items():
+            if status.startswith('error'):
+                failed = True
+                self.stdout.write(self.style.ERROR(f"  {name}: {status}"))
+            else:
+                self.stdout.write(f"  {name}: {status}")
+        if failed:
+            raise CommandError("部分索引或约束创建失败")
@@ -0,0 +1,44 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from knowledge_graph.outbox import outbox_lag
+from knowledge_graph.reconcile import Reconciler
+
+
+class Command(BaseCommand):
+    help = "按主键区块比对 SQLite 与 Neo4j 中的实体和关系，只逐行检查摘要不同的区块，并批量修复差异"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help="每个区块包含的主键数")
+        parser.add_argument('--report-only', action='store_true', help="只报告差异，不写入 Neo4j")
+        parser.add_argument('--deep', action='store_true', help="逐行比对所有区块（可发现长度不变的文本修改，较慢）")
+        parser.add_argument('--only', choices=['entity', 'relation'], help="只检查实体或关系")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size 必须大于 0")
+        lag = outbox_lag()
+        if lag['backlog']:
+            # 尚未同步的变更会被当作差异；对账结果以当前 SQLite 为准，与之后的同步不冲突
+            self.stdout.write(self.style.WARNING(
+                f"outbox 中还有 {lag['backlog']} 条变更未同步，其涉及的对象会显示为差异"
+            ))
+
+        reconciler = Reconciler(
+            chunk_size=options['chunk_size'], report_only=options['report_only'], deep=options['deep'],
+            log=self.stdout.write,
+        )
+        started = time.perf_counter()
+        try:
+            report = reconciler.run((options['only'],) if options['only'] else ('entity', 'relation'))
+        except ConnectionError as e:
+            raise CommandError(str(e))
+
+        for kind, stats in report.items():
+            self.stdout.write(
+                f"{kind}: 不一致区块 {stats['differing_chunks']}/{stats['chunks']}，"
+                f"缺失 {stats['missing']}，多余 {stats['extra']}，内容不同 {stats['different']}"
+                + ("" if options['report_only'] else f"，已修复 {stats['repaired']}")
+            )
+            for issue, ids in stats['samples'].items():
+                self.stdout.write(f"  {issue} 示例 id: {ids}")
+        self.stdout.write(self.style.SUCCESS(f"对账完成，耗时 {time.perf_counter() - started:.1f}s"))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from knowledge_graph.outbox import drain, outbox_lag
+
+
+class Command(BaseCommand):
+    help = "把 outbox 中积压的实体/关系变更同步到 Neo4j（可作为常驻进程运行），或查看同步延迟"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', action='store_true', help="只显示积压条数与最早未同步条目的等待时长")
+        parser.add_argument('--forever', action='store_true', help="清空后继续运行，定期检查新的变更")
+
+    def handle(self, *args, **options):
+        if options['status']:
+            lag = outbox_lag()
+            self.stdout.write(
+                f"积压 {lag['backlog']} 条，最早未同步 {lag['oldest_age_seconds']}s，"
+                f"最多失败 {lag['max_attempts']} 次，死信 {lag['dead_letters']} 条"
+            )
+            if lag['last_error']:
+                self.stdout.write(f"最近的错误: {lag['last_error']}")
+            return
+
+        applied = drain(stop_when_empty=not options['forever'])
+        if applied is None:
+            self.stdout.write(self.style.WARNING("其他进程正在同步 Neo4j，本次未执行"))
+            return
+        self.stdout.write(self.style.SUCCESS(f"已同步 {applied} 条变更"))
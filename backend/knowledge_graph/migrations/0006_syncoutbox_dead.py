@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge_graph', '0005_syncoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncoutbox',
+            name='dead',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 
 class Entity(models.Model):
     ENTITY_TYPES = [
@@ -19,6 +19,11 @@ class Entity(models.Model):
     def __str__(self):
         return f"{self.name} ({self.get_entity_type_display()})"
 
+    def save(self, *args, **kwargs):
+        # post_save 信号写入 Neo4j 同步 outbox；在事务中保存，autocommit 下 outbox 行也与本次保存一起提交
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
 class Relationship(models.Model):
     RELATIONSHIP_TYPES = [
         ('属于', '属于'),
@@ -36,4 +41,40 @@ class Relationship(models.Model):
     relationship_type = models.CharField(max_length=20, choices=RELATIONSHIP_TYPES)
     
     def __str__(self):
-        return f"{self.source_entity} - {self.relationship_type} - {self.target_entity}"
\ No newline at end of file
+        return f"{self.source_entity} - {self.relationship_type} - {self.target_entity}"
+
+    def save(self, *args, **kwargs):
+        # 同 Entity.save
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+
+class SyncOutbox(models.Model):
+    """
+    待同步到 Neo4j 的实体/关系变更：与变更本身写在同一个 SQLite 事务中（随事务或保存点一起回滚；
+    Entity / Relationship 的 save() 自带事务，删除由 Django 在事务中发送 post_delete，bulk 写入由调用方的事务包裹），
+    由后台同步线程按 id 顺序分批应用到 Neo4j，成功后删除
+    """
+    KINDS = [
+        ('entity', '实体'),
+        ('relation', '关系'),
+    ]
+    ACTIONS = [
+        ('create', '新建'),
+        ('update', '更新'),
+        ('delete', '删除'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KINDS)
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    object_id = models.BigIntegerField()
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # 应用失败的次数与最近一次错误，成功后整行删除
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # 失败次数达到 NEO4J_SYNC_MAX_ATTEMPTS 后移入死信：同步线程跳过，排查后在管理后台重新加入队列
+    dead = models.BooleanField(default=False, db_index=True)
+
+    def __str__(self):
+        return f"{self.get_action_display()}{self.get_kind_display()} #{self.object_id}"
@@ -1,28 +1,55 @@
 import os
+import threading
+from django.conf import settings
 from neo4j import GraphDatabase
+from services.metrics import incr, timed
 
 class Neo4jConnection:
     _driver = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def pool_config():
+        """连接池与重试参数（见 settings.py 中的 NEO4J_* 设置），未配置时使用驱动默认值"""
+        return {
+            "max_connection_pool_size": getattr(settings, 'NEO4J_MAX_CONNECTION_POOL_SIZE', 100),
+            "connection_acquisition_timeout": getattr(settings, 'NEO4J_CONNECTION_ACQUISITION_TIMEOUT', 60),
+            "max_connection_lifetime": getattr(settings, 'NEO4J_MAX_CONNECTION_LIFETIME', 3600),
+            "connection_timeout": getattr(settings, 'NEO4J_CONNECTION_TIMEOUT', 30),
+            # 托管事务（read / write）遇到暂时性错误时自动重试的总时长
+            "max_transaction_retry_time": getattr(settings, 'NEO4J_MAX_TRANSACTION_RETRY_TIME', 30),
+        }
 
     @classmethod
     def get_driver(cls):
         if cls._driver is None:
-            # Get configuration from environment variables
-            NEO4J_URI = os.getenv('NEO4J_URI', "bolt://localhost:7687")
-            NEO4J_USERNAME = os.getenv('NEO4J_USERNAME', "neo4j")
-            NEO4J_PASSWORD = os.getenv('NEO4J_PASSWORD', "12345678")
-            
-            try:
-                cls._driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
-                # Verify connectivity
-                cls._driver.verify_connectivity()
-                print("Neo4j Driver initialized successfully")
-            except Exception as e:
-                print(f"Failed to initialize Neo4j driver: {e}")
-                return None
-                
+            # 多个线程（请求、同步线程）可能同时首次连接，只初始化一次
+            with cls._lock:
+                if cls._driver is None:
+                    cls._init_driver()
         return cls._driver
 
+    @classmethod
+    def _init_driver(cls):
+        # Get configuration from environment variables
+        NEO4J_URI = os.getenv('NEO4J_URI', "bolt://localhost:7687")
+        NEO4J_USERNAME = os.getenv('NEO4J_USERNAME', "neo4j")
+        NEO4J_PASSWORD = os.getenv('NEO4J_PASSWORD', "12345678")
+
+        try:
+            driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD), **cls.pool_config())
+            # Verify connectivity
+            driver.verify_connectivity()
+            print("Neo4j Driver initialized successfully")
+        except Exception as e:
+            print(f"Failed to initialize Neo4j driver: {e}")
+            return
+
+        # 补建同步与查询依赖的索引和约束（已存在时只读取一次元数据）
+        from .neo4j_schema import ensure_schema_on_startup
+        ensure_schema_on_startup(driver)
+        cls._driver = driver
+
     @classmethod
     def close_driver(cls):
         if cls._driver:
@@ -31,11 +58,85 @@ class Neo4jConnection:
             print("Neo4j Driver closed")
 
     @classmethod
-    def query(cls, query, parameters=None, db=None):
+    def session(cls, db=None, fetch_size=None):
+        """新建会话，fetch_size 为每次从服务端拉取的记录数（默认 NEO4J_FETCH_SIZE）；驱动不可用时返回 None"""
         driver = cls.get_driver()
         if not driver:
             return None
-            
-        with driver.session(database=db) as session:
+        return driver.session(
+            database=db, fetch_size=fetch_size or getattr(settings, 'NEO4J_FETCH_SIZE', 1000)
+        )
+
+    @classmethod
+    @timed('neo4j_query')
+    def query(cls, query, parameters=None, db=None):
+        """执行查询并返回全部记录的列表，只适合结果较小的查询，大结果集用 stream()"""
+        incr('neo4j_queries')
+        session = cls.session(db)
+        if session is None:
+            return None
+
+        with session:
             result = session.run(query, parameters)
             return [record for record in result]
+
+    @classmethod
+    def stream(cls, query, parameters=None, db=None, fetch_size=None):
+        """
+        以生成器逐条产出记录，驱动每次只从服务端拉取 fetch_size 条，内存占用与结果总数无关；
+        会话在开始迭代时才从连接池取得，迭代结束或生成器关闭时释放，未迭代的生成器不占用连接。驱动不可用时返回 None。
+        记录在读取过程中产出，中途出错无法自动重试，需要重试的读取用 read()
+        """
+        incr('neo4j_queries')
+        if cls.get_driver() is None:
+            return None
+
+        def records():
+            session = cls.session(db, fetch_size)
+            if session is None:
+                return
+            with session:
+                yield from session.run(query, parameters)
+
+        return records()
+
+    @classmethod
+    @timed('neo4j_query')
+    def read(cls, work, *args, db=None, **kwargs):
+        """
+        在托管读事务中执行 work(tx, *args, **kwargs) 并返回其结果，暂时性错误（连接中断、集群切换等）
+        由驱动自动重试，因此 work 需可重复执行，且应在函数内消费完结果；驱动不可用时返回 None
+        """
+        incr('neo4j_queries')
+        session = cls.session(db)
+        if session is None:
+            return None
+
+        with session:
+            return session.execute_read(work, *args, **kwargs)
+
+    @classmethod
+    @timed('neo4j_query')
+    def write(cls, work, *args, db=None, **kwargs):
+        """在托管写事务中执行 work(tx, *args, **kwargs)，重试规则同 read()"""
+        incr('neo4j_queries')
+        session = cls.session(db)
+        if session is None:
+            return None
+
+        with session:
+            return session.execute_write(work, *args, **kwargs)
+
+    @classmethod
+    def write_batch(cls, statements, db=None):
+        """
+        在一个托管写事务中依次执行多条写语句 [(query, parameters), ...]，全部成功才提交，
+        暂时性错误时整批自动重试；驱动不可用时返回 None
+        """
+        def work(tx):
+            for query, parameters in statements:
+                tx.run(query, parameters).consume()
+            return True
+
+        incr('neo4j_queries', max(len(statements) - 1, 0))
+        return cls.write(work, db=db)
@@ -0,0 +1,117 @@
+from django.conf import settings
+from django.core import checks
+
+# Neo4j 索引与约束
+# 同步语句（outbox.py）与查询（services/graph_service.py）按 Entity.name、Entity.django_id、RELATION.django_id 定位，
+# 没有索引时每次 MATCH 都是按标签或全部关系扫描，同步耗时随图规模线性增长。
+# 这里的定义都用 IF NOT EXISTS 创建，可重复执行；驱动初始化时自动补建（NEO4J_ENSURE_SCHEMA），
+# 也可用 manage.py neo4j_schema 手动创建或检查。
+
+
+def schema_definitions(label='Entity', rel_type='RELATION', prefix='entity'):
+    """
+    [(名称, 创建语句), ...]；django_id 的唯一约束自带索引，不再单独建索引（Neo4j 不允许同一属性重复定义）。
+    label / rel_type / prefix 供基准测试在独立的标签上建立同样的结构
+    """
+    return [
+        (f'{prefix}_django_id_unique',
+         f'CREATE CONSTRAINT {prefix}_django_id_unique IF NOT EXISTS '
+         f'FOR (n:{label}) REQUIRE n.django_id IS UNIQUE'),
+        (f'{prefix}_name',
+         f'CREATE INDEX {prefix}_name IF NOT EXISTS FOR (n:{label}) ON (n.name)'),
+        # 名称模糊搜索（CONTAINS）使用文本索引
+        (f'{prefix}_name_text',
+         f'CREATE TEXT INDEX {prefix}_name_text IF NOT EXISTS FOR (n:{label}) ON (n.name)'),
+        (f'{prefix}_relation_django_id',
+         f'CREATE INDEX {prefix}_relation_django_id IF NOT EXISTS FOR ()-[r:{rel_type}]-() ON (r.django_id)'),
+    ]
+
+
+def existing_schema(session):
+    """数据库中已有的索引与约束名称"""
+    names = {record['name'] for record in session.run('SHOW INDEXES YIELD name')}
+    names.update(record['name'] for record in session.run('SHOW CONSTRAINTS YIELD name'))
+    return names
+
+
+def missing_schema(driver, definitions=None, db=None):
+    """尚未创建的索引与约束名称"""
+    definitions = definitions or schema_definitions()
+    with driver.session(database=db) as session:
+        existing = existing_schema(session)
+    return [name for name, _ in definitions if name not in existing]
+
+
+def ensure_schema(driver, definitions=None, db=None, wait_seconds=300):
+    """
+    创建缺失的索引与约束，返回 {名称: 'exists' / 'created' / 错误信息}；
+    单项失败（例如已有重复的 django_id 导致唯一约束无法建立）不影响其他项。
+    新建后等待索引填充完成（最多 wait_seconds 秒）
+    """
+    definitions = definitions or schema_definitions()
+    results = {}
+    with driver.session(database=db) as session:
+        existing = existing_schema(session)
+        for name, statement in definitions:
+            if name in existing:
+                results[name] = 'exists'
+                continue
+            try:
+                session.run(statement).consume()
+                results[name] = 'created'
+            except Exception as e:
+                results[name] = f"error: {e}"
+        if 'created' in results.values() and wait_seconds:
+            session.run('CALL db.awaitIndexes($timeout)', {"timeout": wait_seconds}).consume()
+    return results
+
+
+def drop_schema(driver, definitions, db=None):
+    """删除给定的索引与约束（基准测试对比无索引的情况时使用）"""
+    with driver.session(database=db) as session:
+        for name, statement in definitions:
+            kind = 'CONSTRAINT' if statement.startswith('CREATE CONSTRAINT') else 'INDEX'
+            session.run(f'DROP {kind} {name} IF EXISTS').consume()
+
+
+def ensure_schema_on_startup(driver):
+    """驱动初始化时调用：按 NEO4J_ENSURE_SCHEMA 补建缺失的索引与约束，失败只打印不影响使用"""
+    if not getattr(settings, 'NEO4J_ENSURE_SCHEMA', True):
+        return
+    try:
+        results = ensure_schema(driver, wait_seconds=0)
+    except Exception as e:
+        print(f"Failed to ensure Neo4j schema: {e}")
+        return
+    for name, status in results.items():
+        if status != 'exists':
+            print(f"Neo4j schema {name}: {status}")
+
+
+@checks.register(checks.Tags.database)
+def check_neo4j_schema(app_configs, databases=None, **kwargs):
+    """
+    检查 Neo4j 索引与约束是否齐全（Neo4j 不可用时给出警告）。
+    与 Django 自带的数据库检查一样只在指定了数据库时运行（manage.py check --database default、migrate），
+    其他命令不会因此连接 Neo4j 或补建索引
+    """
+    if not databases:
+        return []
+
+    from .neo4j_db import Neo4jConnection
+
+    driver = Neo4jConnection.get_driver()
+    if driver is None:
+        return [checks.Warning("无法连接 Neo4j，未检查索引与约束", id='knowledge_graph.W001')]
+    try:
+        missing = missing_schema(driver)
+    except Exception as e:
+        return [checks.Warning(f"读取 Neo4j 索引与约束失败: {e}", id='knowledge_graph.W001')]
+    if missing:
+        # 只给出警告：migrate 也会运行数据库检查，不能因为 Neo4j 而阻止迁移
+        return [checks.Warning(
+            f"Neo4j 缺少索引或约束: {', '.join(missing)}",
+            hint="运行 python manage.py neo4j_schema 创建",
+            id='knowledge_graph.W002',
+        )]
+    return []
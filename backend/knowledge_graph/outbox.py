@@ -0,0 +1,273 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Min
+from django.utils import timezone
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+from documents.models import SchedulerLease
+from documents.scheduler import _acquire_lease, _renew_lease
+from .models import SyncOutbox
+from .neo4j_db import Neo4jConnection
+
+# Neo4j 同步 outbox
+# 实体、关系的变更在同一个 SQLite 事务中写入 SyncOutbox，事务提交后只唤醒后台同步线程，写入方不等待 Neo4j。
+# 同步线程持有租约（同一时间只有一个实例），按 id 顺序每次取 NEO4J_SYNC_BATCH_SIZE 条，
+# 合并为少量 UNWIND 语句在一个 Neo4j 事务中执行，成功后删除这些行；失败时保留并按指数退避重试。
+# 非连接类错误（例如违反唯一约束）每次重试都会失败，二分批次找出出错的条目，
+# 其失败次数达到 NEO4J_SYNC_MAX_ATTEMPTS 后移入死信（dead），之后的变更继续同步。
+# 所有语句都可重复执行（MERGE / SET / 按 id 删除），Neo4j 已提交而删除 outbox 失败时重放也不会出错。
+
+LEASE_NAME = 'neo4j-outbox'
+# 同步线程在租约被占用时等待的秒数
+POLL_INTERVAL = 5
+# Neo4j 暂时不可用：整批保留重试，不计入条目的失败次数
+TRANSIENT_ERRORS = (ConnectionError, ServiceUnavailable, SessionExpired, TransientError)
+
+ENTITY_DELETE_BY_ID = "UNWIND $rows AS row MATCH (n:Entity {django_id: row.django_id}) DETACH DELETE n"
+# 备用：按名称清理
+ENTITY_DELETE_BY_NAME = "UNWIND $rows AS row MATCH (n:Entity {name: row.name}) DETACH DELETE n"
+# 新建节点按名称合并
+ENTITY_CREATE = """
+UNWIND $rows AS row
+MERGE (n:Entity {name: row.name})
+SET n.type = row.type,
+    n.description = row.description,
+    n.photo_url = row.photo_url,
+    n.django_id = row.django_id
+"""
+# 更新节点按 django_id 定位
+ENTITY_UPDATE = """
+UNWIND $rows AS row
+MATCH (n:Entity {django_id: row.django_id})
+SET n.name = row.name,
+    n.type = row.type,
+    n.description = row.description,
+    n.photo_url = row.photo_url
+"""
+RELATION_DELETE_BY_ID = "UNWIND $rows AS row MATCH ()-[r:RELATION {django_id: row.django_id}]->() DELETE r"
+# 兜底方案：通过内容匹配删除 (如果老的id没同步过去，这个能救命)
+RELATION_DELETE_BY_CONTENT = """
+UNWIND $rows AS row
+MATCH (s:Entity {name: row.source_name})-[r:RELATION]->(t:Entity {name: row.target_name})
+WHERE r.type = row.type
+DELETE r
+"""
+RELATION_MERGE = """
+UNWIND $rows AS row
+MATCH (source:Entity {name: row.source_name})
+MATCH (target:Entity {name: row.target_name})
+MERGE (source)-[r:RELATION {django_id: row.django_id}]->(target)
+SET r.type = row.type
+"""
+
+
+def build_statements(entries, batch_size):
+    """
+    把一批 outbox 条目 [(类型, 操作, django_id, 数据), ...]（按发生顺序）合并为 UNWIND 语句列表。
+    关系按端点名称匹配：关系之后出现的节点更新或删除（可能改名）若提前执行，关系会找不到端点而丢失，
+    因此从这类条目处把批次分段，各段按发生顺序依次生成语句（批量写入先写节点后写关系，通常只有一段）
+    """
+    statements = []
+    segment = []
+    has_relations = False
+    for entry in entries:
+        kind, action = entry[0], entry[1]
+        if kind == 'entity' and action != 'create' and has_relations:
+            statements.extend(_segment_statements(segment, batch_size))
+            segment, has_relations = [], False
+        segment.append(entry)
+        has_relations = has_relations or kind == 'relation'
+    statements.extend(_segment_statements(segment, batch_size))
+    return statements
+
+
+def _segment_statements(entries, batch_size):
+    """
+    一段条目的语句：同一对象的多次变更只保留最终操作（新建后又更新的仍按新建处理，删除覆盖之前的保存），
+    语句按 删除节点 -> 新建/更新节点 -> 删除关系 -> 重建关系 的顺序排列
+    """
+    entities, relations = {}, {}
+    for kind, action, django_id, row in entries:
+        target = entities if kind == 'entity' else relations
+        previous = target.get(django_id)
+        if action == 'update' and previous and previous[0] == 'create':
+            action = 'create'
+        target[django_id] = (action, row)
+
+    statements = []
+
+    def add(query, rows):
+        for i in range(0, len(rows), batch_size):
+            statements.append((query, {"rows": rows[i:i + batch_size]}))
+
+    entity_deletes = [row for action, row in entities.values() if action == 'delete']
+    add(ENTITY_DELETE_BY_ID, entity_deletes)
+    add(ENTITY_DELETE_BY_NAME, entity_deletes)
+    add(ENTITY_CREATE, [row for action, row in entities.values() if action == 'create'])
+    add(ENTITY_UPDATE, [row for action, row in entities.values() if action == 'update'])
+
+    relation_deletes = [row for action, row in relations.values() if action == 'delete']
+    add(RELATION_DELETE_BY_ID, relation_deletes)
+    add(RELATION_DELETE_BY_CONTENT, [row for row in relation_deletes if row['source_name'] and row['target_name']])
+    # 更新的关系先删除旧边再重新创建（端点可能已变化）
+    add(RELATION_DELETE_BY_ID, [row for action, row in relations.values() if action == 'update'])
+    add(RELATION_MERGE, [row for action, row in relations.values() if action in ('create', 'update')])
+    return statements
+
+
+def drain_batch(batch_size=None):
+    """
+    应用最早的一批 outbox 条目（不含死信），返回处理的条数（含移入死信的条目，outbox 为空时为 0）；
+    Neo4j 不可用时记录错误后抛出异常，条目保留，下次从同一位置重试。
+    其他错误时把批次二分，先应用出错条目之前的部分，出错条目记一次失败后抛出异常，
+    失败次数达到 NEO4J_SYNC_MAX_ATTEMPTS 时移入死信并继续应用之后的条目
+    """
+    batch_size = max(1, batch_size or getattr(settings, 'NEO4J_SYNC_BATCH_SIZE', 1000))
+    rows = list(
+        SyncOutbox.objects.filter(dead=False).order_by('id')
+        .values_list('id', 'kind', 'action', 'object_id', 'payload')[:batch_size]
+    )
+    if not rows:
+        return 0
+    return _apply_rows(rows, batch_size)
+
+
+def _apply_rows(rows, batch_size):
+    ids = [row[0] for row in rows]
+    try:
+        statements = build_statements([row[1:] for row in rows], batch_size)
+        if statements and Neo4jConnection.write_batch(statements) is None:
+            raise ConnectionError("Neo4j 驱动不可用")
+    except TRANSIENT_ERRORS as e:
+        SyncOutbox.objects.filter(id__in=ids).update(last_error=str(e)[:2000])
+        raise
+    except Exception as e:
+        if len(rows) > 1:
+            # 按顺序应用两半：前一半出错时直接抛出，后一半等出错条目成功或移入死信后再应用
+            middle = len(rows) // 2
+            return _apply_rows(rows[:middle], batch_size) + _apply_rows(rows[middle:], batch_size)
+        return _record_failure(ids[0], e)
+    SyncOutbox.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def _record_failure(outbox_id, error):
+    """单条变更应用失败：记一次失败，达到上限时移入死信并返回 1，否则抛出异常等待重试"""
+    max_attempts = max(1, getattr(settings, 'NEO4J_SYNC_MAX_ATTEMPTS', 5))
+    SyncOutbox.objects.filter(id=outbox_id).update(attempts=F('attempts') + 1, last_error=str(error)[:2000])
+    if SyncOutbox.objects.filter(id=outbox_id, attempts__gte=max_attempts).update(dead=True):
+        print(f"Neo4j sync entry {outbox_id} moved to dead letters after {max_attempts} failed attempts: {error}")
+        return 1
+    raise error
+
+
+def requeue_dead(ids):
+    """把死信重新加入队列末尾（按当前顺序重放，避免覆盖之后的变更），返回条数；事务提交后唤醒同步线程"""
+    with transaction.atomic():
+        rows = list(SyncOutbox.objects.filter(id__in=ids, dead=True).order_by('id'))
+        SyncOutbox.objects.bulk_create([
+            SyncOutbox(kind=row.kind, action=row.action, object_id=row.object_id, payload=row.payload)
+            for row in rows
+        ])
+        SyncOutbox.objects.filter(id__in=[row.id for row in rows]).delete()
+        transaction.on_commit(wake)
+    return len(rows)
+
+
+def drain(owner=None, stop_when_empty=True):
+    """
+    持续应用 outbox 直到清空（stop_when_empty 为假时一直运行，空闲时等待唤醒），返回应用的总条数；
+    失败时按 1, 2, 4 ... 秒（上限 NEO4J_SYNC_RETRY_MAX_SECONDS）退避后重试。未取得租约时返回 None
+    """
+    owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    max_delay = max(1, getattr(settings, 'NEO4J_SYNC_RETRY_MAX_SECONDS', 60))
+    # 租约需覆盖一次退避等待加一次批量写入
+    lease_seconds = max_delay + 60
+    if not _acquire_lease(owner, LEASE_NAME, lease_seconds):
+        return None
+
+    applied = 0
+    failures = 0
+    try:
+        while True:
+            _renew_lease(owner, LEASE_NAME, lease_seconds)
+            try:
+                count = drain_batch()
+            except Exception as e:
+                failures += 1
+                delay = min(max_delay, 2 ** (failures - 1))
+                print(f"Error syncing to Neo4j (attempt {failures}), retry in {delay}s: {e}")
+                time.sleep(delay)
+                continue
+            if failures:
+                print(f"Neo4j sync recovered after {failures} failed attempts")
+            failures = 0
+            applied += count
+            if count:
+                continue
+            if stop_when_empty:
+                return applied
+            _wakeup.wait(POLL_INTERVAL)
+            _wakeup.clear()
+    finally:
+        SchedulerLease.objects.filter(name=LEASE_NAME, owner=owner).delete()
+
+
+def outbox_lag():
+    """同步延迟：积压条数、最早未同步条目的等待时长（秒）、最多的失败次数、死信条数与最近的错误"""
+    pending = SyncOutbox.objects.filter(dead=False)
+    stats = pending.aggregate(backlog=Count('id'), oldest=Min('created_at'), max_attempts=Max('attempts'))
+    last_error = (
+        SyncOutbox.objects.exclude(last_error='').order_by('-id').values_list('last_error', flat=True).first()
+    )
+    oldest = stats['oldest']
+    return {
+        "backlog": stats['backlog'],
+        "oldest_age_seconds": round((timezone.now() - oldest).total_seconds(), 1) if oldest else 0,
+        "max_attempts": stats['max_attempts'] or 0,
+        "dead_letters": SyncOutbox.objects.filter(dead=True).count(),
+        "last_error": last_error or "",
+    }
+
+
+_wakeup = threading.Event()
+_thread_lock = threading.Lock()
+_thread = None
+
+
+def wake():
+    """
+    事务提交后调用：确保本进程的后台同步线程在运行。线程清空 outbox 后退出；
+    其他进程持有租约时每隔 POLL_INTERVAL 秒重试，直到 outbox 清空
+    """
+    global _thread
+    with _thread_lock:
+        _wakeup.set()
+        if _thread is None:
+            _thread = threading.Thread(target=_run, name='neo4j-outbox', daemon=True)
+            _thread.start()
+
+
+def _run():
+    global _thread
+    try:
+        while True:
+            _wakeup.clear()
+            if drain() is None:
+                # 其他进程正在同步，它会处理本进程写入的条目；等待后确认是否已清空
+                _wakeup.wait(POLL_INTERVAL)
+            # 在锁内确认退出，保证退出前刚提交的条目会由本线程或新启动的线程处理
+            with _thread_lock:
+                if not _wakeup.is_set() and not SyncOutbox.objects.filter(dead=False).exists():
+                    _thread = None
+                    return
+    except Exception as e:
+        print(f"Neo4j sync thread stopped: {e}")
+        with _thread_lock:
+            _thread = None
+    finally:
+        connection.close()
@@ -0,0 +1,249 @@
+from collections import defaultdict
+from django.conf import settings
+from django.db.models import BigIntegerField, Case, Count, ExpressionWrapper, F, Sum, Value, When
+from django.db.models.functions import Length
+from .models import Entity, Relationship
+from .neo4j_db import Neo4jConnection
+from .outbox import build_statements
+
+# SQLite 与 Neo4j 的对账
+# 按主键把实体、关系分成固定大小的区块，两边各用一次聚合查询算出每个区块的摘要
+# （条数、django_id 之和、各文本字段长度之和，以及 django_id × 类型序号之和；
+# Cypher 没有内置哈希函数，摘要只用两边都能算的数值），
+# 只对摘要不同的区块逐行比对，按 django_id 区间读取（依赖 neo4j_schema 中的索引），差异用批量语句修复。
+# 类型是固定的选项，按序号计入摘要，改成另一个同样长度的类型也能发现；
+# 名称、简介等自由文本只计长度，长度不变的修改（例如两三个字的姓名改成同样长度的另一个）无法发现，
+# 需要时用 deep=True 逐行比对全部区块。
+
+ENTITY_CHUNKS = """
+MATCH (n:Entity) WHERE n.django_id IS NOT NULL
+RETURN n.django_id / $size AS chunk, count(n) AS count, sum(n.django_id) AS id_sum,
+       sum(size(coalesce(n.name, ''))) AS name_len, sum(size(coalesce(n.type, ''))) AS type_len,
+       sum(n.django_id * coalesce($ordinals[coalesce(n.type, '')], 0)) AS type_sum,
+       sum(size(coalesce(n.description, ''))) AS description_len, sum(size(coalesce(n.photo_url, ''))) AS photo_len
+"""
+RELATION_CHUNKS = """
+MATCH (s:Entity)-[r:RELATION]->(t:Entity) WHERE r.django_id IS NOT NULL
+RETURN r.django_id / $size AS chunk, count(r) AS count, sum(r.django_id) AS id_sum,
+       sum(size(s.name)) AS source_len, sum(size(t.name)) AS target_len, sum(size(coalesce(r.type, ''))) AS type_len,
+       sum(r.django_id * coalesce($ordinals[coalesce(r.type, '')], 0)) AS type_sum
+"""
+ENTITY_ROWS = """
+MATCH (n:Entity) WHERE n.django_id >= $start AND n.django_id < $end
+RETURN n.django_id AS id, n.name AS name, coalesce(n.type, '') AS type,
+       coalesce(n.description, '') AS description, coalesce(n.photo_url, '') AS photo_url
+"""
+RELATION_ROWS = """
+MATCH (s:Entity)-[r:RELATION]->(t:Entity) WHERE r.django_id >= $start AND r.django_id < $end
+RETURN r.django_id AS id, s.name AS source_name, t.name AS target_name, coalesce(r.type, '') AS type
+"""
+NODES_BY_NAME = "MATCH (n:Entity) WHERE n.name IN $names RETURN n.name AS name, n.django_id AS id"
+
+# 摘要字段（顺序与上面的 Cypher 返回列一致）
+ENTITY_DIGEST = ('count', 'id_sum', 'name_len', 'type_len', 'type_sum', 'description_len', 'photo_len')
+RELATION_DIGEST = ('count', 'id_sum', 'source_len', 'target_len', 'type_len', 'type_sum')
+# 类型 -> 序号（从 1 开始，不在选项中的类型为 0），两边按同一张表计算 type_sum
+ENTITY_TYPE_ORDINALS = {value: index for index, (value, _) in enumerate(Entity.ENTITY_TYPES, 1)}
+RELATION_TYPE_ORDINALS = {value: index for index, (value, _) in enumerate(Relationship.RELATIONSHIP_TYPES, 1)}
+
+
+def _chunk(size):
+    return ExpressionWrapper(F('id') / size, output_field=BigIntegerField())
+
+
+def _type_sum(field, ordinals):
+    """sum(id × 类型序号)，与 Cypher 中的 type_sum 一致"""
+    ordinal = Case(
+        *[When(**{field: value}, then=Value(index)) for value, index in ordinals.items()],
+        default=Value(0), output_field=BigIntegerField(),
+    )
+    return Sum(ExpressionWrapper(F('id') * ordinal, output_field=BigIntegerField()))
+
+
+def sqlite_entity_digests(size):
+    rows = (
+        Entity.objects.annotate(chunk=_chunk(size)).values('chunk')
+        .annotate(
+            count=Count('id'), id_sum=Sum('id'), name_len=Sum(Length('name')), type_len=Sum(Length('entity_type')),
+            type_sum=_type_sum('entity_type', ENTITY_TYPE_ORDINALS),
+            description_len=Sum(Length('description')), photo_len=Sum(Length('photo_url')),
+        )
+        .order_by()
+    )
+    return {row['chunk']: tuple(row[key] or 0 for key in ENTITY_DIGEST) for row in rows}
+
+
+def sqlite_relation_digests(size):
+    rows = (
+        Relationship.objects.annotate(chunk=_chunk(size)).values('chunk')
+        .annotate(
+            count=Count('id'), id_sum=Sum('id'), source_len=Sum(Length('source_entity__name')),
+            target_len=Sum(Length('target_entity__name')), type_len=Sum(Length('relationship_type')),
+            type_sum=_type_sum('relationship_type', RELATION_TYPE_ORDINALS),
+        )
+        .order_by()
+    )
+    return {row['chunk']: tuple(row[key] or 0 for key in RELATION_DIGEST) for row in rows}
+
+
+def neo4j_digests(query, fields, size, ordinals):
+    """一次聚合查询得到 Neo4j 中每个区块的摘要，结果按区块逐条读取"""
+    records = Neo4jConnection.stream(query, {"size": size, "ordinals": ordinals})
+    if records is None:
+        raise ConnectionError("无法连接 Neo4j")
+    return {record['chunk']: tuple(record[key] or 0 for key in fields) for record in records}
+
+
+def _read_rows(query, start, end):
+    rows = Neo4jConnection.read(lambda tx: [record.data() for record in tx.run(query, {"start": start, "end": end})])
+    if rows is None:
+        raise ConnectionError("无法连接 Neo4j")
+    return rows
+
+
+class Reconciler:
+    """
+    对账并（非 report_only 时）修复：先处理实体再处理关系（关系按端点名称重建，依赖节点已存在）。
+    report 记录每类对象的区块数、不一致的区块数，以及缺失 / 多余 / 内容不同的条数和示例 id
+    """
+
+    SAMPLE_IDS = 10
+
+    def __init__(self, chunk_size=1000, report_only=False, deep=False, log=print):
+        self.chunk_size = chunk_size
+        self.report_only = report_only
+        self.deep = deep
+        self.log = log
+        self.batch_size = max(1, getattr(settings, 'NEO4J_SYNC_BATCH_SIZE', 1000))
+        self.pending = []
+        self.report = {}
+
+    def run(self, kinds=('entity', 'relation')):
+        if 'entity' in kinds:
+            self._reconcile(
+                'entity', sqlite_entity_digests(self.chunk_size),
+                neo4j_digests(ENTITY_CHUNKS, ENTITY_DIGEST, self.chunk_size, ENTITY_TYPE_ORDINALS), self._diff_entities,
+            )
+        if 'relation' in kinds:
+            self._reconcile(
+                'relation', sqlite_relation_digests(self.chunk_size),
+                neo4j_digests(RELATION_CHUNKS, RELATION_DIGEST, self.chunk_size, RELATION_TYPE_ORDINALS),
+                self._diff_relations,
+            )
+        return self.report
+
+    def _reconcile(self, kind, local, remote, diff):
+        chunks = sorted(set(local) | set(remote))
+        differing = chunks if self.deep else [chunk for chunk in chunks if local.get(chunk) != remote.get(chunk)]
+        stats = self.report[kind] = {
+            "chunks": len(chunks), "differing_chunks": 0, "missing": 0, "extra": 0, "different": 0,
+            "repaired": 0, "samples": defaultdict(list),
+        }
+        self.log(f"{kind}: {len(chunks)} 个区块，{len(differing)} 个需要逐行比对")
+
+        for chunk in differing:
+            start, end = chunk * self.chunk_size, (chunk + 1) * self.chunk_size
+            entries = diff(start, end, stats)
+            if entries:
+                stats['differing_chunks'] += 1
+            if not self.report_only:
+                self._repair(entries, stats)
+        if not self.report_only:
+            self._flush(stats)
+        stats['samples'] = dict(stats['samples'])
+
+    def _record(self, stats, issue, django_id):
+        stats[issue] += 1
+        if len(stats['samples'][issue]) < self.SAMPLE_IDS:
+            stats['samples'][issue].append(django_id)
+
+    def _diff_entities(self, start, end, stats):
+        local = {
+            row['id']: {
+                "django_id": row['id'], "name": row['name'], "type": row['entity_type'],
+                "description": row['description'] or "", "photo_url": row['photo_url'] or "",
+            }
+            for row in Entity.objects.filter(id__gte=start, id__lt=end)
+            .values('id', 'name', 'entity_type', 'description', 'photo_url')
+        }
+        remote = defaultdict(list)
+        for row in _read_rows(ENTITY_ROWS, start, end):
+            remote[row['id']].append(row)
+
+        entries = []
+        missing = [row for django_id, row in local.items() if django_id not in remote]
+        for row in self._unmerged(missing):
+            self._record(stats, 'missing', row['django_id'])
+            entries.append(('entity', 'create', row['django_id'], row))
+        for django_id, rows in remote.items():
+            row = local.get(django_id)
+            if row is None:
+                self._record(stats, 'extra', django_id)
+                # 只按 django_id 删除，同名节点可能属于其他实体
+                entries.append(('entity', 'delete', django_id, {"django_id": django_id, "name": None}))
+            elif len(rows) > 1 or any(rows[0][key] != row[key] for key in ('name', 'type', 'description', 'photo_url')):
+                self._record(stats, 'different', django_id)
+                entries.append(('entity', 'update', django_id, row))
+        return entries
+
+    def _unmerged(self, missing):
+        """
+        同步时节点按名称合并，SQLite 中同名的多个实体在 Neo4j 中只有一个节点（django_id 为其中之一）；
+        这类实体不算缺失，否则每次修复都会把节点的 django_id 改来改去
+        """
+        if not missing:
+            return []
+        names = list({row['name'] for row in missing})
+        nodes = Neo4jConnection.read(lambda tx: [record.data() for record in tx.run(NODES_BY_NAME, {"names": names})])
+        if nodes is None:
+            raise ConnectionError("无法连接 Neo4j")
+        owners = {node['name']: node['id'] for node in nodes if node['id'] is not None}
+        same_name = set(
+            Entity.objects.filter(id__in=owners.values()).values_list('id', 'name')
+        )
+        return [row for row in missing if (owners.get(row['name']), row['name']) not in same_name]
+
+    def _diff_relations(self, start, end, stats):
+        local = {
+            row['id']: {
+                "django_id": row['id'], "source_name": row['source_entity__name'],
+                "target_name": row['target_entity__name'], "type": row['relationship_type'],
+            }
+            for row in Relationship.objects.filter(id__gte=start, id__lt=end)
+            .values('id', 'source_entity__name', 'target_entity__name', 'relationship_type')
+        }
+        remote = defaultdict(list)
+        for row in _read_rows(RELATION_ROWS, start, end):
+            remote[row['id']].append(row)
+
+        entries = []
+        for django_id, row in local.items():
+            if django_id not in remote:
+                self._record(stats, 'missing', django_id)
+                entries.append(('relation', 'create', django_id, row))
+        for django_id, rows in remote.items():
+            row = local.get(django_id)
+            if row is None:
+                self._record(stats, 'extra', django_id)
+                entries.append(('relation', 'delete', django_id, {
+                    "django_id": django_id, "source_name": None, "target_name": None, "type": None,
+                }))
+            elif len(rows) > 1 or any(rows[0][key] != row[key] for key in ('source_name', 'target_name', 'type')):
+                # 重复的边或端点、类型不同：按 id 删除后重建
+                self._record(stats, 'different', django_id)
+                entries.append(('relation', 'update', django_id, row))
+        return entries
+
+    def _repair(self, entries, stats):
+        self.pending.extend(entries)
+        if len(self.pending) >= self.batch_size:
+            self._flush(stats)
+
+    def _flush(self, stats):
+        if not self.pending:
+            return
+        statements = build_statements(self.pending, self.batch_size)
+        if Neo4jConnection.write_batch(statements) is None:
+            raise ConnectionError("无法连接 Neo4j")
+        stats['repaired'] += len(self.pending)
+        self.pending = []
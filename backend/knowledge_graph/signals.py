@@ -1,86 +1,51 @@
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.db import transaction
-from .models import Entity, Relationship
-from .neo4j_db import Neo4jConnection
+from .models import Entity, Relationship, SyncOutbox
+from . import outbox
 import os
 from django.conf import settings
 
-def _sync_entity_logic(django_id, name, entity_type, description, photo_url, created):
-    """
-    Neo4j 同步的具体逻辑，用于在事务提交后执行
-    """
-    try:
-        if created:
-            # 创建节点
-            query = """
-            MERGE (n:Entity {name: $name})
-            SET n.type = $type, 
-                n.description = $description,
-                n.photo_url = $photo_url,
-                n.django_id = $django_id
-            """
-        else:
-            # 更新节点
-            query = """
-            MATCH (n:Entity {django_id: $django_id})
-            SET n.name = $name,
-                n.type = $type,
-                n.description = $description,
-                n.photo_url = $photo_url
-            """
-        
-        params = {
-            "name": name,
-            "type": entity_type,
-            "description": description or "",
-            "photo_url": photo_url or "",
-            "django_id": django_id
-        }
-        
-        Neo4jConnection.query(query, params)
-        print(f"Synced Entity to Neo4j: {name} (ID: {django_id})")
-        
-    except Exception as e:
-        print(f"Error syncing Entity to Neo4j: {e}")
+# Neo4j 同步
+# 实体、关系的变更写入 SyncOutbox（与变更处于同一个 SQLite 事务，回滚时一并撤销；单独保存时由 save() 自带的事务保证），
+# 事务提交后唤醒后台同步线程批量写入 Neo4j，保存数据的请求与文档处理不等待 Neo4j，见 outbox.py
+
+
+def _enqueue(entries):
+    """把变更 [(类型, 操作, django_id, 数据), ...] 写入 outbox，并在事务提交后唤醒同步线程"""
+    SyncOutbox.objects.bulk_create([
+        SyncOutbox(kind=kind, action=action, object_id=django_id, payload=row)
+        for kind, action, django_id, row in entries
+    ], batch_size=getattr(settings, 'NEO4J_SYNC_BATCH_SIZE', 1000))
+    transaction.on_commit(outbox.wake)
+
+
+def _entity_row(django_id, name, entity_type, description, photo_url):
+    return {
+        "django_id": django_id,
+        "name": name,
+        "type": entity_type,
+        "description": description or "",
+        "photo_url": photo_url or "",
+    }
+
 
 @receiver(post_save, sender=Entity)
 def sync_entity_to_neo4j(sender, instance, created, **kwargs):
     """
-    当 SQLite 中的 Entity 保存时，注册事务提交后的回调以同步更新 Neo4j
+    当 SQLite 中的 Entity 保存时，写入 outbox，事务提交后由同步线程批量更新 Neo4j
     """
-    # 捕获当前需要的参数值（闭包）
-    django_id = instance.id
-    name = instance.name
-    entity_type = instance.entity_type
-    description = instance.description
-    photo_url = instance.photo_url
-    
-    transaction.on_commit(
-        lambda: _sync_entity_logic(django_id, name, entity_type, description, photo_url, created)
-    )
-
-def _delete_entity_logic(django_id, name):
-    try:
-        query = "MATCH (n:Entity {django_id: $django_id}) DETACH DELETE n"
-        Neo4jConnection.query(query, {"django_id": django_id})
-        
-        # 备用：按名称清理
-        query_fallback = "MATCH (n:Entity {name: $name}) DETACH DELETE n"
-        Neo4jConnection.query(query_fallback, {"name": name})
-        print(f"Deleted Entity from Neo4j: {name} (ID: {django_id})")
-    except Exception as e:
-        print(f"Error deleting Entity from Neo4j: {e}")
+    _enqueue([('entity', 'create' if created else 'update', instance.id, _entity_row(
+        instance.id, instance.name, instance.entity_type, instance.description, instance.photo_url
+    ))])
 
 @receiver(post_delete, sender=Entity)
 def delete_entity_from_neo4j(sender, instance, **kwargs):
     """
     当 SQLite 中的 Entity 删除时
     """
-    # Neo4j 删除逻辑放入 on_commit
-    transaction.on_commit(
-        lambda: _delete_entity_logic(instance.id, instance.name)
-    )
+    # Neo4j 删除由同步线程在事务提交后执行
+    _enqueue([('entity', 'delete', instance.id, {"django_id": instance.id, "name": instance.name})])
 
     # 本地文件删除逻辑主要涉及文件系统，通常不需要严格的数据库事务一致性（或者说很难回滚），
     # 但为了逻辑统一，也可以放在之后，不过这里保持直接执行也无大碍，
@@ -90,94 +55,61 @@ def delete_entity_from_neo4j(sender, instance, **kwargs):
             rel_path = instance.photo_url
             if rel_path.startswith('/media/'):
                 rel_path = rel_path.replace('/media/', '', 1)
-                
+
             full_path = os.path.join(settings.MEDIA_ROOT, rel_path)
-            
+
             if os.path.isfile(full_path):
                 os.remove(full_path)
                 print(f"Deleted teacher photo: {full_path}")
         except Exception as e:
             print(f"Error delete teacher photo: {e}")
 
-def _sync_relationship_logic(django_id, source_name, target_name, rel_type):
-    try:
-        # 1. 删除旧关系
-        delete_query = "MATCH ()-[r:RELATION {django_id: $django_id}]->() DELETE r"
-        Neo4jConnection.query(delete_query, {"django_id": django_id})
-        
-        # 2. 重新创建关系
-        create_query = """
-        MATCH (source:Entity {name: $source_name})
-        MATCH (target:Entity {name: $target_name})
-        MERGE (source)-[r:RELATION {django_id: $django_id}]->(target)
-        SET r.type = $type
-        """
-        
-        params = {
-            "source_name": source_name,
-            "target_name": target_name,
-            "type": rel_type,
-            "django_id": django_id
-        }
-        
-        Neo4jConnection.query(create_query, params)
-        print(f"Synced relationship to Neo4j: {source_name} - {rel_type} -> {target_name}")
-        
-    except Exception as e:
-        print(f"Error syncing Relationship to Neo4j: {e}")
+def _relation_row(django_id, source_name, target_name, rel_type):
+    return {
+        "django_id": django_id,
+        "source_name": source_name,
+        "target_name": target_name,
+        "type": rel_type,
+    }
 
 @receiver(post_save, sender=Relationship)
 def sync_relationship_to_neo4j(sender, instance, created, **kwargs):
     """
-    当 SQLite 中的 Relationship 保存时，同步更新 Neo4j
+    当 SQLite 中的 Relationship 保存时，写入 outbox
     """
-    django_id = instance.id
-    source_name = instance.source_entity.name
-    target_name = instance.target_entity.name
-    rel_type = instance.relationship_type
-    
-    transaction.on_commit(
-        lambda: _sync_relationship_logic(django_id, source_name, target_name, rel_type)
-    )
-
-def _delete_relationship_logic(django_id, source_name, target_name, rel_type):
-    try:
-        # 1. 优先尝试通过精准的 django_id 删除
-        query_id = "MATCH ()-[r:RELATION {django_id: $django_id}]->() DELETE r"
-        Neo4jConnection.query(query_id, {"django_id": django_id})
-        
-        # 2. 兜底方案：通过内容匹配删除 (如果老的id没同步过去，这个能救命)
-        if source_name and target_name:
-            query_content = """
-            MATCH (s:Entity {name: $source_name})-[r:RELATION]->(t:Entity {name: $target_name})
-            WHERE r.type = $type
-            DELETE r
-            """
-            Neo4jConnection.query(query_content, {
-                "source_name": source_name,
-                "target_name": target_name,
-                "type": rel_type
-            })
-            
-        print(f"Deleted Relationship from Neo4j: {source_name} - {rel_type} -> {target_name} (ID: {django_id})")
-    except Exception as e:
-        print(f"Error deleting Relationship from Neo4j: {e}")
+    _enqueue([('relation', 'create' if created else 'update', instance.id, _relation_row(
+        instance.id, instance.source_entity.name, instance.target_entity.name, instance.relationship_type
+    ))])
 
 @receiver(post_delete, sender=Relationship)
 def delete_relationship_from_neo4j(sender, instance, **kwargs):
     """
     删除关系
     """
-    d_id = instance.id
     try:
         s_name = instance.source_entity.name
         t_name = instance.target_entity.name
     except Exception:
         s_name = None
         t_name = None
-        
-    r_type = instance.relationship_type
 
-    transaction.on_commit(
-        lambda: _delete_relationship_logic(d_id, s_name, t_name, r_type)
-    )
+    _enqueue([('relation', 'delete', instance.id, _relation_row(instance.id, s_name, t_name, instance.relationship_type))])
+
+def sync_bulk_to_neo4j(created_entities, updated_entities, created_relationships, updated_relationships=()):
+    """
+    bulk_create / bulk_update 不会触发 post_save 信号，
+    批量写入后在同一事务内调用此函数，一次性写入 outbox，由同步线程在事务提交后同步
+    """
+    entries = []
+    for action, entities in (('create', created_entities), ('update', updated_entities)):
+        for ent in entities:
+            entries.append(('entity', action, ent.id, _entity_row(
+                ent.id, ent.name, ent.entity_type, ent.description, ent.photo_url
+            )))
+    for action, relationships in (('create', created_relationships), ('update', updated_relationships)):
+        for rel in relationships:
+            entries.append(('relation', action, rel.id, _relation_row(
+                rel.id, rel.source_entity.name, rel.target_entity.name, rel.relationship_type
+            )))
+    if entries:
+        _enqueue(entries)
@@ -1,3 +1,244 @@
-from django.test import TestCase
+from unittest import mock
+from django.test import TestCase, override_settings
+from neo4j.exceptions import ServiceUnavailable
+from . import outbox
+from .models import Entity, Relationship, SyncOutbox
+from .neo4j_db import Neo4jConnection
+from .outbox import (
+    ENTITY_CREATE, ENTITY_DELETE_BY_ID, ENTITY_DELETE_BY_NAME, ENTITY_UPDATE,
+    RELATION_DELETE_BY_ID, RELATION_MERGE, build_statements,
+)
+from .reconcile import (
+    ENTITY_CHUNKS, ENTITY_DIGEST, ENTITY_TYPE_ORDINALS, RELATION_CHUNKS, RELATION_DIGEST, RELATION_TYPE_ORDINALS,
+    sqlite_entity_digests, sqlite_relation_digests,
+)
 
-# Create your tests here.
+
+def _entity(action, django_id, name):
+    return ('entity', action, django_id, {
+        "django_id": django_id, "name": name, "type": 'person', "description": "", "photo_url": "",
+    })
+
+
+def _relation(action, django_id, source_name, target_name, rel_type='属于'):
+    return ('relation', action, django_id, {
+        "django_id": django_id, "source_name": source_name, "target_name": target_name, "type": rel_type,
+    })
+
+
+def _queries(statements):
+    return [query for query, _ in statements]
+
+
+class BuildStatementsTests(TestCase):
+    """outbox 条目合并为 UNWIND 语句"""
+
+    def test_collapses_changes_per_object(self):
+        statements = build_statements([
+            _entity('create', 1, '张三'),
+            _entity('update', 1, '张三丰'),
+            _entity('update', 2, '李四'),
+            _entity('delete', 2, '李四'),
+            _relation('create', 10, '张三丰', '计算机学院'),
+            _relation('update', 10, '张三丰', '软件学院'),
+        ], batch_size=100)
+        self.assertEqual(_queries(statements), [
+            ENTITY_DELETE_BY_ID, ENTITY_DELETE_BY_NAME, ENTITY_CREATE, RELATION_MERGE,
+        ])
+        # 新建后又更新的仍按新建处理，数据取最后一次
+        self.assertEqual([row['name'] for row in statements[2][1]['rows']], ['张三丰'])
+        self.assertEqual([row['target_name'] for row in statements[3][1]['rows']], ['软件学院'])
+
+    def test_relation_update_deletes_old_edge_first(self):
+        statements = build_statements([_relation('update', 10, '张三', '软件学院')], batch_size=100)
+        self.assertEqual(_queries(statements), [RELATION_DELETE_BY_ID, RELATION_MERGE])
+
+    def test_relation_is_merged_before_endpoint_rename(self):
+        # 关系按端点名称匹配：先建关系后改名时，关系必须在改名之前写入
+        statements = build_statements([
+            _entity('update', 1, '张三'),
+            _relation('create', 10, '张三', '计算机学院'),
+            _entity('update', 1, '张三丰'),
+            _relation('create', 11, '张三丰', '人工智能', '研究'),
+        ], batch_size=100)
+        self.assertEqual(_queries(statements), [ENTITY_UPDATE, RELATION_MERGE, ENTITY_UPDATE, RELATION_MERGE])
+        self.assertEqual(statements[1][1]['rows'][0]['source_name'], '张三')
+        self.assertEqual(statements[2][1]['rows'][0]['name'], '张三丰')
+        self.assertEqual(statements[3][1]['rows'][0]['source_name'], '张三丰')
+
+    def test_bulk_writes_stay_in_one_segment(self):
+        statements = build_statements([
+            _entity('create', 1, '张三'),
+            _entity('update', 2, '计算机学院'),
+            _relation('create', 10, '张三', '计算机学院'),
+            _relation('create', 11, '张三', '人工智能'),
+            # 关系之后的新建节点不会让已有关系找不到端点
+            _entity('create', 3, '人工智能'),
+        ], batch_size=100)
+        self.assertEqual(_queries(statements), [ENTITY_CREATE, ENTITY_UPDATE, RELATION_MERGE])
+        self.assertEqual(len(statements[0][1]['rows']), 2)
+
+
+@override_settings(NEO4J_SYNC_MAX_ATTEMPTS=2)
+class DrainBatchTests(TestCase):
+    """出错条目二分定位、失败计数与死信"""
+
+    def setUp(self):
+        for django_id, name in enumerate(['甲', '乙', '丙', '丁', '戊'], start=1):
+            kind, action, object_id, payload = _entity('update', django_id, name)
+            SyncOutbox.objects.create(kind=kind, action=action, object_id=object_id, payload=payload)
+        self.poison = SyncOutbox.objects.get(object_id=3)
+        self.applied = []
+
+    def _write_batch(self, statements):
+        names = [row['name'] for _, parameters in statements for row in parameters['rows']]
+        if '丙' in names:
+            raise ValueError("constraint violated")
+        self.applied.extend(names)
+        return True
+
+    def _drain(self):
+        with mock.patch.object(outbox.Neo4jConnection, 'write_batch', side_effect=self._write_batch):
+            return outbox.drain_batch(batch_size=10)
+
+    def test_failing_entry_is_isolated_and_dead_lettered(self):
+        # 第一次：出错条目之前的部分已应用，出错条目记一次失败，之后的条目等待下次
+        with self.assertRaises(ValueError):
+            self._drain()
+        self.assertEqual(self.applied, ['甲', '乙'])
+        self.poison.refresh_from_db()
+        self.assertEqual((self.poison.attempts, self.poison.dead), (1, False))
+        self.assertEqual(SyncOutbox.objects.count(), 3)
+
+        # 第二次达到上限：移入死信，之后的条目继续应用
+        self.assertEqual(self._drain(), 3)
+        self.assertEqual(self.applied, ['甲', '乙', '丁', '戊'])
+        self.assertEqual(list(SyncOutbox.objects.values_list('id', 'dead', 'attempts')), [(self.poison.id, True, 2)])
+        self.assertEqual(self._drain(), 0)
+        self.assertEqual(outbox.outbox_lag()['dead_letters'], 1)
+
+    def test_transient_errors_keep_the_batch(self):
+        with mock.patch.object(outbox.Neo4jConnection, 'write_batch', side_effect=ServiceUnavailable("down")):
+            with self.assertRaises(ServiceUnavailable):
+                outbox.drain_batch(batch_size=10)
+        self.assertEqual(SyncOutbox.objects.filter(attempts=0, dead=False, last_error='down').count(), 5)
+
+    def test_requeue_dead_appends_to_queue(self):
+        SyncOutbox.objects.filter(id=self.poison.id).update(dead=True, attempts=2)
+        self.assertEqual(outbox.requeue_dead([self.poison.id]), 1)
+        requeued = SyncOutbox.objects.order_by('-id').first()
+        self.assertEqual((requeued.object_id, requeued.dead, requeued.attempts), (3, False, 0))
+
+
+class StreamTests(TestCase):
+    """stream() 在开始迭代时才打开会话，迭代结束或生成器关闭时释放"""
+
+    def test_session_opened_lazily(self):
+        driver = mock.MagicMock()
+        session = driver.session.return_value
+        session.__enter__.return_value = session
+        session.run.return_value = iter([{'n': 1}, {'n': 2}])
+        with mock.patch.object(Neo4jConnection, 'get_driver', return_value=driver):
+            records = Neo4jConnection.stream("MATCH (n) RETURN n")
+            driver.session.assert_not_called()
+
+            self.assertEqual(next(records), {'n': 1})
+            session.__exit__.assert_not_called()
+            records.close()
+        session.__exit__.assert_called_once()
+
+    def test_unavailable_driver(self):
+        with mock.patch.object(Neo4jConnection, 'get_driver', return_value=None):
+            self.assertIsNone(Neo4jConnection.stream("MATCH (n) RETURN n"))
+
+
+class DigestParityTests(TestCase):
+    """
+    对账摘要：相同数据在 SQLite 与 Neo4j 两边算出的区块摘要一致，只改实体或关系的类型时摘要随之变化。
+    Neo4j 一侧把同一批数据按同步语句写入单独的标签，在事务中计算摘要后回滚，不影响图谱；Neo4j 不可用时跳过
+    """
+
+    CHUNK_SIZE = 2
+    LABEL = 'DigestParityTest'
+    REL_TYPE = 'DIGEST_PARITY_TEST'
+
+    def setUp(self):
+        names = [('张三', 'person'), ('计算机学院', 'organization'), ('人工智能', 'subject'), ('校庆', 'event')]
+        entities = [
+            Entity.objects.create(name=name, entity_type=entity_type, description=f"{name}简介")
+            for name, entity_type in names
+        ]
+        self.zhang, self.college, self.ai, _ = entities
+        self.belongs = Relationship.objects.create(
+            source_entity=self.zhang, target_entity=self.college, relationship_type='属于'
+        )
+        Relationship.objects.create(source_entity=self.zhang, target_entity=self.ai, relationship_type='研究')
+
+    def _sqlite(self):
+        return sqlite_entity_digests(self.CHUNK_SIZE), sqlite_relation_digests(self.CHUNK_SIZE)
+
+    def _entries(self):
+        """与同步信号相同形态的 outbox 条目，取自当前的 SQLite 数据"""
+        entries = [
+            ('entity', 'create', ent.id, {
+                "django_id": ent.id, "name": ent.name, "type": ent.entity_type,
+                "description": ent.description, "photo_url": ent.photo_url,
+            })
+            for ent in Entity.objects.order_by('id')
+        ]
+        entries += [
+            ('relation', 'create', rel.id, {
+                "django_id": rel.id, "source_name": rel.source_entity.name,
+                "target_name": rel.target_entity.name, "type": rel.relationship_type,
+            })
+            for rel in Relationship.objects.select_related('source_entity', 'target_entity').order_by('id')
+        ]
+        return entries
+
+    def _neo4j(self):
+        driver = Neo4jConnection.get_driver()
+        if driver is None:
+            self.skipTest("Neo4j 不可用")
+
+        def labelled(query):
+            return query.replace(':Entity', f':{self.LABEL}').replace(':RELATION', f':{self.REL_TYPE}')
+
+        def digests(tx, query, fields, ordinals):
+            records = tx.run(labelled(query), {"size": self.CHUNK_SIZE, "ordinals": ordinals})
+            return {record['chunk']: tuple(record[key] or 0 for key in fields) for record in records}
+
+        with driver.session() as session:
+            tx = session.begin_transaction()
+            try:
+                for query, parameters in build_statements(self._entries(), batch_size=100):
+                    tx.run(labelled(query), parameters).consume()
+                return (
+                    digests(tx, ENTITY_CHUNKS, ENTITY_DIGEST, ENTITY_TYPE_ORDINALS),
+                    digests(tx, RELATION_CHUNKS, RELATION_DIGEST, RELATION_TYPE_ORDINALS),
+                )
+            finally:
+                tx.rollback()
+
+    def test_type_change_changes_digest(self):
+        entities, relations = self._sqlite()
+
+        Relationship.objects.filter(id=self.belongs.id).update(relationship_type='研究')
+        changed_entities, changed_relations = self._sqlite()
+        # 同样长度的另一个类型：只有 type_sum 不同
+        self.assertEqual(changed_entities, entities)
+        self.assertNotEqual(changed_relations, relations)
+        chunk = self.belongs.id // self.CHUNK_SIZE
+        self.assertEqual(
+            [field for field, old, new in zip(RELATION_DIGEST, relations[chunk], changed_relations[chunk]) if old != new],
+            ['type_sum']
+        )
+
+        Entity.objects.filter(id=self.ai.id).update(entity_type='organization')
+        self.assertNotEqual(self._sqlite()[0], entities)
+
+    def test_sqlite_and_neo4j_digests_match(self):
+        self.assertEqual(self._neo4j(), self._sqlite())
+
+        Relationship.objects.filter(id=self.belongs.id).update(relationship_type='研究')
+        Entity.objects.filter(id=self.ai.id).update(entity_type='organization')
+        self.assertEqual(self._neo4j(), self._sqlite())
@@ -251,3 +251,11 @@ def knowledge_graph_search(request):
     except Exception as e:
         return Response({'error': str(e)}, status=500)
 
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def neo4j_sync_status(request):
+    """Neo4j 同步延迟：outbox 积压条数、最早未同步条目的等待秒数、失败次数与最近的错误"""
+    from .outbox import outbox_lag
+
+    return Response(outbox_lag())
@@ -0,0 +1,98 @@
+from collections import deque
+from functools import lru_cache
+from django.conf import settings
+
+# 三元组尾实体的类型推断
+# 关键词表在启动时编译为 Aho-Corasick 自动机，每个尾实体只需扫描一遍字符，且按字符串记忆化
+
+# 默认关键词表，顺序即优先级（同时命中多个类型时取靠前的）
+DEFAULT_TYPE_KEYWORDS = {
+    "organization": ['大学', '学院', '系', '所', '中心', '实验室', '委员会', '学会'],
+    "location": ['省', '市', '区', '路', '街', 'building', '室'],
+}
+
+# 关键词均未命中时按关系类型推断
+DEFAULT_RELATION_TYPES = {
+    "主讲": "subject",
+    "研究": "subject",
+}
+
+
+class EntityTypeClassifier:
+    """基于多模式匹配自动机的实体类型分类器"""
+
+    def __init__(self, type_keywords, relation_types=None, default_type='event', cache_size=100000):
+        self.types = list(type_keywords)
+        self.relation_types = dict(relation_types or {})
+        self.default_type = default_type
+        self._build(type_keywords)
+        self._match = lru_cache(maxsize=cache_size)(self._scan)
+
+    @classmethod
+    def from_settings(cls):
+        """从 Django settings 读取关键词表（ENTITY_TYPE_KEYWORDS / ENTITY_RELATION_TYPES），未配置时使用默认值"""
+        return cls(
+            getattr(settings, 'ENTITY_TYPE_KEYWORDS', DEFAULT_TYPE_KEYWORDS),
+            getattr(settings, 'ENTITY_RELATION_TYPES', DEFAULT_RELATION_TYPES),
+            getattr(settings, 'ENTITY_DEFAULT_TYPE', 'event'),
+        )
+
+    def classify(self, tail, relation=None):
+        """推断单个尾实体的类型"""
+        mask = self._match(tail.lower())
+        if mask:
+            # 取优先级最高（下标最小）的命中类型
+            return self.types[(mask & -mask).bit_length() - 1]
+        return self.relation_types.get(relation, self.default_type)
+
+    def classify_many(self, pairs):
+        """批量推断 [(tail, relation), ...]，返回与输入顺序一致的类型列表"""
+        return [self.classify(tail, relation) for tail, relation in pairs]
+
+    def _build(self, type_keywords):
+        """构建 Aho-Corasick 自动机：goto 表、失败指针，以及每个状态命中的类型位掩码"""
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [0]
+
+        for index, ent_type in enumerate(self.types):
+            for keyword in type_keywords[ent_type]:
+                state = 0
+                for ch in keyword.lower():
+                    nxt = self._goto[state].get(ch)
+                    if nxt is None:
+                        nxt = len(self._goto)
+                        self._goto[state][ch] = nxt
+                        self._goto.append({})
+                        self._fail.append(0)
+                        self._output.append(0)
+                    state = nxt
+                self._output[state] |= 1 << index
+
+        # 第一层状态的失败指针指向根，从第二层开始按 BFS 计算
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._output[nxt] |= self._output[self._fail[nxt]]
+
+    def _scan(self, text):
+        """扫描一遍文本，返回命中类型的位掩码"""
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        mask = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            mask |= output[state]
+        return mask
+
+
+# 全局分类器实例（启动时按 settings 编译一次）
+entity_classifier = EntityTypeClassifier.from_settings()
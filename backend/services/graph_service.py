@@ -15,7 +15,7 @@ class Neo4jGraphService:
         """
         
         try:
-            result = Neo4jConnection.query(query, {"teacher_name": teacher_name})
+            result = Neo4jConnection.read(lambda tx: list(tx.run(query, {"teacher_name": teacher_name})))
             
             if result is None:
                 return None
@@ -81,7 +81,7 @@ class Neo4jGraphService:
         """在图谱中搜索实体"""
         query = "MATCH (n:Entity) WHERE n.name CONTAINS $query RETURN n.name as name LIMIT $limit"
         try:
-            result = Neo4jConnection.query(query, {"query": query_text, "limit": limit})
+            result = Neo4jConnection.read(lambda tx: list(tx.run(query, {"query": query_text, "limit": limit})))
             
             if result is None:
                 return None
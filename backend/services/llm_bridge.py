@@ -2,11 +2,21 @@ import os
 import json
 import requests
 from django.conf import settings
+from services.metrics import incr, timed
+from services.resource_limits import llm_slot
 
 # 简单的 LLM 桥接服务，用于统一调用 Ollama 或 DeepSeek
 # 避免在不同地方写死不同的调用逻辑
 
 class LLMBridge:
+    # 提取 Prompt 的版本号，修改下方 Prompt 模板时需同步递增，使旧的提取缓存失效
+    PROMPT_VERSION = "v1"
+
+    @staticmethod
+    def model_name():
+        """当前用于实体提取的 Ollama 模型名"""
+        return getattr(settings, 'OLLAMA_MODEL', 'qwen2:7b')
+
     @staticmethod
     def extract_entities(text, teacher_name, entity_types):
         """
@@ -14,7 +24,8 @@ class LLMBridge:
         :param text: 待处理文本
         :param teacher_name: 导师姓名（作为上下文）
         :param entity_types: 需要提取的实体类型列表
-        :return: 字典格式的实体数据
+        :return: 字典格式的实体数据；Ollama 调用失败或返回内容无法解析时抛出 RuntimeError，
+                 由调用方记为失败行（不写入缓存，也不标记为已入库）
         """
         # 优先使用配置的 Ollama (本地且免费)，如果失败或者配置了 DeepSeek 且强制使用云端，可以切换
         # 目前保持原来的逻辑：提取使用 Ollama (Cheap & Fast for bulk)，问答使用 DeepSeek (Smart)
@@ -40,42 +51,104 @@ class LLMBridge:
 }}
 """
         
+        content = LLMBridge._generate(prompt, {"temperature": 0.1, "max_tokens": 1000})
+        if content is None:
+            raise RuntimeError("Ollama 调用失败")
+
+        entities = LLMBridge._parse_json(content)
+        if not isinstance(entities, dict) or not entities:
+            raise RuntimeError(f"无法解析 LLM 返回的 JSON: {content[:100]}")
+        return entities
+
+    @staticmethod
+    def extract_entities_batch(items, entity_types):
+        """
+        一次请求提取多位导师的实体
+        :param items: [(teacher_name, text), ...]，姓名不能重复
+        :param entity_types: 需要提取的实体类型列表
+        :return: {导师姓名: 实体字典}；调用失败或结果无法解析时返回 None，由调用方回退到逐条提取
+        """
+        sections = "\n".join(f"【导师：{name}】\n{text}\n" for name, text in items)
+        example_name = items[0][0]
+        prompt = f"""
+仅返回合法的 JSON 格式，不要包含任何 Markdown 标记或多余解释！
+任务：下面有 {len(items)} 位导师的介绍文本，请分别从每位导师自己的文本中提取以下类型的实体：{', '.join(entity_types)}。
+输出一个 JSON 对象，键为导师姓名（与【导师：xxx】中的姓名完全一致），值为该导师的实体对象。
+
+{sections}
+请输出类似如下的 JSON 格式：
+{{
+    "{example_name}": {{
+        "教师姓名": ["{example_name}"], 
+        "院系": ["xxx学院"], 
+        "职称": ["教授"], 
+        "研究方向": ["xxx"], 
+        "课程名称": [], 
+        "毕业院校": [], 
+        "荣誉称号": [], 
+        "工作职责": []
+    }}
+}}
+"""
+        content = LLMBridge._generate(prompt, {"temperature": 0.1, "max_tokens": 1000 * len(items)})
+        if content is None:
+            return None
+
+        result = LLMBridge._parse_json(content)
+        if not isinstance(result, dict) or not result:
+            return None
+        return {name: ents for name, ents in result.items() if isinstance(ents, dict)}
+
+    @staticmethod
+    def ollama_host():
+        """Ollama 服务地址"""
+        return getattr(settings, 'OLLAMA_HOST', 'http://localhost:11434')
+
+    @staticmethod
+    def request_timeout():
+        """单次 Ollama 请求的超时秒数"""
+        return getattr(settings, 'LLM_REQUEST_TIMEOUT', 300)
+
+    @staticmethod
+    def _generate(prompt, options):
+        """调用 Ollama 生成文本（受进程内 LLM 在途请求上限约束），失败时返回 None"""
+        with llm_slot():
+            return LLMBridge._generate_unbounded(prompt, options)
+
+    @staticmethod
+    @timed('llm_call')
+    def _generate_unbounded(prompt, options):
+        incr('llm_calls')
         try:
             # 尝试导入 ollama 库
             import ollama
-            model_name = getattr(settings, 'OLLAMA_MODEL', 'qwen2:7b')
             
-            response = ollama.generate(
-                model=model_name,
+            response = ollama.Client(host=LLMBridge.ollama_host(), timeout=LLMBridge.request_timeout()).generate(
+                model=LLMBridge.model_name(),
                 prompt=prompt,
-                options={"temperature": 0.1, "max_tokens": 1000}
+                options=options
             )
             
-            content = response.get("response", "").strip()
-            return LLMBridge._parse_json(content)
+            return response.get("response", "").strip()
             
         except ImportError:
             # 如果没有 ollama 库，尝试使用 requests 调用 Ollama API
             try:
-                model_name = getattr(settings, 'OLLAMA_MODEL', 'qwen2:7b')
-                resp = requests.post('http://localhost:11434/api/generate', json={
-                    "model": model_name,
+                resp = requests.post(f'{LLMBridge.ollama_host()}/api/generate', json={
+                    "model": LLMBridge.model_name(),
                     "prompt": prompt,
                     "stream": False,
-                    "options": {"temperature": 0.1}
-                }, timeout=60)
+                    "options": {"temperature": options.get("temperature", 0.1)}
+                }, timeout=LLMBridge.request_timeout())
                 if resp.status_code == 200:
-                    content = resp.json().get("response", "").strip()
-                    return LLMBridge._parse_json(content)
+                    return resp.json().get("response", "").strip()
             except Exception as e:
                 print(f"Ollama API call failed: {e}")
 
         except Exception as e:
             print(f"Ollama generation failed: {e}")
-            
-        # Fallback: 如果 Ollama 失败，或者你想用 DeepSeek 做提取（更贵但更准）
-        # 这里暂时只返回基础数据作为 fallback
-        return {"教师姓名": [teacher_name]}
+
+        return None
 
     @staticmethod
     def _parse_json(content):
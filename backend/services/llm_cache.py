@@ -0,0 +1,98 @@
+import hashlib
+import json
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+from documents.models import ExtractionCache
+from services.llm_bridge import LLMBridge
+
+# LLM 实体提取结果的持久化缓存
+# 同一份文本在 Prompt、模型、实体类型都不变时，重复处理直接复用已有结果
+
+
+class LLMCache:
+    # IN 查询分批大小（SQLite 单条语句参数个数有限）
+    BATCH_SIZE = 500
+
+    @staticmethod
+    def max_entries():
+        """缓存条数上限，超出后按最近使用时间淘汰 (LRU)"""
+        return getattr(settings, 'LLM_CACHE_MAX_ENTRIES', 50000)
+
+    # 缓存内容格式的版本：只保存 LLM 对所询问类型的原始结果（不含规则预提取的结果），变更后旧条目不再命中
+    FORMAT_VERSION = 2
+
+    @classmethod
+    def make_key(cls, text, teacher_name, entity_types):
+        """计算缓存键：格式版本 + Prompt 版本 + 模型名 + 文本 + 导师姓名 + 所询问的实体类型 的 sha256"""
+        key = [cls.FORMAT_VERSION, LLMBridge.PROMPT_VERSION, LLMBridge.model_name(), text, teacher_name, list(entity_types)]
+        payload = json.dumps(key, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def is_cacheable(entities):
+        """只缓存包含实际提取内容的结果；失败兜底（仅含教师姓名）或解析失败（空字典）不缓存"""
+        if not isinstance(entities, dict):
+            return False
+        return any(values for ent_type, values in entities.items() if ent_type != "教师姓名")
+
+    @classmethod
+    def get_many(cls, keys):
+        """批量查询缓存，返回 {key: result}，并刷新命中条目的最近使用时间"""
+        keys = list(set(keys))
+        found = {}
+        for i in range(0, len(keys), cls.BATCH_SIZE):
+            chunk = keys[i:i + cls.BATCH_SIZE]
+            rows = ExtractionCache.objects.filter(key__in=chunk).values_list('key', 'result')
+            found.update(rows)
+
+        hit_keys = list(found)
+        now = timezone.now()
+        for i in range(0, len(hit_keys), cls.BATCH_SIZE):
+            ExtractionCache.objects.filter(key__in=hit_keys[i:i + cls.BATCH_SIZE]).update(last_used_at=now)
+        return found
+
+    @classmethod
+    def put(cls, key, teacher_name, entities):
+        """写入一条缓存（不可缓存的结果直接忽略）"""
+        if not cls.is_cacheable(entities):
+            return
+        try:
+            ExtractionCache.objects.update_or_create(
+                key=key,
+                defaults={
+                    'model_name': LLMBridge.model_name(),
+                    'prompt_version': LLMBridge.PROMPT_VERSION,
+                    'teacher_name': teacher_name[:100],
+                    'result': entities,
+                    'last_used_at': timezone.now(),
+                }
+            )
+        except IntegrityError:
+            # 并发写入同一键时忽略即可
+            pass
+
+    @classmethod
+    def evict(cls):
+        """超过上限时删除最久未使用的条目，返回删除条数"""
+        limit = cls.max_entries()
+        if limit <= 0:
+            return cls.invalidate()
+        total = ExtractionCache.objects.count()
+        if total <= limit:
+            return 0
+        cutoff = (
+            ExtractionCache.objects.order_by('-last_used_at', '-id')
+            .values_list('last_used_at', flat=True)[limit - 1]
+        )
+        deleted, _ = ExtractionCache.objects.filter(last_used_at__lt=cutoff).delete()
+        return deleted
+
+    @staticmethod
+    def invalidate(model_name=None):
+        """按模型清除缓存；不传模型名时清空全部，返回删除条数"""
+        queryset = ExtractionCache.objects.all()
+        if model_name:
+            queryset = queryset.filter(model_name=model_name)
+        deleted, _ = queryset.delete()
+        return deleted
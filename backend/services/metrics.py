@@ -0,0 +1,109 @@
+import contextvars
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# 文档处理流水线的分阶段计时与计数
+# 当前文档的 PipelineMetrics 通过 contextvar 传递，LLMBridge、Neo4j 同步等模块无需显式传参即可记录；
+# 提交到线程池的任务需用 contextvars.copy_context().run 包装，才能在工作线程中记录到同一文档
+
+_current = contextvars.ContextVar('pipeline_metrics', default=None)
+
+
+def percentile(values, pct):
+    """最近秩法计算分位数（秒，保留三位小数）"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return round(ordered[index], 3)
+
+
+class PipelineMetrics:
+    """一次文档处理的各阶段耗时与计数（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = defaultdict(list)
+        self.counters = defaultdict(int)
+
+    @contextmanager
+    def activate(self):
+        """在当前上下文中启用本实例，期间 timed() / incr() 的记录都归入本实例"""
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.durations[stage].append(seconds)
+
+    def incr(self, name, count=1):
+        with self._lock:
+            self.counters[name] += count
+
+    def count(self, name):
+        with self._lock:
+            return self.counters.get(name, 0)
+
+    def total(self, stage):
+        with self._lock:
+            return sum(self.durations.get(stage, ()))
+
+    def db_query_wrapper(self, execute, sql, params, many, context):
+        """connection.execute_wrapper 钩子：统计本线程执行的 SQL 条数与耗时"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record('db_query', time.perf_counter() - started)
+            self.incr('db_queries')
+
+    def summary(self):
+        """各阶段 次数 / 总耗时 / p50 / p95 / 最大值，以及计数器"""
+        with self._lock:
+            durations = {stage: list(values) for stage, values in self.durations.items()}
+            counters = dict(self.counters)
+        return {
+            "stages": {
+                stage: {
+                    "count": len(values),
+                    "total_seconds": round(sum(values), 3),
+                    "p50": percentile(values, 50),
+                    "p95": percentile(values, 95),
+                    "max": round(max(values), 3),
+                }
+                for stage, values in durations.items() if values
+            },
+            "counters": counters,
+        }
+
+
+def current_metrics():
+    """当前上下文中正在记录的 PipelineMetrics，没有时返回 None"""
+    return _current.get()
+
+
+@contextmanager
+def timed(stage):
+    """记录代码块耗时到当前文档的指定阶段（也可用作函数装饰器），未启用时不做任何事"""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.record(stage, time.perf_counter() - started)
+
+
+def incr(name, count=1):
+    """累加当前文档的计数器，未启用时不做任何事"""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.incr(name, count)
@@ -0,0 +1,33 @@
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+from services.metrics import timed
+
+# 进程内共享的资源并发上限
+# 调度器在同一进程中并发处理多个文档时，所有文档共用这些槽位，
+# 保证对 LLM 服务的在途请求数、SQLite 写事务数不超过配置值
+
+_llm_slots = threading.BoundedSemaphore(max(1, getattr(settings, 'LLM_MAX_INFLIGHT', 4)))
+_db_writer_slots = threading.BoundedSemaphore(max(1, getattr(settings, 'SQLITE_MAX_WRITERS', 1)))
+
+
+@contextmanager
+def llm_slot():
+    """占用一个 LLM 在途请求槽位，等待时间计入 llm_slot_wait"""
+    with timed('llm_slot_wait'):
+        _llm_slots.acquire()
+    try:
+        yield
+    finally:
+        _llm_slots.release()
+
+
+@contextmanager
+def db_writer_slot():
+    """占用一个 SQLite 写入槽位，等待时间计入 db_writer_wait"""
+    with timed('db_writer_wait'):
+        _db_writer_slots.acquire()
+    try:
+        yield
+    finally:
+        _db_writer_slots.release()
@@ -0,0 +1,163 @@
+import re
+from django.conf import settings
+
+# 结构化字段的规则预提取
+# 职称、院系、毕业院校等字段格式固定，用编译好的正则和已有机构实体的名称词典即可高精度提取；
+# 规则提取到的类型不再交给 LLM，非结构化类型仍由 LLM 提取；
+# 开启 LLM_RULE_SKIP_UNCUED 时，文本里完全没有线索词的非结构化类型也直接判为空，全部确定时整行跳过 LLM。
+
+# 职称词表，按长度从长到短匹配，避免“副教授”被拆成“教授”
+DEFAULT_TITLES = [
+    '特聘教授', '助理教授', '副教授', '教授', '特聘研究员', '特聘副研究员', '副研究员', '助理研究员', '研究员',
+    '高级工程师', '高级实验师', '工程师', '实验师', '讲师', '助教', '博士生导师', '硕士生导师',
+]
+
+# 机构词典只收录以这些后缀结尾的院系名，过滤掉“未提供”等无效值
+DEPARTMENT_SUFFIXES = ('学院', '系', '研究所', '研究院', '实验室', '教学部')
+
+# 非结构化类型的线索词（开启 LLM_RULE_SKIP_UNCUED 时使用）：文本中一个都没有时，认为该类型为空，无需询问 LLM
+DEFAULT_TYPE_CUES = {
+    "研究方向": ['研究', '方向', '领域', '从事'],
+    "课程名称": ['主讲', '讲授', '课程', '授课', '开设', '教授课'],
+    "荣誉称号": ['获', '荣誉', '称号', '奖', '入选', '人才', '学者', '优秀'],
+    "工作职责": ['负责', '担任', '兼任', '主任', '院长', '书记', '主席', '委员', '主持'],
+}
+
+# 院系：从句读处开始的“xx学院/研究所/系”（排除“系统”“系列”等），再去掉“现任”“在”等引导词和所属大学
+DEPARTMENT = re.compile(r'(?:^|(?<=[，,。；;、：:\s]))([一-龥]{2,20}?(?:学院|研究所|系(?![统列数])))')
+DEPARTMENT_LEAD = re.compile(r'^.*(?:任职于|就职于|工作于|现任|担任|大学|任|在|于|为)')
+# 毕业院校：“毕业于/就读于 xx大学”，或“获/取得 xx大学 … 学位”
+GRADUATE = re.compile(r'(?:毕业于|就读于)([一-龥]{2,20}?(?:大学|学院))')
+DEGREE = re.compile(r'(?:获得?|取得)([一-龥]{2,20}?(?:大学|学院))[一-龥]{0,8}?学位')
+# 职称所在的分句（以句读、冒号、换行分隔）
+CLAUSE_BREAK = re.compile(r'[，,。；;！？!?：:\n]')
+# 分句中职称之前允许出现的内容：任职引导词、日期、机构名；出现其他内容（如“师从张三”“与李四”）时职称不属于本人
+TITLE_LEAD = r'(?:现|曾|并|兼|后|同时|已)?(?:担任|任职|受聘为|被聘为|聘为|晋升为|晋升|评为|职称为|职称|任|为|系|是)'
+TITLE_DATE = r'\d+\s*(?:年|月)'
+TITLE_ORG = r'[一-龥]{1,20}?(?:大学|学院|系|研究所|研究院|实验室|中心|教学部)'
+# 超过该长度的前缀不再匹配（正则回溯），职称留给 LLM
+TITLE_PREFIX_MAX = 40
+
+
+class RuleExtractor:
+    """
+    确定性的字段预提取器：
+    - 职称：词表匹配，且只取本人所在分句中的职称（“师从张三教授”中的“教授”不是本人的职称）
+    - 毕业院校：“毕业于 xx大学”“获 xx大学博士学位”等句式
+    - 院系：机构词典（已入库的院系名）中不在毕业语境里的命中，以及句读之后的“xx学院/系/研究所”
+    只有命中的类型才视为已确定，未命中的类型仍交给 LLM；
+    给定 type_cues 时，没有线索词的非结构化类型也视为已确定（为空）
+    """
+
+    STRUCTURED_TYPES = ("职称", "院系", "毕业院校")
+
+    def __init__(self, organizations=(), titles=None, type_cues=None):
+        titles = sorted(titles or DEFAULT_TITLES, key=len, reverse=True)
+        # “教授《数据结构》”“教授课程”中的“教授”是动词
+        titles_alt = '|'.join(map(re.escape, titles))
+        self.title_pattern = re.compile(f"(?:{titles_alt})(?![课《])")
+        self.title_prefix = re.compile(f"(?:{TITLE_LEAD}|{TITLE_DATE}|{TITLE_ORG}|{titles_alt}|[、和及兼\\s])*")
+        self.type_cues = dict(type_cues or {})
+        # 机构词典：首字 -> 该首字下的名称长度（从长到短），扫描时按最长匹配
+        self.organizations = {name for name in organizations if len(name) >= 2}
+        self._lengths = {}
+        for name in self.organizations:
+            self._lengths.setdefault(name[0], set()).add(len(name))
+        self._lengths = {ch: sorted(lengths, reverse=True) for ch, lengths in self._lengths.items()}
+
+    @classmethod
+    def from_db(cls):
+        """
+        以已入库的“属于”关系的尾实体（即历次提取出的院系）作为机构词典，词表可通过 settings 覆盖。
+        organization 类型中混有课程、奖项等被误分类的名称，不直接使用。
+        线索词判空只在 LLM_RULE_SKIP_UNCUED 开启时使用
+        """
+        from knowledge_graph.models import Relationship
+
+        names = Relationship.objects.filter(relationship_type='属于').values_list('target_entity__name', flat=True).distinct()
+        type_cues = None
+        if getattr(settings, 'LLM_RULE_SKIP_UNCUED', False):
+            type_cues = getattr(settings, 'RULE_EXTRACT_TYPE_CUES', None) or DEFAULT_TYPE_CUES
+        return cls(
+            [name for name in names if name.endswith(DEPARTMENT_SUFFIXES)],
+            getattr(settings, 'RULE_EXTRACT_TITLES', None),
+            type_cues,
+        )
+
+    def extract(self, text, teacher_name, entity_types):
+        """
+        返回 (已确定的实体字典, 仍需 LLM 提取的类型列表)
+        已确定的字典中，结构化类型只包含命中的值；开启线索词判空时，无线索的非结构化类型为空列表
+        """
+        found = {}
+        graduate_spans = []
+        for pattern in (GRADUATE, DEGREE):
+            for match in pattern.finditer(text):
+                graduate_spans.append(match.span(1))
+                _append(found, "毕业院校", match.group(1))
+
+        for match in self.title_pattern.finditer(text):
+            if self._own_title(text, match.start(), teacher_name):
+                _append(found, "职称", match.group())
+
+        # 词典命中优先，正则候选中包含词典名称的不再重复记录
+        departments = []
+        for start, name in self._scan_organizations(text):
+            # 大学名出现在非毕业语境中（如“xx大学计算机学院”）不作为院系
+            if not name.endswith('大学') and not _inside((start, start + len(name)), graduate_spans):
+                departments.append(name)
+        for match in DEPARTMENT.finditer(text):
+            if _inside(match.span(1), graduate_spans):
+                continue
+            name = DEPARTMENT_LEAD.sub('', match.group(1))
+            if len(name) > 2 and not any(known in name for known in departments):
+                departments.append(name)
+        for name in departments:
+            _append(found, "院系", name)
+
+        resolved = {"教师姓名": [teacher_name]} if "教师姓名" in entity_types else {}
+        remaining = []
+        for ent_type in entity_types:
+            if ent_type in resolved:
+                continue
+            if ent_type in self.STRUCTURED_TYPES and found.get(ent_type):
+                resolved[ent_type] = found[ent_type]
+            elif ent_type in self.type_cues and not any(cue in text for cue in self.type_cues[ent_type]):
+                resolved[ent_type] = []
+            else:
+                remaining.append(ent_type)
+        return resolved, remaining
+
+    def _own_title(self, text, start, teacher_name):
+        """
+        start 处的职称是否属于导师本人：职称之前、同一分句内（去掉开头的导师姓名后）只有任职引导词、日期、机构名和其他职称，
+        如“张三现任计算机学院教授”“教授、博士生导师”；“师从李四教授”“与王五教授合作”等不计入
+        """
+        breaks = [match.end() for match in CLAUSE_BREAK.finditer(text, 0, start)]
+        prefix = text[breaks[-1] if breaks else 0:start].strip()
+        if prefix.startswith(teacher_name):
+            prefix = prefix[len(teacher_name):]
+        return len(prefix) <= TITLE_PREFIX_MAX and self.title_prefix.fullmatch(prefix) is not None
+
+    def _scan_organizations(self, text):
+        """按最长匹配扫描机构词典，产出 (起始位置, 名称)，命中后从名称之后继续扫描"""
+        i = 0
+        while i < len(text):
+            for length in self._lengths.get(text[i], ()):
+                name = text[i:i + length]
+                if name in self.organizations:
+                    yield i, name
+                    i += length
+                    break
+            else:
+                i += 1
+
+
+def _append(found, ent_type, value):
+    values = found.setdefault(ent_type, [])
+    if value not in values:
+        values.append(value)
+
+
+def _inside(span, spans):
+    return any(start <= span[0] and span[1] <= end for start, end in spans)